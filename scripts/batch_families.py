@@ -0,0 +1,288 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Consensus residue contact networks of many Pfam-domains (families) in one
+run, from one directory of raw PDB-files (e.g. a local PDB mirror). Running
+the pipeline once per family reads the SIFTS-file again for every family and
+parses structures with several domains once per family. Here, the work is
+grouped by structure file instead:
+1) The SIFTS-file is read once. For every family, the chain of every
+structure is selected as by 'process_pdb.py' (first chain with the
+Pfam-domain).
+2) Every raw PDB-file with a chain of any family is parsed once. The contacts
+of all its selected chains are calculated with one neighbour search (the
+chains together, see contact_engine.py); the contacts of each chain are those
+between two of its residues, which are the same as in the processed PDB-file
+of the chain. The contacts and residues of each chain are passed on to every
+family of the chain.
+3) The raw networks and the mapping of every family are written to its output
+directory while the structures are processed. At the end, the consensus
+networks of the families are calculated in parallel (one family per worker
+process).
+
+INPUT:
+1) Directory with raw PDB-files (as for 'process_pdb.py')
+2) SIFTS-file 'pdb_chain_pfam.csv'
+3) Families (csv- or tab-separated file with a header line): columns
+'pfam_id', 'reference_alignment' (path of the fasta-file) and
+'reference_structure' (PDB-ID), one line per family. The reference alignments
+are as for 'map_networks.py' (sequence names: '<PDB-ID>.pdb').
+
+OUTPUT (one directory per family: '<output directory>/<Pfam-ID>'):
+raw_networks, mapping, mapped_networks, consensus_network (one per cutoff with
+several cutoffs) and selected_chains_info.csv, as written by the single-family
+pipeline (see the scripts of each step). The tables are csv- or feather-files
+(option '--format').
+
+NOTE:
+The processed PDB-files of the chains are not written. The raw networks of
+all families are written at the same time: one file per family is open
+during the run (the number of families is limited by the maximal number of
+open files, see 'ulimit -n'). Structures which cannot be processed are
+skipped with the option '--keep-going' (listed in FAILED_LOG, see
+workers.py); files which 'check_data.py' found invalid are not read. A chain
+which is missing in its structure file (e.g. an outdated SIFTS-file) is
+listed there as well ('<PDB-ID>/<Pfam-ID>/<chain>'): only this family skips
+the structure, the other chains of the file are still used.
+------------------------------------------------------------------------------
+'''
+
+import argparse
+import os
+import sys
+import numpy as np
+import pandas as pd
+import consensus
+import contact_engine
+import input_checks
+import mapping
+import metrics
+import network_io
+import sifts_index
+import structure_io
+import workers
+
+FAMILY_COLUMNS = ['pfam_id', 'reference_alignment', 'reference_structure']
+
+# arguments, largest cutoff, families of the chains of every PDB-ID and
+# invalid files (used by the worker processes)
+args = None
+max_cutoff = None
+assignments = {}  # PDB-ID -> list of (Pfam-ID, chain)
+invalid = {}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_pdb_dir', help='Directory with raw PDB-files '
+                        '(structures of all families)')
+    parser.add_argument('sifts_chain_pfam', help='SIFTS-file '
+                        '"pdb_chain_pfam.csv" for finding the chains with '
+                        'the Pfam-domains')
+    parser.add_argument('families', help='Table of the families: pfam_id, '
+                        'reference_alignment, reference_structure (see '
+                        'docstring)')
+    parser.add_argument('--output-dir', default='results/families',
+                        help='One output directory per family is created '
+                        'here. Default: results/families')
+    parser.add_argument('--cutoff', nargs='+', type=float, default=[5],
+                        help='Distance cutoff(s) in Angstrom (with several '
+                        'cutoffs: one consensus network per cutoff, see '
+                        'calculate_networks.py). Default: 5')
+    parser.add_argument('--backend', choices=sorted(contact_engine.BACKENDS),
+                        default='grid', help='Neighbour search (see '
+                        'calculate_networks.py). Default: grid')
+    parser.add_argument('--format', choices=['csv', 'feather'],
+                        default='csv', help='File format of the output '
+                        'tables: csv or feather (binary, requires pyarrow). '
+                        'Default: csv')
+    structure_io.add_parser_arguments(parser)
+    workers.add_jobs_arguments(parser)
+    workers.add_keep_going_argument(parser)
+    metrics.add_metrics_arguments(parser)
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+
+
+def read_families(path):
+    '''IN: path of the table of the families (see docstring)
+    OUT: dataframe (one line per family, in order of the table)'''
+    families = pd.read_csv(path, sep=None, engine='python', dtype=str)
+    missing = [column for column in FAMILY_COLUMNS
+               if column not in families.columns]
+    if missing:
+        sys.exit('%s: missing column(s) %s' % (path, ', '.join(missing)))
+    duplicated = families.pfam_id[families.pfam_id.duplicated()]
+    if len(duplicated):
+        sys.exit('%s: families given more than once: %s'
+                 % (path, ' '.join(duplicated.unique())))
+    return families[FAMILY_COLUMNS].reset_index(drop=True)
+
+
+def family_chains(pfam_ids, sifts):
+    '''IN: Pfam-IDs, SIFTS-index
+    OUT: dictionary: PDB-ID -> list of (Pfam-ID, chain): the chain of every
+    family in the structure (as selected by 'process_pdb.py')'''
+    chains = {}
+    for pfam_id in pfam_ids:
+        for pdb_id in sifts.pdb_ids(pfam_id):
+            chains.setdefault(pdb_id, []).append(
+                (pfam_id, sifts.chains(pdb_id, pfam_id)[0]))
+    return chains
+
+
+def chain_contacts(structure, chain, res_a, res_b, min_dist):
+    '''IN: Structure of several chains, chain ID, contacts of the structure
+    (see contact_engine.structure_contacts)
+    OUT: PDB-residue numbers and residue names of the chain, contacts between
+    two residues of the chain (residue indices of the chain); None if the
+    chain is not in the structure'''
+    in_chain = structure.res_chain == chain
+    if not in_chain.any():
+        return None
+    index = np.cumsum(in_chain) - 1  # residue index within the chain
+    keep = in_chain[res_a] & in_chain[res_b]
+    return (structure.res_number[in_chain], structure.res_name[in_chain],
+            index[res_a[keep]].astype('i4'), index[res_b[keep]].astype('i4'),
+            min_dist[keep])
+
+
+def file_families(filename):
+    '''IN: raw pdb-filename
+    OUT: PDB-ID, dictionary: chain -> residues and contacts of the chain (see
+    chain_contacts, None for chains which are not in the file), for all
+    chains of any family (ValueError if none of them is in the file)
+    Note: executed in the worker processes'''
+    pdb_id = filename.split('.')[0]
+    if filename in invalid:  # found by check_data.py, not read again
+        raise ValueError('%s: %s' % (filename, invalid[filename]))
+    chains = sorted(set([chain for _, chain in assignments[pdb_id]]))
+    structure = structure_io.load_structure(
+        os.path.join(args.raw_pdb_dir, filename), args.parser,
+        name=filename).select_chains(chains)
+    metrics.record(atoms=len(structure), residues=structure.n_residues,
+                   chains=len(chains), families=len(assignments[pdb_id]))
+    contacts = contact_engine.structure_contacts(structure, max_cutoff,
+                                                 args.backend)
+    results = dict([(chain, chain_contacts(structure, chain, *contacts))
+                    for chain in chains])
+    if all([result is None for result in results.values()]):
+        raise ValueError('Chain(s) %s not found in %s'
+                         % (', '.join(chains), filename))
+    return pdb_id, results
+
+
+def family_dir(pfam_id):
+    return os.path.join(args.output_dir, pfam_id)
+
+
+def family_consensus(pfam_id):
+    '''IN: Pfam-ID
+    OUT: Pfam-ID, number of structures and of consensus contacts
+    Writes the mapped networks and consensus networks of the family (from
+    its raw networks and mapping). Note: executed in the worker processes'''
+    directory = family_dir(pfam_id)
+    nw = network_io.read_table(network_io.table_path(
+        directory, 'raw_networks', args.format))
+    residues = network_io.read_table(network_io.table_path(
+        directory, 'mapping', args.format))
+    nw = consensus.map_networks(nw, residues)
+    consensus.write_mapped_networks(nw, directory, args.format)
+    cutoffs = args.cutoff if len(args.cutoff) > 1 else None
+    networks = consensus.consensus_networks(
+        nw, consensus.reference_positions(residues), cutoffs)
+    consensus.write_consensus(networks, consensus.consensus_names(cutoffs),
+                              directory, args.format)
+    structures = nw.pdb_id[~consensus.unmapped_contacts(nw)].unique()
+    return pfam_id, len(structures), len(networks[0])
+
+
+def main(argv=None):
+    global args, max_cutoff, assignments, invalid
+    args = parse_arguments(argv)
+    max_cutoff = max(args.cutoff)  # contacts of smaller cutoffs are a subset
+    run = metrics.StageMetrics.from_args('batch_families', args)
+    families = read_families(args.families)
+    with run.section('load_sifts'):
+        sifts = sifts_index.load_index(args.sifts_chain_pfam)
+        assignments = family_chains(families.pfam_id, sifts)
+    with run.section('read_alignments'):
+        alignments = dict([(pfam_id, mapping.read_alignment(path)) for
+                           pfam_id, path in zip(families.pfam_id,
+                                                families.reference_alignment)])
+    invalid = input_checks.known_problems(args.raw_pdb_dir)
+
+    # files in order of their PDB-IDs (raw networks sorted, as
+    # calculate_networks.py); only files with a chain of any family
+    filenames = sorted([filename for filename in
+                        os.listdir(args.raw_pdb_dir)
+                        if filename.split('.')[0] in assignments],
+                       key=lambda filename: (filename.split('.')[0],
+                                             filename))
+    writers, residues, selected = {}, {}, {}
+    for pfam_id in families.pfam_id:
+        if not os.path.exists(family_dir(pfam_id)):
+            os.makedirs(family_dir(pfam_id))
+        writers[pfam_id] = network_io.NetworkWriter(
+            network_io.table_path(family_dir(pfam_id), 'raw_networks',
+                                  args.format), len(args.cutoff) > 1)
+        residues[pfam_id], selected[pfam_id] = [], []
+    try:
+        for result in run.map(workers.guard(file_families, args.keep_going),
+                              filenames, args.jobs, args.chunksize):
+            if workers.failed(result, 'batch_families'):
+                continue
+            pdb_id, chains = result
+            found = []
+            for pfam_id, chain in assignments[pdb_id]:
+                if chains[chain] is None:  # only this family skips the file
+                    workers.failed(workers.Failure(
+                        '%s/%s/%s' % (pdb_id, pfam_id, chain),
+                        'Chain %s not found' % chain), 'batch_families')
+                    continue
+                found.append((pfam_id, chain))
+                res_number, res_name, res_a, res_b, min_dist = chains[chain]
+                writers[pfam_id].write(pdb_id, res_a + 1, res_b + 1,
+                                       min_dist)
+                selected[pfam_id].append((pdb_id, chain))
+                sequence = alignments[pfam_id].get('%s.pdb' % pdb_id)
+                if sequence is not None:
+                    residues[pfam_id].append((pdb_id, mapping.table_positions(
+                        res_number, res_name, sequence)))
+            print('%s: %s' % (pdb_id, ' '.join(['%s/%s' % (pfam_id, chain)
+                                                 for pfam_id, chain in
+                                                 found])))
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    with run.section('write_mappings'):
+        for pfam_id, reference_structure in zip(
+                families.pfam_id, families.reference_structure):
+            network_io.write_table(
+                mapping.mapping_table(residues[pfam_id], reference_structure),
+                network_io.table_path(family_dir(pfam_id), 'mapping',
+                                      args.format))
+            chains = pd.DataFrame(selected[pfam_id],
+                                  columns=['pdb_id', 'chain'])
+            chains.to_csv(os.path.join(family_dir(pfam_id),
+                                       'selected_chains_info.csv'),
+                          index=False)
+
+    print('\nPfam-ID\tstructures\tconsensus contacts')
+    with run.section('consensus'):
+        for result in workers.parallel_map(
+                workers.guard(family_consensus, args.keep_going),
+                list(families.pfam_id), args.jobs):
+            if workers.failed(result, 'batch_families'):
+                continue
+            print('%s\t%s\t%s' % result)
+    run.add(families=len(families), structures=len(filenames))
+    run.close()
+
+
+if __name__ == '__main__':
+    main()
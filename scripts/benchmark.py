@@ -0,0 +1,368 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Benchmark of the stages of the analysis (process_pdb, calculate_networks,
+map_networks, consensus network). Every stage is run as separate process (as
+in 'runall.sh') on
+1) the test data ('test_data/raw_pdb_files') and
+2) synthetic datasets of every combination of the given numbers of
+   structures and residues per structure (see 'synthetic_structures.py').
+The results show how the runtime of each stage scales with the number and the
+size of the structures, and allow to compare versions of the software.
+
+USAGE:
+python scripts/benchmark.py --structures 10 100 --residues 150 300 \
+    --output benchmark.json
+python scripts/benchmark.py --baseline benchmark.json \
+    --output benchmark_new.json  # compare
+
+OUTPUT:
+Table of all runs and scaling exponents (printed) and json-file with:
+'runs': for every dataset and stage: runtime ('seconds', best of --repeat
+        runs), 'structures_per_s', peak memory of the process
+        ('peak_rss_mb') and, for calculate_networks, 'atom_pairs_per_s'
+        (all pairs of atoms within each structure per second: a measure of
+        the size of the structures independent of the neighbour search)
+'scaling': for every stage, the exponent of the runtime in the number of
+        structures (at a fixed number of residues) and in the number of
+        residues (at a fixed number of structures), fitted on a log-log
+        scale: 1 means linear scaling
+'info': python version, platform, git commit, date and arguments
+
+NOTE1:
+With the option '--baseline', runtimes which are more than --tolerance
+(default: 25%) slower than in the baseline file (same dataset and stage)
+are reported as regressions, and the script exits with status 1. The
+baseline is read before the benchmark runs; it cannot be the output file.
+Differences below --min-seconds are ignored (timing noise of short runs).
+
+NOTE2:
+The test data contains no SIFTS-file. Unless one is provided with the
+option '--sifts', it is created from 'test_results/selected_chains_info.csv'.
+The contact cache is not used (all contacts are calculated).
+------------------------------------------------------------------------------
+'''
+
+from __future__ import print_function
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import synthetic_structures
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+TEST_DATA = {'pdb_dir': os.path.join(REPO_DIR, 'test_data', 'raw_pdb_files'),
+             'alignment': os.path.join(REPO_DIR, 'test_data',
+                                       'ras_reference_alignment.fa'),
+             'chains': os.path.join(REPO_DIR, 'test_results',
+                                    'selected_chains_info.csv'),
+             'pfam_id': 'PF00071', 'reference': '1g16'}
+STAGES = ['process_pdb', 'calculate_networks', 'map_networks', 'consensus']
+
+# arguments (used by the functions below)
+args = None
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--structures', nargs='+', type=int,
+                        default=[10, 40], help='Numbers of structures of the '
+                        'synthetic datasets. Default: 10 40')
+    parser.add_argument('--residues', nargs='+', type=int, default=[150, 300],
+                        help='Numbers of residues per structure of the '
+                        'synthetic datasets. Default: 150 300')
+    parser.add_argument('--no-test-data', action='store_true', help='Only '
+                        'run the synthetic datasets')
+    parser.add_argument('--sifts', default=None, help='SIFTS-file for the '
+                        'test data (default: created from the test results)')
+    parser.add_argument('--cutoff', type=float, default=5, help='Distance '
+                        'cutoff of calculate_networks. Default: 5')
+    parser.add_argument('--repeat', type=int, default=1, help='Run every '
+                        'stage this many times and report the fastest run. '
+                        'Default: 1')
+    parser.add_argument('--jobs', type=int, default=1, help='Worker '
+                        'processes of the per-structure stages. Default: 1')
+    parser.add_argument('--python', default=sys.executable, help='Python '
+                        'interpreter for the stages. Default: %s'
+                        % sys.executable)
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the '
+                        'synthetic datasets. Default: 0')
+    parser.add_argument('--workdir', default=None, help='Directory for the '
+                        'datasets and results (kept). Default: temporary '
+                        'directory (removed)')
+    parser.add_argument('--output', default='benchmark.json', help='json-file '
+                        'for the results. Default: benchmark.json')
+    parser.add_argument('--baseline', default=None, help='json-file of an '
+                        'earlier benchmark to compare with (not the same '
+                        'file as --output)')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Relative slowdown reported as regression. '
+                        'Default: 0.25')
+    parser.add_argument('--min-seconds', type=float, default=0.5,
+                        help='Smaller slowdowns (in seconds) are ignored. '
+                        'Default: 0.5')
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+
+
+def run_stage(command, workdir, log_path):
+    '''runs a command (list) in the working directory
+    OUT: runtime (seconds), peak memory (megabytes)'''
+    with open(log_path, 'a') as log:
+        start = time.time()
+        process = subprocess.Popen(command, cwd=workdir, stdout=log,
+                                   stderr=subprocess.STDOUT)
+        # wait4: resource usage of this process only (with its workers)
+        pid, status, usage = os.wait4(process.pid, 0)
+        seconds = time.time() - start
+    returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
+    if returncode != 0:
+        raise RuntimeError('%s failed (exit status %s), see %s'
+                           % (os.path.basename(command[1]), returncode,
+                              log_path))
+    return seconds, usage.ru_maxrss / 1024.0  # Linux: kilobytes
+
+
+def stage_commands(dataset):
+    '''IN: dataset (dictionary: pdb_dir, sifts, alignment, pfam_id,
+    reference)
+    OUT: list of (stage, command)'''
+    def script(name):
+        return [args.python, os.path.join(SCRIPT_DIR, name)]
+    jobs = ['--jobs', str(args.jobs)]
+    return [
+        ('process_pdb', script('process_pdb.py') + [
+            dataset['pdb_dir'], dataset['pfam_id'], dataset['sifts'],
+            'results/processed_pdb_files'] + jobs),
+        ('calculate_networks', script('calculate_networks.py') + [
+            'results/processed_pdb_files', str(args.cutoff), '--no-cache'] +
+         jobs),
+        ('map_networks', script('map_networks.py') + [
+            'results/processed_pdb_files', dataset['alignment'],
+            dataset['reference']] + jobs),
+        ('consensus', script('calculate_consensus_network.py') + [
+            'results/raw_networks.csv', 'results/mapping.csv',
+            dataset['alignment']])]
+
+
+def count_atoms(pdb_dir):
+    '''OUT: number of structures, residues, atoms and atom pairs (within
+    each structure) in the processed PDB-files'''
+    n_structures = n_residues = n_atoms = n_pairs = 0
+    for filename in os.listdir(pdb_dir):
+        atoms = 0
+        residues = set()
+        with open(os.path.join(pdb_dir, filename)) as infile:
+            for line in infile:
+                if line.startswith('ATOM  '):
+                    atoms += 1
+                    residues.add(line[22:27])
+        n_structures += 1
+        n_residues += len(residues)
+        n_atoms += atoms
+        n_pairs += atoms * (atoms - 1) // 2
+    return n_structures, n_residues, n_atoms, n_pairs
+
+
+def benchmark_dataset(name, dataset, workdir):
+    '''runs all stages on a dataset (args.repeat times)
+    OUT: list of runs (dictionaries, see docstring)'''
+    best = {}
+    for repeat in range(args.repeat):
+        results_dir = os.path.join(workdir, 'results')
+        if os.path.exists(results_dir):
+            shutil.rmtree(results_dir)
+        os.makedirs(results_dir)
+        for stage, command in stage_commands(dataset):
+            seconds, rss = run_stage(command, workdir, os.path.join(
+                workdir, '%s.log' % stage))
+            if stage not in best or seconds < best[stage][0]:
+                best[stage] = seconds, rss
+    n_raw = len(os.listdir(dataset['pdb_dir']))
+    n_structures, n_residues, n_atoms, n_pairs = count_atoms(
+        os.path.join(workdir, 'results', 'processed_pdb_files'))
+    runs = []
+    for stage in STAGES:
+        seconds, rss = best[stage]
+        structures = n_raw if stage == 'process_pdb' else n_structures
+        run = {'dataset': name, 'stage': stage,
+               'structures': structures, 'residues': n_residues,
+               'residues_per_structure': dataset['residues_per_structure'],
+               'atoms': n_atoms, 'seconds': round(seconds, 4),
+               'structures_per_s': round(structures / seconds, 2),
+               'peak_rss_mb': round(rss, 1)}
+        if stage == 'calculate_networks':
+            run['atom_pairs_per_s'] = round(n_pairs / seconds)
+        runs.append(run)
+        print('%-28s %-19s %6d %9.2f s %9.1f structures/s %8.1f MB'
+              % (name, stage, structures, seconds, run['structures_per_s'],
+                 rss))
+    return runs
+
+
+def test_dataset(workdir):
+    '''OUT: test data as dataset (SIFTS-file written to the workdir if not
+    given)'''
+    dataset = dict(TEST_DATA)
+    dataset['residues_per_structure'] = None
+    if args.sifts:
+        dataset['sifts'] = os.path.abspath(args.sifts)
+        return dataset
+    dataset['sifts'] = os.path.join(workdir, 'pdb_chain_pfam.csv')
+    with open(TEST_DATA['chains']) as chains, \
+            open(dataset['sifts'], 'w') as sifts:
+        sifts.write('PDB,CHAIN,SP_PRIMARY,PFAM_ID,COVERAGE\n')
+        for line in list(chains)[1:]:
+            pdb_id, chain = line.strip().split(',')
+            sifts.write('%s,%s,,%s,1.0\n' % (pdb_id, chain,
+                                              TEST_DATA['pfam_id']))
+    return dataset
+
+
+def synthetic_dataset(workdir, n_structures, n_residues):
+    '''OUT: synthetic dataset (written to the workdir)'''
+    pdb_ids = synthetic_structures.write_dataset(workdir, n_structures,
+                                                 n_residues, args.seed)
+    return {'pdb_dir': os.path.join(workdir, 'raw_pdb_files'),
+            'sifts': os.path.join(workdir, 'pdb_chain_pfam.csv'),
+            'alignment': os.path.join(workdir, 'alignment.fa'),
+            'pfam_id': synthetic_structures.PFAM_ID,
+            'reference': pdb_ids[0], 'residues_per_structure': n_residues}
+
+
+def scaling_exponent(runs, variable, fixed):
+    '''IN: runs of one stage, varied and fixed parameter
+    OUT: dictionary: value of the fixed parameter -> exponent of the runtime
+    in the varied parameter (log-log fit)'''
+    groups = {}
+    for run in runs:
+        groups.setdefault(run[fixed], []).append((run[variable],
+                                                  run['seconds']))
+    exponents = {}
+    for value, points in sorted(groups.items()):
+        sizes, seconds = np.array(sorted(points), dtype=float).T
+        if len(set(sizes)) > 1 and (seconds > 0).all():
+            exponents[str(value)] = round(float(np.polyfit(
+                np.log(sizes), np.log(seconds), 1)[0]), 2)
+    return exponents
+
+
+def scaling(runs):
+    '''OUT: scaling exponents of every stage (see docstring)'''
+    result = {}
+    for stage in STAGES:
+        stage_runs = [run for run in runs if run['stage'] == stage and
+                      run['dataset'].startswith('synthetic')]
+        result[stage] = {
+            'structures': scaling_exponent(stage_runs, 'structures',
+                                           'residues_per_structure'),
+            'residues': scaling_exponent(stage_runs, 'residues_per_structure',
+                                         'structures')}
+    return result
+
+
+def read_baseline(baseline_path):
+    '''IN: json-file of an earlier benchmark
+    OUT: dictionary: (dataset, stage) -> runtime (seconds)'''
+    with open(baseline_path) as infile:
+        return dict([((run['dataset'], run['stage']), run['seconds'])
+                     for run in json.load(infile)['runs']])
+
+
+def compare(runs, baseline):
+    '''IN: runs, runtimes of an earlier benchmark (see read_baseline)
+    OUT: list of regressions (text)'''
+    regressions = []
+    for run in runs:
+        before = baseline.get((run['dataset'], run['stage']))
+        if before is None:
+            continue
+        change = run['seconds'] / before - 1 if before > 0 else 0
+        print('%-28s %-19s %9.2f s -> %9.2f s (%+.0f%%)'
+              % (run['dataset'], run['stage'], before, run['seconds'],
+                 100 * change))
+        if change > args.tolerance and \
+                run['seconds'] - before > args.min_seconds:
+            regressions.append('%s %s: %.2f s -> %.2f s (%+.0f%%)'
+                               % (run['dataset'], run['stage'], before,
+                                  run['seconds'], 100 * change))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=REPO_DIR).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    global args
+    args = parse_arguments(argv)
+    baseline = None
+    if args.baseline:
+        if os.path.realpath(args.baseline) == os.path.realpath(args.output):
+            sys.exit('The baseline %s would be overwritten by the results: '
+                     'use a different --output.' % args.baseline)
+        baseline = read_baseline(args.baseline)  # (before any output)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='benchmark_')
+    runs = []
+    try:
+        if not args.no_test_data:
+            directory = os.path.join(workdir, 'test_data')
+            os.makedirs(directory)
+            runs += benchmark_dataset('test_data', test_dataset(directory),
+                                      directory)
+        for n_structures in args.structures:
+            for n_residues in args.residues:
+                name = 'synthetic_%sx%s' % (n_structures, n_residues)
+                directory = os.path.join(workdir, name)
+                os.makedirs(directory)
+                runs += benchmark_dataset(name, synthetic_dataset(
+                    directory, n_structures, n_residues), directory)
+    except RuntimeError as error:  # the logs are kept in the workdir
+        sys.exit('%s\nDirectory of the benchmark: %s' % (error, workdir))
+    if args.workdir is None:
+        shutil.rmtree(workdir)
+
+    report = {'info': {'python': platform.python_version(),
+                       'stage_python': args.python,
+                       'platform': platform.platform(),
+                       'commit': git_commit(),
+                       'date': datetime.datetime.now().isoformat(),
+                       'arguments': sys.argv[1:] if argv is None else argv},
+              'runs': runs,
+              'scaling': scaling(runs)}
+    print('\nScaling exponents (runtime ~ size^exponent):')
+    for stage in STAGES:
+        print('%-19s structures: %s  residues: %s'
+              % (stage, report['scaling'][stage]['structures'],
+                 report['scaling'][stage]['residues']))
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=1, sort_keys=True)
+    print('Results written to %s' % args.output)
+
+    if baseline is not None:
+        print('\nComparison with %s:' % args.baseline)
+        regressions = compare(runs, baseline)
+        if regressions:
+            print('\nREGRESSIONS (more than %.0f%% slower):\n%s'
+                  % (100 * args.tolerance, '\n'.join(regressions)))
+            sys.exit(1)
+        print('No regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Individual residue contact networks are combined into a consensus residue
+contact network via a common residue numbering system defined by a reference
+alignment. In short, for every contact present in any structure, the script
+determines how many other structures have an equivalent contact.
+
+INPUT:
+1) 'raw' residue contact networks: For every contact, the PDB-ID, the number
+of the first residue and the number of the second residue (written by
+'calculate_networks.py').
+2) mapping: For every residue, the PDB-number as well as the position in the
+reference alignment and the equivalent residue in the reference structure
+(written by 'map_networks.py').
+3) reference alignment (fasta file): See README-file.
+The two tables can be csv- or feather-files (see 'network_io.py').
+
+OUTPUT:
+1) mapped networks ('results/mapped_networks'): Contains the same information
+as the raw networks with additional information for each contact: alignment
+positions, equivalent residues in the reference structure, amino acid, etc.
+All this information is provided for both residues forming the contact
+(termed A and B).
+2) MAIN RESULT: consensus network ('results/consensus_network'): The file
+provides two alignment positions if at least one structure has a contact
+between the two residues. The number of structures which have an equivalent
+residue contact is given in the column 'contact_num'. The column
+'conservation' divides the previous column by the total number of structures
+in the dataset. Thus, 'conservation' shows the fraction of structures that
+have a contact between two given residues. The value is very small the
+contact is only present in a single structure. A contact present in all
+structures of the dataset has the value 1. The last two column gives the
+PDB-number of the equivalent residues in the reference PDB-structure. (For
+instance, this information can be used to visualize the highly conserved
+residue contacts ('conservation' 1 or close to 1) on the reference
+structure.)
+MULTIPLE CUTOFFS: If the raw networks contain the minimal atomic distance of
+every contact (column 'min_dist', see 'calculate_networks.py'), several
+distance cutoffs can be given with the option '--cutoffs' (e.g. 5 4 6). A
+consensus network is written for each cutoff ('consensus_network_<cutoff>'),
+the main consensus network ('consensus_network') is the one of the first
+cutoff. In all of them, 'conservation' is relative to the total number of
+structures in the dataset.
+
+NOTE1:
+The networks are mapped to the alignment positions with two joins of the
+whole tables (one for each residue of a contact). The contacts of all
+structures are then counted in a sparse matrix (alignment position of
+residue A x alignment position of residue B): each contact adds one to its
+cell, and the non-empty cells are the consensus network (see 'consensus.py').
+With the option '--state', the contacts and counts are also stored in a file,
+from which 'update_consensus.py' updates the consensus network when
+structures are added or removed.
+
+NOTE2:
+The csv-files are written as by the former R-script of this step: missing
+values as 'NA', numbers with up to 15 significant digits. The mapped networks
+are sorted by PDB-ID and residue B, the consensus network by alignment
+position B and A.
+------------------------------------------------------------------------------
+'''
+
+import argparse
+import sys
+import consensus
+import mapping as residue_mapping
+import metrics
+import network_io
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_networks', help='Residue contact networks of all '
+                        'structures (csv- or feather-file written by '
+                        'calculate_networks.py)')
+    parser.add_argument('mapping', help='Mapping of residues to alignment '
+                        'positions (csv- or feather-file written by '
+                        'map_networks.py)')
+    parser.add_argument('reference_alignment', help='Alignment of the '
+                        'sequences of the structures (fasta-file)')
+    parser.add_argument('--format', choices=['csv', 'feather'],
+                        default='csv', help='File format of the output files '
+                        'in the directory "results": csv or feather (binary, '
+                        'requires pyarrow). Default: csv')
+    parser.add_argument('--cutoffs', nargs='+', type=float, default=None,
+                        help='Distance cutoffs (in Angstrom) for which a '
+                        'consensus network is written. Requires the column '
+                        '"min_dist" in the raw networks. Default: all '
+                        'contacts')
+    parser.add_argument('--state', default=None, help='Also write the '
+                        'consensus state to this file (npz). Structures can '
+                        'then be added or removed with update_consensus.py '
+                        'without calculating the consensus network again.')
+    parser.add_argument('--metrics', default=None, help='Append wall time, '
+                        'CPU time and peak memory of this stage to this file '
+                        '(json-lines, see metrics.py). Default: no metrics')
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    run = metrics.StageMetrics('consensus', args.metrics)
+    with run.section('read'):
+        nw = network_io.read_table(args.raw_networks)
+        mapping = network_io.read_table(args.mapping)
+        alignment_ids = set(residue_mapping.read_alignment(
+            args.reference_alignment))
+    if args.cutoffs and 'min_dist' not in nw.columns:
+        sys.exit('Distance cutoffs given, but the raw networks have no '
+                 'column "min_dist".')
+
+    with run.section('map'):
+        nw = consensus.map_networks(nw, mapping)
+    unmapped = consensus.unmapped_contacts(nw)
+    if unmapped.any():
+        print('Note: Some contacts are not mapped to an alignment position '
+              'in these networks:\n%s\nUnmapped contacts will simply be '
+              'excluded form consensus network calculation.\nThey should not '
+              'cause a problem if the remaining dataset is large enough.'
+              % ' '.join(nw.pdb_id[unmapped].unique()))
+    with run.section('write_mapped_networks'):
+        consensus.write_mapped_networks(nw, 'results', args.format)
+
+    structures = nw.pdb_id[~unmapped].unique()
+    not_in_alignment = [pdb_id for pdb_id in structures
+                        if '%s.pdb' % pdb_id not in alignment_ids]
+    if not_in_alignment:
+        print('\nNOTE: The following structures have no corresponding '
+              'sequences in the reference alignment:\n%s\nTherefore, they '
+              'are excluded from further analysis. Unless you require those '
+              'structures in the dataset, this is not a problem. If you want '
+              'those structures inculded in the further analysis, please add '
+              'their sequences to the reference alignment and restart the '
+              'analysis.' % ' '.join(not_in_alignment))
+
+    ref_lookup = consensus.reference_positions(mapping)
+    with run.section('count'):
+        networks = consensus.consensus_networks(nw, ref_lookup, args.cutoffs)
+    with run.section('write_consensus'):
+        consensus.write_consensus(networks,
+                                  consensus.consensus_names(args.cutoffs),
+                                  'results', args.format)
+
+    if args.state:
+        state = consensus.ConsensusState(args.cutoffs)
+        state.add_networks(nw)
+        state.set_reference(ref_lookup)
+        state.save(args.state)
+        print('Consensus state (%s structures) written to %s'
+              % (len(state), args.state))
+    run.add(structures=len(structures), contacts=int((~unmapped).sum()),
+            consensus_contacts=len(networks[0]))
+    run.close()
+
+
+if __name__ == '__main__':
+    main()
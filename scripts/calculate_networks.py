@@ -7,119 +7,218 @@ Calculation of residue contact networks of all structures in the input-
 directory.
 
 OUTPUT:
-csv-file of residue contact networks of all input structures.
+csv-file (or feather-file, see 'network_io.py') of residue contact networks of
+all input structures.
 Each contact is given in the form 'PDB-ID,residue-A,residue-B'. For instance,
 '1g16,1,42' means, that in structure 1g16, residue 1 contacts residue 42.
 The residues numbers refers to the numbering in the PDB-file.
+Optionally (option '--min-dist' or several cutoffs), the minimal atomic
+distance of the two residues is given as fourth column ('min_dist').
 
 NOTE:
 A contact is defined if any two atoms of two residues are within a certain
 distance of each other. This value can be set as an optional argument. By
 default, the distance cutoff is 5 Angstrom (note that no hydrogen atoms are
 present in the input PDB-files).
+MULTIPLE CUTOFFS: If several cutoffs are provided (e.g. 4 4.5 5 5.5 6), the
+distances are calculated only once. The output contains all contacts within
+the largest cutoff together with their minimal atomic distance. The contacts
+for a smaller cutoff are those with 'min_dist' below the cutoff (this is done
+by the consensus calculation).
+The contacts are calculated with the vectorized contact engine in
+'contact_engine.py'. The neighbour search used to find atoms within the cutoff
+can be chosen with the option '--backend' (brute, grid or kdtree); all of
+them give the same result.
+The contacts of every structure are stored in a cache (by default in the
+directory '.contact_cache'). If the script is run again, only the contacts of
+new or modified structures are calculated (see 'contact_cache.py').
+With the option '--metrics', the runtime, the numbers of atoms, candidate
+residue pairs and contacts and the cache hits of every structure are written
+to a json-lines file (see 'metrics.py').
+MODELS: Only the first model of files with several models is used, unless
+the option '--trajectory' is given.
+TRAJECTORIES: With the option '--trajectory', every file is treated as an
+ensemble of models (NMR ensemble or molecular dynamics trajectory, e.g.
+processed with 'process_pdb.py --all-models'). The contacts are calculated in
+every model (see 'trajectory.py') and the raw network of the structure
+contains the contacts present in at least the fraction '--min-occupancy' of
+the models; thus, the consensus network counts every ensemble as one
+structure. The number of models with each contact (any contact in at least
+one model) is written to 'results/contact_occupancy' (PDB-ID, res_A, res_B,
+frames, occupancy), one structure at a time as the raw networks. Only one
+cutoff can be used in this mode, and the contact cache is not used.
 ------------------------------------------------------------------------------
 '''
 
+from __future__ import print_function
 import argparse
 import sys
 import os
-import numpy as np
-import pandas as pd
-import networkx as nx
-from Bio import PDB
-
-#import time
-#start =  time.time()
-
-parser = argparse.ArgumentParser()
-parser.add_argument('processed_pdb_dir', help='Directory with processed '
-                    'PDB-structures for calculation of residue contact '
-                    'networks')
-parser.add_argument('cutoff', nargs='?',type=int, default=5,
-                    help='Any two residues which have at least one pair of '
-                    'atoms within this distance are considered to make a '
-                    'contact. If no argument is provided, the default value '
-                    'of 5 Angstrom is used.')
-try:
-    args = parser.parse_args()
-except:
-    parser.print_help()
-    sys.exit(1)
-print 'atomic distance cutoff: %s Angstrom' % args.cutoff
-
-
-def min_atomic_distance(resA, resB):
-    '''IN: two residues (Bio.PDB objects)
-    OUT: shortest distance between any two atoms'''
-    atoms1 = list(resA.get_iterator())
-    atoms2 = list(resB.get_iterator())
-    atomic_dist_matrix = np.zeros((len(atoms1), len(atoms2)), dtype=('f4'))
-    for i in range(0, len(atoms1)):
-        for j in range(0, len(atoms2)):
-            atomic_dist_matrix[i,j] = atoms1[i] - atoms2[j]
-    return atomic_dist_matrix.min()  # minimal atomic distance
-
-
-def residue_distance_matrix(directory, filename):
-    '''IN: input directory and pdb-filename
-    OUT: 2D numpy array of inter-residue distances (NA = large distance)'''        
-    struct = PDB.PDBParser().get_structure(filename, os.path.join(directory,
-        filename))
-    res_list = list(struct.get_residues())
-    dist_matrix = np.zeros((len(res_list), len(res_list)), dtype=('f4'))
-    dist_matrix[:] = np.nan
-    for i in range(0, len(res_list)):
-        for j in range(i, len(res_list)):  # start at i: only half matrix
-            try:
-                CA_dist = res_list[i]['CA'] - res_list[j]['CA']
-                if CA_dist <= 15:
-                    atomic_distance = min_atomic_distance(res_list[i],
-                                                          res_list[j])
-                    dist_matrix[i,j] = atomic_distance
-                # if the CA-CA distance is above 15A, don't calculate the
-                # any to any atom distances: reduces runtime to 1/3
-            except:  # if residue does not have CA-atom coordinates
-                pass
-    return(dist_matrix)
-
-
-def matrix_to_dataframe(matrix, pdb_id):
-    '''IN: all against all residue matrix ('1' means contact)
-    OUT: dataframe with one contact per line (residue A, residue B)'''
-    nw = nx.from_numpy_matrix(contact_matrix)
-    # network has sequential residue numbering starting at 0 (no pdb-numbers)
-    df = pd.DataFrame(nw.edges())  # only edges with weight '1' are taken
-    df['pdb_id'] = pdb_id
-    df.columns = ['res_A', 'res_B', 'pdb_id']
-    df.res_A += 1  # residue numbering should start at 1
-    df.res_B += 1
-    return(df)
-
-
-filecounter = 0
-for filename in os.listdir(args.processed_pdb_dir):
-#    if not filename.endswith('.pdb'):
-#        continue  # ignore non-PDB files
+import contact_cache
+import contact_engine
+import metrics
+import network_io
+import structure_io
+import trajectory
+import workers
+
+OCCUPANCY_VALUES = ['frames', 'occupancy']  # (after PDB-ID, res_A, res_B)
+
+# arguments, largest cutoff and contact cache (used by the worker processes)
+args = None
+max_cutoff = None
+cache = None
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('processed_pdb_dir', help='Directory with processed '
+                        'PDB-structures for calculation of residue contact '
+                        'networks')
+    parser.add_argument('cutoff', nargs='*', type=float, default=[5],
+                        help='Any two residues which have at least one pair '
+                        'of atoms within this distance are considered to '
+                        'make a contact. If no argument is provided, the '
+                        'default value of 5 Angstrom is used. Several '
+                        'cutoffs can be provided (see docstring).')
+    parser.add_argument('--min-dist', action='store_true', help='Write the '
+                        'minimal atomic distance of every contact (column '
+                        '"min_dist"). Always done if several cutoffs are '
+                        'given.')
+    parser.add_argument('--backend', choices=sorted(contact_engine.BACKENDS),
+                        default='grid', help='Neighbour search for finding '
+                        'atoms within the cutoff: brute force (numpy), grid '
+                        '(cell list) or kdtree (requires scipy). All give the '
+                        'same result. Default: grid')
+    parser.add_argument('--format', choices=['csv', 'feather'],
+                        default='csv', help='File format of the output '
+                        '"results/raw_networks": csv or feather (binary, '
+                        'requires pyarrow). Default: csv')
+    parser.add_argument('--trajectory', action='store_true', help='Every '
+                        'file is an ensemble of models (NMR ensemble or MD '
+                        'trajectory): count the contacts in all models (see '
+                        'docstring)')
+    parser.add_argument('--min-occupancy', type=float, default=0.5,
+                        help='With --trajectory: minimal fraction of the '
+                        'models with a contact for the contact to be in the '
+                        'raw network. Default: 0.5')
+    parser.add_argument('--skin', type=float, default=trajectory.DEFAULT_SKIN,
+                        help='With --trajectory: skin of the neighbour list '
+                        'in Angstrom (see trajectory.py). Default: %s'
+                        % trajectory.DEFAULT_SKIN)
+    contact_cache.add_cache_arguments(parser)
+    structure_io.add_parser_arguments(parser)
+    workers.add_jobs_arguments(parser)
+    workers.add_keep_going_argument(parser)
+    metrics.add_metrics_arguments(parser)
+    try:
+        args = parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+    if args.trajectory and len(args.cutoff) > 1:
+        parser.error('only one cutoff can be used with --trajectory')
+    return args
+
+
+def file_contacts(filename):
+    '''IN: pdb-filename (in the input directory)
+    OUT: PDB-ID, residue indices A and B and minimal atomic distance of all
+    contacts (see contact_engine), True if the contacts were taken from the
+    cache
+    Note: executed in the worker processes'''
     pdb_id = filename.split('.')[0]
-    distance_matrix = residue_distance_matrix(args.processed_pdb_dir, filename)
-    contact_matrix = ((distance_matrix < args.cutoff) & \
-        (distance_matrix > 0).astype(int))
-    nw = matrix_to_dataframe(contact_matrix, pdb_id)
-    filecounter += 1
-    if filecounter == 1:
-        networks = nw  # initizalize big dataframe to store all networks
+    path = os.path.join(args.processed_pdb_dir, filename)
+    if cache is not None:
+        key = cache.key(path, max_cutoff)
+        contacts = cache.get(key)
+        if contacts is not None:
+            metrics.record(cache_hits=1, contacts=len(contacts[0]))
+            return (pdb_id,) + contacts + (True,)
+    structure = structure_io.load_structure(path, args.parser).select_model(0)
+    metrics.record(atoms=len(structure), residues=structure.n_residues)
+    res_a, res_b, min_dist = contact_engine.structure_contacts(
+        structure, max_cutoff, args.backend)
+    res_a, res_b = res_a.astype('i4'), res_b.astype('i4')
+    if cache is not None:
+        cache.put(key, res_a, res_b, min_dist)
+    return pdb_id, res_a, res_b, min_dist, False
+
+
+def file_occupancy(filename):
+    '''IN: pdb-filename (in the input directory)
+    OUT: PDB-ID, residue indices A and B and minimal atomic distance of all
+    contacts in any model, number of models with each contact, number of
+    models (see trajectory.trajectory_contacts)
+    Note: executed in the worker processes'''
+    res_a, res_b, frames, min_dist, n_frames = \
+        trajectory.trajectory_contacts(
+            os.path.join(args.processed_pdb_dir, filename), max_cutoff,
+            args.backend, args.skin)
+    return (filename.split('.')[0], res_a.astype('i4'), res_b.astype('i4'),
+            min_dist, frames, n_frames)
+
+
+def main(argv=None):
+    global args, max_cutoff, cache
+    args = parse_arguments(argv)
+    print('atomic distance cutoff: %s Angstrom' % ', '.join(
+        ['%g' % cutoff for cutoff in sorted(args.cutoff)]))
+    max_cutoff = max(args.cutoff)  # contacts of smaller cutoffs are a subset
+    write_min_dist = args.min_dist or len(args.cutoff) > 1
+    run = metrics.StageMetrics.from_args('calculate_networks', args)
+    if args.no_cache or args.trajectory:
+        cache = None
     else:
-        networks = pd.concat([networks, nw])
-    print('(%s/%s) %s' % (filecounter, len(os.listdir(args.processed_pdb_dir)),
-            pdb_id))
-
-
-# WRITE ALL NETWORKS TO FILE
-networks = networks[['pdb_id', 'res_A', 'res_B']]
-networks = networks.sort_index(by=['pdb_id', 'res_A', 'res_B'])
-networks.to_csv('results/raw_networks.csv', index=False)
-
-print "Number of residue contact networks calcuated: %s" % filecounter
-#end =  time.time()
-#print "Runtime: %s minutes" % round(((end - start) / float(60)), 1)
-
+        cache = contact_cache.ContactCache(args.cache_dir, args.cache_size)
+
+    # Files are processed in order of their PDB-IDs: the contacts of each
+    # structure are sorted, therefore the output file is sorted as well
+    filenames = sorted(os.listdir(args.processed_pdb_dir),
+                       key=lambda filename: (filename.split('.')[0],
+                                             filename))
+    filecounter = 0
+    cache_hits = 0
+    outfile = network_io.table_path('results', 'raw_networks', args.format)
+    calculate = file_occupancy if args.trajectory else file_contacts
+    # trajectories: contacts of all models (PDB-ID, res_A, res_B, number of
+    # models with the contact, occupancy), written as the raw networks
+    occupancy = network_io.NetworkWriter(
+        network_io.table_path('results', 'contact_occupancy', args.format),
+        values=OCCUPANCY_VALUES) if args.trajectory else None
+    try:
+        with network_io.NetworkWriter(outfile, write_min_dist) as networks:
+            for result in run.map(workers.guard(calculate, args.keep_going),
+                                  filenames, args.jobs, args.chunksize):
+                if workers.failed(result, 'calculate_networks'):
+                    continue
+                if args.trajectory:
+                    pdb_id, res_a, res_b, min_dist, frames, n_frames = result
+                    occupancy.write(pdb_id, res_a + 1, res_b + 1,
+                                    frames=frames,
+                                    occupancy=frames / float(n_frames))
+                    keep = frames >= args.min_occupancy * n_frames
+                    res_a, res_b, min_dist = res_a[keep], res_b[keep], \
+                        min_dist[keep]
+                    cached = False
+                else:
+                    pdb_id, res_a, res_b, min_dist, cached = result
+                # residue numbering should start at 1
+                networks.write(pdb_id, res_a + 1, res_b + 1, min_dist)
+                filecounter += 1
+                cache_hits += cached
+                print('(%s/%s) %s' % (filecounter, len(filenames), pdb_id))
+    finally:
+        if occupancy is not None:
+            occupancy.close()
+
+    print("Number of residue contact networks calcuated: %s" % filecounter)
+    if cache is not None:
+        print('Contact cache (%s): %s hits, %s misses, %s entries removed'
+              % (args.cache_dir, cache_hits, filecounter - cache_hits,
+                 cache.evict()))
+    run.close()
+
+
+if __name__ == '__main__':
+    main()
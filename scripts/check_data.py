@@ -11,8 +11,21 @@ a) PDB-files
 b) reference alignment (in fasta format)
 c) csv-file from the SIFTS-database (which contains a list of PDB-IDs, chains
 and the respective Pfam domain)
-If a problem with the input data is encountered, the an error message is given
-and the script and exits.
+All problems with the input data are collected and reported together in a
+summary at the end; if there is an error, the script exits with an error
+status (missing sequences in the alignment are only a warning).
+
+NOTE1:
+By default, the PDB-files are only scanned (fast): all atom records must have
+valid coordinates and residue numbers, and there must be at least one chain.
+With the option '--full', every file is read completely (see
+'structure_io.py'); mmCIF-files (ending with '.cif' or '.mmcif', optionally
+'.gz') are always read completely. The files are checked in parallel
+(option '--jobs').
+NOTE2:
+The result of every check is stored in 'results/checked_pdb_files.tsv' (see
+'input_checks.py'). Unchanged files are not checked again, and
+'process_pdb.py' skips files which are known to be invalid.
 ------------------------------------------------------------------------------
 '''
 
@@ -20,101 +33,238 @@ and the script and exits.
 # otherwise exit script:
 print('Checking software requirements:')
 try:
-    import os, sys, argparse, numpy, pandas, networkx
-    from Bio import SeqIO, PDB
+    import os, sys, argparse, numpy, scipy, pandas
+    from Bio import SeqIO
     print('All required python modules are installed.')
 except ImportError:
     print('One of the python modules required for this software is missing.')
     print('Please installe the missing module:')
-    import os, sys, argparse, numpy, pandas, networkx
-    from Bio import SeqIO, PDB
-
-
-parser = argparse.ArgumentParser()
-parser.add_argument('raw_pdb_dir', help='Directory with PDB-structures '
-                    'for calculation of residue contact network')
-parser.add_argument('reference_alignment', help='Alignment of the sequences '
-                    'of the structures for which residue contact networks '
-                    'were created. See the documentation for information '
-                    'about the requirements of such an alignment')
-parser.add_argument('sifts_chain_pfam', help='SIFTS-file "pdb_chain_pfam.csv" for '
-                    'finding chains withing the PDB-structures which contain '
-                    'the Pfam-domain of interest')
-try:
-    args = parser.parse_args()
-except:
-    parser.print_help()
-    sys.exit(1)
+    import os, sys, argparse, numpy, scipy, pandas
+    from Bio import SeqIO
+import input_checks
+import metrics
+import sifts_index
+import structure_io
+import workers
+
+
+# arguments, metrics and results of earlier checks (used by the checks)
+args = None
+run = None
+checked = {}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_pdb_dir', help='Directory with PDB-structures '
+                        'for calculation of residue contact network')
+    parser.add_argument('reference_alignment', help='Alignment of the '
+                        'sequences of the structures for which residue '
+                        'contact networks were created. See the '
+                        'documentation for information about the '
+                        'requirements of such an alignment')
+    parser.add_argument('sifts_chain_pfam', help='SIFTS-file '
+                        '"pdb_chain_pfam.csv" for finding chains withing the '
+                        'PDB-structures which contain the Pfam-domain of '
+                        'interest')
+    parser.add_argument('--full', action='store_true', help='Read every '
+                        'PDB-file completely instead of scanning its atom '
+                        'records (slow)')
+    structure_io.add_parser_arguments(parser)
+    workers.add_jobs_arguments(parser)
+    parser.add_argument('--keep-going', action='store_true', help='Only warn '
+                        'about invalid PDB-files (they are skipped by the '
+                        'analysis) instead of exiting')
+    metrics.add_metrics_arguments(parser)
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+
+
+def check_mode():
+    '''OUT: check of the PDB-files (see input_checks.py)'''
+    return 'full' if args.full else 'scan'
+
+
+def check_pdb_file(filename):
+    '''IN: pdb-filename (in the PDB-file directory)
+    OUT: filename, problem with the file ('' if the file is valid), True if
+    the result was taken from the log of earlier checks
+    Note: executed in the worker processes'''
+    if not structure_io.is_structure_file(filename):
+        return filename, 'unexpected filename (structure files must end ' \
+            'with ".pdb", ".cif" or ".mmcif", optionally ".gz")', False
+    path = os.path.join(args.raw_pdb_dir, filename)
+    known = input_checks.known_result(checked, path, check_mode())
+    if known is not None:
+        metrics.record(cache_hits=1)
+        return filename, known, True
+    try:
+        if args.full or structure_io.is_mmcif(path):  # (no fast scan)
+            structure = structure_io.load_structure(path, args.parser)
+            metrics.record(atoms=len(structure),
+                           residues=structure.n_residues)
+            n_chains = len(structure.chains())
+        else:
+            n_atoms, chains = structure_io.scan_pdb(path)
+            metrics.record(atoms=n_atoms)
+            n_chains = len(chains)
+    except (ValueError, IOError) as error:  # e.g. invalid coordinates
+        return filename, 'not a valid PDB-file (%s)' % ' '.join(
+            str(error).split()), False
+    if n_chains < 1:
+        return filename, 'not a valid PDB-file (no atom records)', False
+    return filename, '', False
 
 
 def check_pdb_files(pdb_file_dir):
-    '''Try to parse all PDB-files in a directory with Bio.PDB;
-    Exit script if parsing of fails.'''
+    '''Checks all PDB-files in a directory (in parallel, see docstring)
+    OUT: list of (filename, problem) of all invalid files'''
     print('\nChecking PDB-files in directory "%s":' % pdb_file_dir)
-    filecount = 0
-    for filename in os.listdir(pdb_file_dir):
-        if not filename.endswith('.pdb'):
-            print('Unexpected filenname: %s.' % filename)
-            print('Please make sure, that all PDB-files end with ".pdb".')
-            sys.exit(1)
-        pdb_id = filename.split('.')[0]
-        struct = PDB.PDBParser().get_structure(pdb_id,
-                                        os.path.join(pdb_file_dir, filename))
-        #print pdb_id, len(list(struct.get_chains()))
-        if len(list(struct.get_chains())) < 1:
-            print('Problem encountered in file "%s": not a valid '
-                'PDB-file.\nPlease remove it from the directory.' % filename)
-            sys.exit(1)
-        filecount += 1
-    print('%s valid PDB-files found.' % filecount)
+    filenames = sorted(os.listdir(pdb_file_dir))
+    problems = []
+    n_known = 0
+    for filename, problem, known in run.map(
+            check_pdb_file, filenames, args.jobs, args.chunksize):
+        n_known += known
+        if problem:
+            problems.append((filename, problem))
+        path = os.path.join(pdb_file_dir, filename)
+        if not known and os.path.isfile(path):
+            checked[path] = input_checks.file_signature(path) + \
+                (check_mode(), problem)
+    input_checks.write_check_log(checked)
+    print('%s valid PDB-files found (%s checked, %s unchanged since an '
+          'earlier check), %s invalid.' % (
+              len(filenames) - len(problems), len(filenames) - n_known,
+              n_known, len(problems)))
+    run.add(valid_files=len(filenames) - len(problems),
+            invalid_files=len(problems))
+    return problems
 
 
 def check_SIFTS_file(sifts_pdb_pfam_file):
-    '''Try to read csv-file with pandas; Exist script if reading fails'''
+    '''Try to read csv-file (and store its index, see sifts_index.py)
+    OUT: problem ('' if the file is valid)'''
     print('\nChecking SIFTS-file: %s' % sifts_pdb_pfam_file)
     print('(required to identify PDB-chains with Pfam-domain of interest)')
     try:
-        chain_pfam = pandas.read_csv(sifts_pdb_pfam_file, comment='#')
+        sifts_index.load_index(sifts_pdb_pfam_file)
         print('File present: %s' % sifts_pdb_pfam_file)
-        return chain_pfam
+        return ''
     except:
-        print('File %s not present or corrupted.' % sifts_pdb_pfam_file)
-        print('Please check the file. If necessary, you can download the '
-            'correct file here: '
-            'https://www.ebi.ac.uk/pdbe/docs/sifts/quick.html')
-        sys.exit(1)
+        return ('File %s not present or corrupted. Please check the file. If '
+                'necessary, you can download the correct file here: '
+                'https://www.ebi.ac.uk/pdbe/docs/sifts/quick.html'
+                % sifts_pdb_pfam_file)
+
+
+def alignment_names(reference_alignment):
+    '''IN: path of a fasta-file
+    OUT: names of all sequences (as Bio.SeqIO: first word of the header);
+    ValueError if the file is not in fasta format'''
+    names = []
+    with open(reference_alignment) as infile:
+        for line in infile:
+            if line.startswith('>'):
+                names.append((line[1:].split() or [''])[0])
+            elif line.strip() and not names:
+                raise ValueError('sequence without header')
+    if not names:
+        raise ValueError('no sequences')
+    return names
 
 
 def check_reference_alignment(reference_alignment, pdb_files_dir):
-    '''Try to read alignment (with Bio.SeqIO); Exit if reading fails;
-    Print warining message (but do not exit) if a structure is not in the
-    alignment'''
+    '''Reads the names of the sequences in the alignment (without parsing
+    the sequences)
+    OUT: list of errors, list of warnings (structures which are not in the
+    alignment)'''
     print('\nChecking reference alignment: %s' % reference_alignment)
     try:
-        ref_alignment = SeqIO.parse(reference_alignment, 'fasta')
-        print('Valid alignment present: %s' % reference_alignment)
-    except:
-        print('Alignment not present or not in required format (fasta).')
-        print('Please check the file "%s".' % reference_alignment)
-        sys.exit(1)
-    
-    seq_names_alignment = SeqIO.to_dict(ref_alignment).keys()
-    structures = os.listdir(pdb_files_dir)
-    not_in_alignment = [x for x in structures if x not in seq_names_alignment]
-    if len(not_in_alignment) > 0:
-        print('WARNING: The sequence of the following %s PDB-structures is no '
-            'present in the reference alignment and will be excluded from '
-            'analysis:\n%s' % (len(not_in_alignment), not_in_alignment))
-        print('If the dataset is large enought without these structures, this '
-            'is not a problem.')
-        print('Note: The sequences in the alignment must have the same names '
-            'as their corresponding structures in the directory "%s".'
-            % pdb_files_dir)
-    else:
+        names = alignment_names(reference_alignment)
+    except (IOError, ValueError) as error:
+        return ['Alignment not present or not in required format (fasta, '
+                '%s). Please check the file "%s".' % (error,
+                                                      reference_alignment)], []
+    print('Valid alignment present: %s (%s sequences)'
+          % (reference_alignment, len(names)))
+    errors = []
+    seen, duplicates = set(), set()
+    for name in names:
+        if name in seen:
+            duplicates.add(name)
+        seen.add(name)
+    if duplicates:
+        errors.append('Duplicate sequence names in the alignment: %s'
+                      % sorted(duplicates))
+    # (sequence names of mmCIF-files are also '<PDB-ID>.pdb', as the
+    # processed files)
+    not_in_alignment = sorted(set(['%s.pdb' % filename.split('.')[0] for
+                                   filename in os.listdir(pdb_files_dir)])
+                              - seen)
+    if not not_in_alignment:
         print('All structures are present in the reference alignment.')
+        return errors, []
+    return errors, [
+        'The sequence of the following %s PDB-structures is not present in '
+        'the reference alignment and will be excluded from analysis:\n%s\n'
+        'If the dataset is large enought without these structures, this is '
+        'not a problem. Note: The sequences in the alignment must have the '
+        'same names as their corresponding structures in the directory "%s".'
+        % (len(not_in_alignment), not_in_alignment, pdb_files_dir)]
+
+
+def print_summary(errors, warnings):
+    '''prints all problems found'''
+    print('\nSUMMARY:')
+    if not errors and not warnings:
+        print('No problems found.')
+    for warning in warnings:
+        print('WARNING: %s' % warning)
+    for error in errors:
+        print('ERROR: %s' % error)
+    if errors:
+        print('Please fix the %s error(s) above and run the check again.'
+              % len(errors))
+
+
+def main(argv=None):
+    global args, run, checked
+    args = parse_arguments(argv)
+    run = metrics.StageMetrics.from_args('check_data', args)
+    checked = input_checks.read_check_log()
+    errors, warnings = [], []
+    # CHECK INPUT DATA:
+    if os.path.isdir(args.raw_pdb_dir):
+        problems = ['Problem encountered in file "%s": %s.' % problem
+                    for problem in check_pdb_files(args.raw_pdb_dir)]
+        if problems and args.keep_going:
+            warnings += [problem + ' The file is skipped by the analysis.'
+                         for problem in problems]
+        else:
+            errors += [problem + ' Please remove it from the directory.'
+                       for problem in problems]
+    else:
+        errors.append('Directory of the PDB-files not found: %s'
+                      % args.raw_pdb_dir)
+    with run.section('sifts'):
+        problem = check_SIFTS_file(args.sifts_chain_pfam)
+        if problem:
+            errors.append(problem)
+    with run.section('alignment'):
+        if os.path.isdir(args.raw_pdb_dir):
+            alignment_errors, alignment_warnings = check_reference_alignment(
+                args.reference_alignment, args.raw_pdb_dir)
+            errors += alignment_errors
+            warnings += alignment_warnings
+    print_summary(errors, warnings)
+    run.close()
+    if errors:
+        sys.exit(1)
 
 
-# CHECK INPUT DATA:
-check_pdb_files(args.raw_pdb_dir)
-check_SIFTS_file(args.sifts_chain_pfam)
-check_reference_alignment(args.reference_alignment, args.raw_pdb_dir)
+if __name__ == '__main__':
+    main()
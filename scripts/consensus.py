@@ -0,0 +1,385 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Calculation of the consensus residue contact network from the mapped networks
+of all structures. Used by 'calculate_consensus_network.py' and
+'update_consensus.py'.
+
+The contacts of all structures are counted per pair of alignment positions
+(alignment position of residue A x alignment position of residue B). The
+consensus network consists of all pairs with at least one contact:
+'contact_num' is the number of structures with an equivalent contact and
+'conservation' the fraction of all structures in the dataset.
+
+CONSENSUS STATE:
+'contact_num' is a sum over the structures and 'conservation' divides it by
+the number of structures. Thus, structures can be added to (or removed from)
+an existing consensus network without calculating it again: ConsensusState
+keeps the contacts of every structure (as alignment positions) together with
+the contact counts of all pairs of alignment positions (one count matrix per
+distance cutoff). Adding or removing a structure only changes the counts of
+its own contacts, but the sparse count matrices are added as a whole: an
+update takes time proportional to the number of counted pairs of alignment
+positions (per cutoff) plus the contacts of the structure. The state is
+stored in a single npz-file, which is read and written completely.
+
+NOTE:
+The count matrices are sparse (scipy.sparse, csr): only the pairs of
+alignment positions with contacts are kept in memory and in the state file
+(a few percent of all pairs), so the memory requirement grows with the number
+of contacts and not with the square of the alignment length.
+------------------------------------------------------------------------------
+'''
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import contact_engine
+import network_io
+
+STATE_VERSION = 1  # increase if the format of the state file changes
+
+# csv-files as written by R (write.csv)
+CSV_OPTIONS = {'na_rep': 'NA', 'float_format': '%.15g'}
+MAPPED_COLUMNS = ['pdb_id', 'res_A', 'pdb_A', 'alignment_pos_A', 'aa_A',
+                  'ref_pdb_A', 'res_B', 'pdb_B', 'alignment_pos_B', 'aa_B',
+                  'ref_pdb_B', 'seq_prox']
+CONSENSUS_COLUMNS = ['alignment_pos_B', 'alignment_pos_A', 'contact_num',
+                     'conservation', 'ref_pdb_A', 'ref_pdb_B']
+
+
+def map_networks(nw, mapping):
+    '''IN: raw networks, mapping (dataframes)
+    OUT: mapped networks (dataframe): alignment positions, amino acids etc.
+    of both residues of each contact'''
+    nw = nw.copy()
+    nw['pdb_id'] = nw.pdb_id.astype(str)
+    mapping = mapping[['pdb_id', 'resnum', 'pdb', 'alignment_pos', 'aa',
+                       'ref_pdb']].copy()
+    mapping['pdb_id'] = mapping.pdb_id.astype(str)
+    mapping['aa'] = mapping.aa.astype(str)
+    for residue in ['A', 'B']:
+        residue_map = mapping.rename(columns=dict(
+            [(column, '%s_%s' % (column, residue)) for column in
+             ['pdb', 'alignment_pos', 'aa', 'ref_pdb']] +
+            [('resnum', 'res_%s' % residue)]))
+        nw = pd.merge(nw, residue_map, on=['pdb_id', 'res_%s' % residue],
+                      how='left')
+    nw['seq_prox'] = nw.res_B - nw.res_A  # proximity in sequence
+    columns = MAPPED_COLUMNS + [column for column in ['min_dist']
+                                if column in nw.columns]
+    nw = nw[columns].sort_values(by=['pdb_id', 'res_B'], kind='mergesort')
+    return nw.reset_index(drop=True)
+
+
+def unmapped_contacts(nw):
+    '''IN: mapped networks
+    OUT: boolean array: contacts with a residue without alignment position'''
+    return (nw.alignment_pos_A.isnull() | nw.alignment_pos_B.isnull()).values
+
+
+def reference_positions(mapping):
+    '''IN: mapping (dataframe)
+    OUT: array: alignment position as index, PDB-number of the equivalent
+    residue in the reference structure as value (NaN if there is none)'''
+    mapped = mapping[mapping.alignment_pos.notnull()]
+    positions = mapped.alignment_pos.values.astype(int)
+    lookup = np.empty(positions.max() + 1 if len(positions) else 1)
+    lookup[:] = np.nan
+    lookup[positions] = mapped.ref_pdb.astype(float).values
+    return lookup
+
+
+def count_contacts(pos_A, pos_B, size=0, weights=None):
+    '''IN: alignment positions of residue A and B of all contacts (arrays),
+    minimal size of the count matrix, number of contacts of every entry
+    (optional, default: 1)
+    OUT: sparse matrix (csr): number of contacts of every pair of alignment
+    positions'''
+    size = max([size, pos_A.max() + 1 if len(pos_A) else 0,
+                pos_B.max() + 1 if len(pos_B) else 0])
+    if weights is None:
+        weights = np.ones(len(pos_A), dtype=np.int32)
+    return sparse.coo_matrix((np.asarray(weights, dtype=np.int32),
+                              (pos_A, pos_B)), shape=(size, size)).tocsr()
+
+
+def consensus_table(pos_A, pos_B, contact_num, n_structures, ref_lookup):
+    '''IN: alignment positions A and B of every pair of positions with
+    contacts, number of contacts, number of structures, reference positions
+    (see reference_positions)
+    OUT: consensus network (dataframe), sorted by alignment positions B and
+    A'''
+    order = np.lexsort((pos_A, pos_B))
+    pos_A, pos_B, contact_num = pos_A[order], pos_B[order], contact_num[order]
+    size = max([pos_A.max() + 1 if len(pos_A) else 0,
+                pos_B.max() + 1 if len(pos_B) else 0])
+    if size > len(ref_lookup):
+        ref_lookup = np.concatenate([ref_lookup, np.repeat(
+            np.nan, size - len(ref_lookup))])
+    consensus = pd.DataFrame({'alignment_pos_B': pos_B,
+                              'alignment_pos_A': pos_A,
+                              'contact_num': contact_num,
+                              # fraction of structures with the contact:
+                              'conservation': contact_num /
+                              float(n_structures),
+                              'ref_pdb_A': ref_lookup[pos_A],
+                              'ref_pdb_B': ref_lookup[pos_B]},
+                             columns=CONSENSUS_COLUMNS)
+    for column in ['ref_pdb_A', 'ref_pdb_B']:
+        consensus[column] = consensus[column].astype('Int32')
+    return consensus
+
+
+def consensus_network(pos_A, pos_B, n_structures, ref_lookup):
+    '''IN: alignment positions of residue A and B of all contacts (arrays),
+    number of structures, reference positions (see reference_positions)
+    OUT: consensus network (dataframe)'''
+    counts = count_contacts(pos_A, pos_B).tocoo()  # one entry per pair
+    return consensus_table(counts.row, counts.col, counts.data, n_structures,
+                           ref_lookup)
+
+
+def consensus_networks(nw, ref_lookup, cutoffs=None):
+    '''IN: mapped networks (see map_networks), reference positions (see
+    reference_positions), distance cutoffs (requires the column 'min_dist';
+    default: all contacts)
+    OUT: consensus networks (dataframes), one per cutoff (or one for all
+    contacts); 'conservation' is relative to the number of structures with
+    mapped contacts'''
+    mapped = nw[~unmapped_contacts(nw)]
+    n_structures = len(mapped.pdb_id.unique())
+    pos_A = mapped.alignment_pos_A.values.astype(int)
+    pos_B = mapped.alignment_pos_B.values.astype(int)
+    if not cutoffs:
+        return [consensus_network(pos_A, pos_B, n_structures, ref_lookup)]
+    min_dist = mapped.min_dist.values
+    networks = []
+    for cutoff in cutoffs:  # contacts of each cutoff from one calculation
+        within = contact_engine.within_cutoff(min_dist, cutoff)
+        networks.append(consensus_network(pos_A[within], pos_B[within],
+                                          n_structures, ref_lookup))
+    return networks
+
+
+def consensus_names(cutoffs):
+    '''IN: distance cutoffs (empty: all contacts)
+    OUT: names of the consensus network tables of every cutoff (the first
+    one is also written as the main result 'consensus_network')'''
+    if not cutoffs:
+        return ['consensus_network']
+    return ['consensus_network_%g' % cutoff for cutoff in cutoffs]
+
+
+def write_consensus(consensus, names, directory, fmt):
+    '''writes the consensus networks (list, one per name) to the directory'''
+    for i, (table, name) in enumerate(zip(consensus, names)):
+        network_io.write_table(table, network_io.table_path(
+            directory, name, fmt), **CSV_OPTIONS)
+        if i == 0 and name != 'consensus_network':
+            network_io.write_table(table, network_io.table_path(
+                directory, 'consensus_network', fmt), **CSV_OPTIONS)
+
+
+def write_mapped_networks(nw, directory, fmt):
+    '''writes the mapped networks (see map_networks) to the directory'''
+    if 'min_dist' in nw.columns and fmt == 'csv':
+        nw = nw.copy()
+        # precision of the raw networks (see network_io.py)
+        nw['min_dist'] = np.char.mod('%.9g', nw.min_dist.values.astype('f8'))
+    network_io.write_table(nw, network_io.table_path(
+        directory, 'mapped_networks', fmt), **CSV_OPTIONS)
+
+
+class ConsensusState(object):
+    '''Contacts of all structures (alignment positions) and their counts per
+    pair of alignment positions; structures can be added and removed'''
+
+    def __init__(self, cutoffs=None):
+        self.cutoffs = [float(cutoff) for cutoff in cutoffs or []]
+        # PDB-ID -> alignment positions A and B, minimal distance (or None)
+        self.structures = {}
+        # one sparse count matrix per cutoff (or one for all contacts)
+        self.counts = [count_contacts(np.zeros(0, dtype=np.int32),
+                                      np.zeros(0, dtype=np.int32))
+                       for i in range(max(len(self.cutoffs), 1))]
+        self.ref_lookup = np.zeros(0)  # see reference_positions
+
+    def __len__(self):
+        return len(self.structures)
+
+    def __contains__(self, pdb_id):
+        return pdb_id in self.structures
+
+    @property
+    def n_structures(self):
+        '''number of structures with at least one mapped contact'''
+        return sum(1 for pos_A, pos_B, min_dist in self.structures.values()
+                   if len(pos_A))
+
+    @property
+    def size(self):
+        '''number of rows (and columns) of the count matrices'''
+        return self.counts[0].shape[0]
+
+    def _grow(self, size):
+        '''enlarges the count matrices to at least size x size'''
+        if size <= self.size:
+            return
+        for i, counts in enumerate(self.counts):
+            counts = counts.tocoo()
+            self.counts[i] = count_contacts(counts.row, counts.col, size,
+                                            counts.data)
+
+    def _update(self, pos_A, pos_B, min_dist, change):
+        '''adds change x the contacts to the count matrices (contacts of each
+        cutoff: minimal distance below the cutoff); the sum of two sparse
+        matrices: proportional to all counted pairs, not only the changed
+        ones'''
+        if not len(pos_A):
+            return
+        self._grow(max(pos_A.max(), pos_B.max()) + 1)
+        if self.cutoffs:
+            selections = [contact_engine.within_cutoff(min_dist, cutoff)
+                          for cutoff in self.cutoffs]
+        else:
+            selections = [slice(None)]
+        for i, within in enumerate(selections):
+            counts = self.counts[i] + count_contacts(
+                pos_A[within], pos_B[within], self.size) * change
+            counts.eliminate_zeros()  # pairs without contacts any more
+            self.counts[i] = counts
+
+    def add(self, pdb_id, pos_A, pos_B, min_dist=None):
+        '''adds the contacts of a structure (replaces the structure if it is
+        already in the state)
+        IN: PDB-ID, alignment positions of residue A and B of all mapped
+        contacts, minimal atomic distance (required if the state has
+        cutoffs)'''
+        if self.cutoffs and min_dist is None:
+            raise ValueError('%s: the consensus state has distance cutoffs, '
+                             'but the contacts have no minimal distance'
+                             % pdb_id)
+        self.remove(pdb_id)
+        pos_A = np.asarray(pos_A, dtype=np.int32)
+        pos_B = np.asarray(pos_B, dtype=np.int32)
+        if self.cutoffs:
+            min_dist = np.asarray(min_dist, dtype=np.float32)
+        else:
+            min_dist = None
+        self.structures[pdb_id] = pos_A, pos_B, min_dist
+        self._update(pos_A, pos_B, min_dist, 1)
+
+    def remove(self, pdb_id):
+        '''removes the contacts of a structure
+        OUT: True if the structure was in the state'''
+        if pdb_id not in self.structures:
+            return False
+        pos_A, pos_B, min_dist = self.structures.pop(pdb_id)
+        self._update(pos_A, pos_B, min_dist, -1)
+        return True
+
+    def add_networks(self, nw):
+        '''adds (or replaces) all structures of mapped networks; contacts
+        without alignment positions are ignored. The contacts of all
+        structures are counted at once (instead of one structure at a time).
+        OUT: PDB-IDs of the added structures'''
+        codes, pdb_ids = pd.factorize(nw.pdb_id.astype(str))
+        for pdb_id in pdb_ids:
+            self.remove(pdb_id)
+        mapped = ~unmapped_contacts(nw)
+        pos_A = nw.alignment_pos_A.values[mapped].astype(np.int32)
+        pos_B = nw.alignment_pos_B.values[mapped].astype(np.int32)
+        min_dist = None
+        if self.cutoffs:
+            if 'min_dist' not in nw.columns:
+                raise ValueError('the consensus state has distance cutoffs, '
+                                 'but the networks have no column '
+                                 '"min_dist"')
+            min_dist = nw.min_dist.values[mapped].astype(np.float32)
+        # contacts of each structure: consecutive rows after sorting
+        codes = codes[mapped]
+        order = np.argsort(codes, kind='mergesort')
+        bounds = np.searchsorted(codes[order], np.arange(len(pdb_ids) + 1))
+        for i, pdb_id in enumerate(pdb_ids):
+            rows = order[bounds[i]:bounds[i + 1]]
+            self.structures[str(pdb_id)] = (
+                pos_A[rows], pos_B[rows],
+                None if min_dist is None else min_dist[rows])
+        self._update(pos_A, pos_B, min_dist, 1)
+        return [str(pdb_id) for pdb_id in pdb_ids]
+
+    def set_reference(self, ref_lookup):
+        '''IN: reference positions (see reference_positions); positions
+        without equivalent residue in the reference structure do not replace
+        known ones'''
+        if len(ref_lookup) > len(self.ref_lookup):
+            self.ref_lookup = np.concatenate([self.ref_lookup, np.repeat(
+                np.nan, len(ref_lookup) - len(self.ref_lookup))])
+        known = ~np.isnan(ref_lookup)
+        self.ref_lookup[:len(ref_lookup)][known] = ref_lookup[known]
+
+    def consensus(self):
+        '''OUT: consensus networks (dataframes), one per cutoff (or one for
+        all contacts)'''
+        n_structures = self.n_structures
+        tables = []
+        for counts in self.counts:
+            counts = counts.tocoo()
+            tables.append(consensus_table(counts.row, counts.col, counts.data,
+                                          n_structures, self.ref_lookup))
+        return tables
+
+    def save(self, path):
+        '''writes the state to an npz-file'''
+        pdb_ids = sorted(self.structures)
+        entries = [self.structures[pdb_id] for pdb_id in pdb_ids]
+        lengths = np.array([len(entry[0]) for entry in entries],
+                           dtype=np.int64)
+        arrays = {'version': np.array(STATE_VERSION),
+                  'cutoffs': np.array(self.cutoffs, dtype=np.float64),
+                  'pdb_ids': np.array(pdb_ids, dtype='U'),
+                  'lengths': lengths,
+                  'ref_lookup': self.ref_lookup}
+        for i, name in enumerate(['pos_A', 'pos_B', 'min_dist']):
+            if name == 'min_dist' and not self.cutoffs:
+                continue
+            arrays[name] = np.concatenate(
+                [entry[i] for entry in entries] +
+                [np.zeros(0, dtype=np.float32 if i == 2 else np.int32)])
+        for i, counts in enumerate(self.counts):  # only non-empty cells
+            counts = counts.tocoo()
+            arrays['counts_%s' % i] = np.array(
+                [counts.row, counts.col, counts.data], dtype=np.int32)
+        arrays['size'] = np.array(self.size)
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as outfile:
+            np.savez(outfile, **arrays)
+        os.rename(tmp, path)
+
+
+def load_state(path):
+    '''IN: path of a state file (see ConsensusState.save)
+    OUT: ConsensusState'''
+    with open(path, 'rb') as infile:
+        arrays = np.load(infile)
+        if int(arrays['version']) != STATE_VERSION:
+            raise ValueError('%s: consensus state of an other version (%s, '
+                             'expected: %s)' % (path, int(arrays['version']),
+                                                STATE_VERSION))
+        state = ConsensusState(list(arrays['cutoffs']))
+        offsets = np.concatenate([[0], np.cumsum(arrays['lengths'])])
+        pos_A, pos_B = arrays['pos_A'], arrays['pos_B']
+        min_dist = arrays['min_dist'] if state.cutoffs else None
+        for i, pdb_id in enumerate(arrays['pdb_ids']):
+            rows = slice(offsets[i], offsets[i + 1])
+            state.structures[str(pdb_id)] = (
+                pos_A[rows], pos_B[rows],
+                None if min_dist is None else min_dist[rows])
+        size = int(arrays['size'])
+        for i in range(len(state.counts)):
+            row, col, count = arrays['counts_%s' % i]
+            state.counts[i] = count_contacts(row, col, size, count)
+        state.ref_lookup = arrays['ref_lookup']
+    return state
@@ -0,0 +1,119 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+On-disk cache of the residue contacts of single structures. Used by
+'calculate_networks.py'.
+
+The contacts of a structure only depend on the content of the (processed)
+PDB-file, the distance cutoff and the definition of a contact. Therefore, the
+contacts (with the minimal atomic distance of every contact) are stored under
+a key built from these three: the hash of the file content, the cutoff and
+contact_engine.ENGINE_VERSION. When the analysis is repeated (e.g. after
+adding a few new structures), only the contacts of new or changed structures
+are calculated.
+
+NOTE:
+The size of the cache is limited. If it is exceeded, the least recently used
+entries are removed. Entries are written to a temporary file first and then
+renamed. Thus, several processes can use the same cache at the same time.
+------------------------------------------------------------------------------
+'''
+
+import hashlib
+import os
+import numpy as np
+import contact_engine
+
+DEFAULT_CACHE_DIR = '.contact_cache'
+DEFAULT_CACHE_SIZE = 1024  # megabytes
+
+
+def add_cache_arguments(parser):
+    '''adds the options --cache-dir, --cache-size and --no-cache to an
+    argparse parser'''
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='Directory of the contact cache. Default: %s'
+                        % DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-size', type=float,
+                        default=DEFAULT_CACHE_SIZE, help='Maximal size of the '
+                        'contact cache in megabytes (least recently used '
+                        'entries are removed). Default: %s' % DEFAULT_CACHE_SIZE)
+    parser.add_argument('--no-cache', action='store_true', help='Calculate '
+                        'all contacts without using the contact cache.')
+
+
+class ContactCache(object):
+    '''Contacts of single structures (as numpy arrays) stored in a directory;
+    one npz-file per entry'''
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = int(max_size * 1024 ** 2)  # bytes
+        if not os.path.exists(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:  # created by another process in the meantime
+                pass
+
+    @staticmethod
+    def key(path, cutoff):
+        '''IN: path of a PDB-file, distance cutoff
+        OUT: cache key (hash of file content, cutoff and engine version)'''
+        sha = hashlib.sha1()
+        with open(path, 'rb') as infile:
+            for block in iter(lambda: infile.read(1024 ** 2), b''):
+                sha.update(block)
+        sha.update(('|%r|%s' % (float(cutoff), contact_engine.ENGINE_VERSION)
+                    ).encode('ascii'))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        '''IN: cache key
+        OUT: residue indices A and B and minimal distance of all contacts
+        (see contact_engine.residue_contacts); None if not in the cache'''
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as infile:
+                entry = np.load(infile)
+                contacts = entry['res_a'], entry['res_b'], entry['min_dist']
+            os.utime(path, None)  # mark as recently used
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+        return contacts
+
+    def put(self, key, res_a, res_b, min_dist):
+        '''stores the contacts of a structure under the given key'''
+        path = self._path(key)
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as outfile:
+            np.savez(outfile, res_a=res_a, res_b=res_b, min_dist=min_dist)
+        os.rename(tmp, path)
+
+    def evict(self):
+        '''removes the least recently used entries until the cache is not
+        larger than its maximal size
+        OUT: number of removed entries'''
+        entries = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except OSError:  # removed by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        total_size = sum(size for mtime, size, filename in entries)
+        removed = 0
+        for mtime, size, filename in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except OSError:
+                pass
+            total_size -= size
+            removed += 1
+        return removed
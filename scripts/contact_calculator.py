@@ -0,0 +1,150 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+In-process interface to the analysis: the steps of the scripts as functions
+which work on structures, arrays and dataframes in memory and return their
+results without reading or writing files (apart from loading structures and
+alignments). Other python programs (e.g. a web service) can calculate
+consensus networks without starting the scripts and without intermediate
+csv-files; the scripts use the same modules.
+
+USAGE:
+import sys
+sys.path.append('path/to/scripts')
+import contact_calculator as cc
+structures = dict([(pdb_id, cc.load_structure('%s.pdb' % pdb_id, chain='A'))
+                   for pdb_id in ['1g16', '2bme']])
+networks = cc.compute_networks(structures, cutoff=5)
+mapping = cc.map_to_alignment(structures, 'alignment.fa', '1g16')
+consensus = cc.build_consensus(networks, mapping)
+
+FUNCTIONS:
+load_structure   - structure of a PDB- or mmCIF-file, optionally only the
+                   chain of interest (as written by 'process_pdb.py')
+chain_of_interest - chain of a structure with a Pfam-domain (SIFTS-index)
+compute_contacts - contacts of one structure (dataframe: res_A, res_B,
+                   min_dist; residues numbered from 1)
+compute_networks - raw networks of several structures (as
+                   'calculate_networks.py')
+compute_occupancy - contacts of all models of an NMR ensemble or MD
+                   trajectory (PDB-file) with the fraction of models in
+                   which they are present (see 'trajectory.py')
+map_to_alignment - mapping of all residues to alignment positions and to the
+                   reference structure (as 'map_networks.py')
+build_consensus  - consensus network (as 'calculate_consensus_network.py')
+All tables have the columns (and column types) of the files written by the
+scripts (see 'network_io.py').
+------------------------------------------------------------------------------
+'''
+
+import pandas as pd
+import consensus
+import contact_engine
+import mapping as residue_mapping
+import network_io
+import sifts_index
+import structure_io
+import trajectory
+
+load_sifts_index = sifts_index.load_index
+
+
+def load_structure(path, chain=None, parser='native', name=None):
+    '''IN: path of a PDB- or mmCIF-file, chain ID (optional), parser
+    ('native' or 'biopython'), name of the structure (default: filename)
+    OUT: Structure (see structure_io.py); with a chain: only the standard
+    residues of this chain in the first model, without hydrogen atoms'''
+    structure = structure_io.load_structure(path, parser, name)
+    if chain is not None:
+        structure = structure.select_chain(chain)
+    return structure
+
+
+def chain_of_interest(pdb_id, pfam_id, sifts):
+    '''IN: PDB-ID, Pfam-domain, SIFTS-index (see load_sifts_index)
+    OUT: first chain with the Pfam-domain (in the order of the SIFTS-file,
+    as selected by 'process_pdb.py'), None if there is none'''
+    chains = sifts.chains(pdb_id, pfam_id)
+    return chains[0] if len(chains) else None
+
+
+def compute_contacts(structure, cutoff=5, backend='grid'):
+    '''IN: Structure, distance cutoff, neighbour search backend (see
+    contact_engine.py)
+    OUT: dataframe of all contacts: res_A, res_B (residue numbers starting at
+    1) and min_dist (minimal atomic distance); first model only'''
+    res_a, res_b, min_dist = contact_engine.structure_contacts(
+        structure.select_model(0), cutoff, backend)
+    return pd.DataFrame({'res_A': res_a.astype('i4') + 1,
+                         'res_B': res_b.astype('i4') + 1,
+                         'min_dist': min_dist},
+                        columns=['res_A', 'res_B', 'min_dist'])
+
+
+def compute_networks(structures, cutoff=5, backend='grid'):
+    '''IN: dictionary: PDB-ID -> Structure, distance cutoff (the largest one
+    if consensus networks for several cutoffs are needed), backend
+    OUT: raw networks of all structures (dataframe: pdb_id, res_A, res_B,
+    min_dist), sorted by PDB-ID'''
+    tables = []
+    for pdb_id in sorted(structures):
+        contacts = compute_contacts(structures[pdb_id], cutoff, backend)
+        contacts.insert(0, 'pdb_id', pdb_id)
+        tables.append(contacts)
+    if not tables:
+        return pd.DataFrame(columns=network_io.NETWORK_COLUMNS +
+                            ['min_dist'])
+    return network_io.set_column_types(pd.concat(tables, ignore_index=True))
+
+
+def compute_occupancy(path, cutoff=5, backend='grid',
+                      skin=trajectory.DEFAULT_SKIN):
+    '''IN: path of a PDB-file with several models (NMR ensemble or MD
+    trajectory), distance cutoff, backend, skin of the neighbour list
+    OUT: dataframe of all contacts in any model: res_A, res_B (starting at
+    1), frames (number of models with the contact), occupancy (fraction of
+    the models), min_dist (over all models). The raw network of the ensemble
+    consists of the contacts with a minimal occupancy (see
+    'calculate_networks.py').'''
+    res_a, res_b, frames, min_dist, n_frames = \
+        trajectory.trajectory_contacts(path, cutoff, backend, skin)
+    return pd.DataFrame({'res_A': res_a.astype('i4') + 1,
+                         'res_B': res_b.astype('i4') + 1,
+                         'frames': frames,
+                         'occupancy': frames / float(n_frames),
+                         'min_dist': min_dist},
+                        columns=['res_A', 'res_B', 'frames', 'occupancy',
+                                 'min_dist'])
+
+
+def map_to_alignment(structures, alignment, reference_structure):
+    '''IN: dictionary: PDB-ID -> Structure, reference alignment (path of a
+    fasta-file or dictionary: sequence name -> aligned sequence; sequence
+    names are PDB-IDs, optionally with the extension '.pdb'), PDB-ID of the
+    reference structure
+    OUT: mapping (dataframe: pdb_id, resnum, pdb, alignment_pos, aa,
+    ref_pdb); structures without sequence in the alignment are left out'''
+    if not isinstance(alignment, dict):
+        alignment = residue_mapping.read_alignment(alignment)
+    residues = []
+    for pdb_id in sorted(structures):
+        sequence = alignment.get(pdb_id, alignment.get('%s.pdb' % pdb_id))
+        if sequence is not None:
+            residues.append((pdb_id, residue_mapping.residue_positions(
+                structures[pdb_id], sequence)))
+    return residue_mapping.mapping_table(residues, reference_structure)
+
+
+def build_consensus(networks, mapping, cutoffs=None):
+    '''IN: raw networks (see compute_networks), mapping (see
+    map_to_alignment), distance cutoffs (optional; requires the column
+    'min_dist')
+    OUT: consensus network (dataframe: alignment_pos_B, alignment_pos_A,
+    contact_num, conservation, ref_pdb_A, ref_pdb_B); with cutoffs: a
+    dictionary: cutoff -> consensus network'''
+    nw = consensus.map_networks(networks, mapping)
+    ref_lookup = consensus.reference_positions(mapping)
+    tables = consensus.consensus_networks(nw, ref_lookup, cutoffs)
+    if cutoffs is None:
+        return tables[0]
+    return dict(zip(cutoffs, tables))
@@ -0,0 +1,191 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Vectorized calculation of residue contacts. Used by 'calculate_networks.py'
+and 'trajectory.py'.
+
+All atom coordinates of a structure are collected in one numpy array together
+with the index of the residue each atom belongs to. Pairs of atoms within the
+distance cutoff are found with a neighbour search and reduced to pairs of
+residues (with the minimal atomic distance of each residue pair) in bulk.
+
+BACKENDS (neighbour search):
+'brute'  - all against all atom distances with numpy (in blocks of atoms)
+'grid'   - cell list: atoms are sorted into cubic cells with the edge length of
+           the cutoff; only atoms in neighbouring cells are compared (default)
+'kdtree' - scipy.spatial.cKDTree (only available if scipy is installed)
+All backends give exactly the same result. For small structures, 'brute' may
+be the fastest option, for large structures 'grid' or 'kdtree'.
+
+NOTE:
+The definition of a contact is the same as in earlier versions of the
+software: Two residues form a contact if the minimal distance between any two
+of their atoms is below the cutoff (and above 0). Residues without CA-atom and
+pairs of residues with a CA-CA distance above 15 Angstrom are not considered.
+Distances are calculated in single precision (as by Bio.PDB).
+Contacts for several cutoffs can be obtained in one calculation: calculate the
+contacts for the largest cutoff and select the contacts with a minimal atomic
+distance below each of the smaller cutoffs (see within_cutoff).
+------------------------------------------------------------------------------
+'''
+
+import numpy as np
+import metrics
+
+# increase the version whenever the definition of a contact changes: cached
+# contacts (see contact_cache.py) of older versions are not used any more
+# (version 3: only the first model of files with several models)
+ENGINE_VERSION = 3
+CA_CUTOFF = 15  # residues with CA-atoms further apart are never in contact
+BLOCK_SIZE = 1024  # number of atoms per block in the brute force backend
+
+# offsets of neighbouring cells in the cell list: every pair of neighbouring
+# cells is visited only once ('half shell'), including the cell itself
+HALF_SHELL = [(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+              for dz in (-1, 0, 1) if (dx, dy, dz) >= (0, 0, 0)]
+
+
+def structure_arrays(structure):
+    '''IN: structure (see structure_io.py)
+    OUT: atom coordinates (float32 array, one row per atom), residue index of
+    every atom (starting at 0), CA-coordinates of every residue (NaN if the
+    residue has no CA-atom)'''
+    return structure.coords, structure.res_index, structure.ca_coords()
+
+
+def pair_distances(coords, i, j):
+    '''single precision distances between the atoms i and j'''
+    diff = coords[i] - coords[j]
+    return np.sqrt((diff * diff).sum(axis=1))
+
+
+def within_cutoff(dist, cutoff):
+    '''IN: distances (single precision), distance cutoff
+    OUT: boolean array: distance below the cutoff
+    Note: compared in double precision (as when filtering written distances,
+    see calculate_networks.py); for integer cutoffs this is the same as in
+    single precision'''
+    return dist.astype('f8') < cutoff
+
+
+def _ranges(counts):
+    '''concatenated ranges: [0..counts[0]), [0..counts[1]), ...'''
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(counts.sum()) - offsets
+
+
+def atom_pairs_brute(coords, cutoff):
+    '''IN: atom coordinates, distance cutoff
+    OUT: indices of all atom pairs (i < j) within the cutoff and distances'''
+    pairs_i, pairs_j = [], []
+    for start in range(0, len(coords), BLOCK_SIZE):
+        block = coords[start:start + BLOCK_SIZE]
+        diff = block[:, np.newaxis, :] - coords[np.newaxis, start:, :]
+        dist = np.sqrt((diff * diff).sum(axis=2))
+        i, j = np.nonzero(within_cutoff(dist, cutoff))
+        i += start
+        j += start
+        pairs_i.append(i[i < j])
+        pairs_j.append(j[i < j])
+    i = np.concatenate(pairs_i) if pairs_i else np.zeros(0, dtype=int)
+    j = np.concatenate(pairs_j) if pairs_j else np.zeros(0, dtype=int)
+    return i, j, pair_distances(coords, i, j)
+
+
+def atom_pairs_grid(coords, cutoff):
+    '''IN: atom coordinates, distance cutoff
+    OUT: indices of all atom pairs (i < j) within the cutoff and distances'''
+    if len(coords) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), \
+            np.zeros(0, dtype='f4')
+    # one layer of empty cells around the structure: neighbouring cells of
+    # atoms at the border never wrap around to the other side
+    cells = np.floor((coords - coords.min(axis=0)) / float(cutoff))
+    cells = cells.astype(np.int64) + 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    pairs_i, pairs_j = [], []
+    for dx, dy, dz in HALF_SHELL:
+        neighbour_keys = keys + (dx * dims[1] + dy) * dims[2] + dz
+        first = np.searchsorted(sorted_keys, neighbour_keys, side='left')
+        last = np.searchsorted(sorted_keys, neighbour_keys, side='right')
+        counts = last - first
+        i = np.repeat(np.arange(len(coords)), counts)
+        j = order[np.repeat(first, counts) + _ranges(counts)]
+        if (dx, dy, dz) == (0, 0, 0):  # same cell: each pair only once
+            i, j = i[i < j], j[i < j]
+        keep = within_cutoff(pair_distances(coords, i, j), cutoff)
+        pairs_i.append(i[keep])
+        pairs_j.append(j[keep])
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    swap = i > j
+    i[swap], j[swap] = j[swap], i[swap]
+    return i, j, pair_distances(coords, i, j)
+
+
+def atom_pairs_kdtree(coords, cutoff):
+    '''IN: atom coordinates, distance cutoff
+    OUT: indices of all atom pairs (i < j) within the cutoff and distances'''
+    from scipy.spatial import cKDTree
+    # slightly larger search radius: the tree works in double precision,
+    # the final decision is made in single precision (see pair_distances)
+    pairs = cKDTree(coords).query_pairs(cutoff * (1 + 1e-6),
+                                        output_type='ndarray')
+    i, j = pairs[:, 0].astype(int), pairs[:, 1].astype(int)
+    dist = pair_distances(coords, i, j)
+    keep = within_cutoff(dist, cutoff)
+    return i[keep], j[keep], dist[keep]
+
+
+BACKENDS = {'brute': atom_pairs_brute,
+            'grid': atom_pairs_grid,
+            'kdtree': atom_pairs_kdtree}
+
+
+def residue_contacts(coords, atom_res, ca_coords, cutoff, backend='grid'):
+    '''IN: atom coordinates, residue index of every atom, CA-coordinates of
+    all residues (see structure_arrays), distance cutoff, neighbour search
+    backend
+    OUT: residue indices A and B of all contacts (A < B, starting at 0,
+    sorted) and the minimal atomic distance of each contact'''
+    i, j, dist = BACKENDS[backend](coords, cutoff)
+    return residue_pairs(i, j, dist, atom_res, ca_coords)
+
+
+def residue_pairs(i, j, dist, atom_res, ca_coords):
+    '''IN: atom pairs within the cutoff (see BACKENDS), residue index of
+    every atom, CA-coordinates of all residues
+    OUT: residue contacts (see residue_contacts)'''
+    res_a, res_b = atom_res[i], atom_res[j]
+    keep = res_a != res_b  # atoms of the same residue
+    res_a, res_b, dist = res_a[keep], res_b[keep], dist[keep]
+    swap = res_a > res_b
+    res_a[swap], res_b[swap] = res_b[swap], res_a[swap]
+
+    # minimal atomic distance of every residue pair
+    key = res_a.astype(np.int64) * len(ca_coords) + res_b
+    order = np.lexsort((dist, key))
+    key, dist = key[order], dist[order]
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    key, min_dist = key[first], dist[first]
+    res_a, res_b = key // len(ca_coords), key % len(ca_coords)
+
+    # residue pairs (without CA-atoms or) with distant CA-atoms are excluded
+    ca_dist = pair_distances(ca_coords, res_a, res_b)
+    with np.errstate(invalid='ignore'):
+        keep = (ca_dist <= CA_CUTOFF) & (min_dist > 0)
+    # candidate residue pairs (any atoms within the cutoff) and contacts
+    metrics.record(atom_pairs=len(i), candidate_pairs=len(key),
+                   contacts=int(keep.sum()))
+    return res_a[keep], res_b[keep], min_dist[keep]
+
+
+def structure_contacts(structure, cutoff, backend='grid'):
+    '''IN: structure (see structure_io.py), distance cutoff, backend
+    OUT: residue indices A and B of all contacts (see residue_contacts)'''
+    coords, atom_res, ca_coords = structure_arrays(structure)
+    return residue_contacts(coords, atom_res, ca_coords, cutoff, backend)
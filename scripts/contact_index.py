@@ -0,0 +1,373 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Index of a consensus network and its mapped networks for fast lookups of
+single contacts, positions and structures: e.g. all contacts with a
+conservation of at least 0.9, all contacts of an alignment position or of a
+residue of the reference structure, or the structures which have a given
+contact. Without an index, every such query reads and filters the whole
+(possibly very large) tables.
+
+USAGE:
+build: creates the index (a directory) from the consensus network and the
+mapped networks written by 'calculate_consensus_network.py'. With several
+cutoffs, give the cutoff of the consensus network (the mapped networks
+contain the contacts of the largest cutoff).
+python contact_index.py build results/consensus_network.csv \
+    results/mapped_networks.csv results/contact_index [--cutoff 5]
+query: prints the contacts of the consensus network (csv, columns as in the
+consensus network) which match the query, or the PDB-IDs of the structures
+with a contact:
+python contact_index.py query results/contact_index --pair 12 58
+python contact_index.py query results/contact_index --position 12
+python contact_index.py query results/contact_index --reference-residue 19
+python contact_index.py query results/contact_index --min-conservation 0.9
+python contact_index.py query results/contact_index --structure 1g16
+python contact_index.py query results/contact_index --structures-with 12 58
+From python: index = contact_index.load_index('results/contact_index'), then
+index.pair(12, 58), index.position(12) etc. (see ContactIndex).
+
+INDEX (one numpy array per file, see build_index):
+- the columns of the consensus network (one entry per consensus contact;
+  the conservation in the precision of the file, so that a query returns the
+  same values as the consensus network)
+- sorted keys with the consensus contacts of every pair of alignment
+  positions, alignment position, reference residue and conservation: a query
+  is a binary search (numpy.searchsorted)
+- per consensus contact, a bitmap of the structures with the contact (one bit
+  per structure, in order of the PDB-IDs)
+- the contacts of every structure (consensus contact and PDB-residue numbers),
+  sorted by PDB-ID
+The arrays are memory-mapped when the index is loaded: only the parts needed
+by a query are read, so queries take milliseconds independent of the size of
+the index.
+
+NOTE:
+A contact of a pair of alignment positions is found in both orders of the
+positions (e.g. --pair 12 58 and --pair 58 12 are the same query).
+------------------------------------------------------------------------------
+'''
+
+import argparse
+import os
+import shutil
+import sys
+import numpy as np
+import pandas as pd
+import consensus
+import contact_engine
+import network_io
+
+INDEX_VERSION = 1  # increase if the structure of the index changes
+INDEX_ARRAYS = ['version', 'alignment_pos_A', 'alignment_pos_B',
+                'contact_num', 'conservation', 'ref_pdb_A', 'ref_pdb_B',
+                'pair_keys', 'pair_rows', 'position_keys', 'position_rows',
+                'reference_keys', 'reference_rows', 'conservation_keys',
+                'conservation_rows', 'pdb_ids', 'bitmap',
+                'structure_offsets', 'structure_rows', 'structure_pdb_A',
+                'structure_pdb_B']
+
+
+def _sorted_keys(keys, rows):
+    '''OUT: keys and rows sorted by key (and row)'''
+    order = np.lexsort((rows, keys))
+    return keys[order], rows[order]
+
+
+def build_index(consensus_nw, mapped_nw, cutoff=None):
+    '''IN: consensus network, mapped networks (dataframes, see
+    consensus.py), distance cutoff of the consensus network (optional;
+    requires the column 'min_dist' in the mapped networks)
+    OUT: dictionary: name -> array (see docstring)'''
+    n = len(consensus_nw)
+    pos_A = consensus_nw.alignment_pos_A.values.astype(np.int64)
+    pos_B = consensus_nw.alignment_pos_B.values.astype(np.int64)
+    ref_A = consensus_nw.ref_pdb_A.astype(float).values
+    ref_B = consensus_nw.ref_pdb_B.astype(float).values
+    rows = np.arange(n)
+    size = max([pos_A.max() + 1 if n else 0, pos_B.max() + 1 if n else 0])
+    pair_keys, pair_rows = _sorted_keys(pos_A * size + pos_B, rows)
+    if (pair_keys[1:] == pair_keys[:-1]).any():
+        raise ValueError('The consensus network has several entries of the '
+                         'same pair of alignment positions.')
+
+    # consensus contact of every contact of the mapped networks
+    mapped = mapped_nw[~consensus.unmapped_contacts(mapped_nw)]
+    if cutoff is not None:
+        mapped = mapped[contact_engine.within_cutoff(
+            mapped.min_dist.values, cutoff)]
+    mapped_A = mapped.alignment_pos_A.values.astype(np.int64)
+    mapped_B = mapped.alignment_pos_B.values.astype(np.int64)
+    mapped_keys = np.where((mapped_A < size) & (mapped_B < size),
+                           mapped_A * size + mapped_B, -1)
+    found = np.minimum(np.searchsorted(pair_keys, mapped_keys),
+                       max(n - 1, 0))
+    if len(mapped_keys) and (n == 0 or
+                             (pair_keys[found] != mapped_keys).any()):
+        raise ValueError('The mapped networks have contacts which are not in '
+                         'the consensus network (other dataset or cutoff?).')
+    contact_rows = pair_rows[found] if n else found
+    pdb_ids, structure = np.unique(mapped.pdb_id.astype(str).values,
+                                   return_inverse=True)
+    structure = structure.ravel()
+    if (np.bincount(contact_rows, minlength=n) !=
+            consensus_nw.contact_num.values).any():
+        raise ValueError('The numbers of contacts in the mapped networks and '
+                         'in the consensus network differ (other dataset or '
+                         'cutoff?).')
+
+    # structures with every consensus contact (bits as numpy.packbits)
+    bitmap = np.zeros((n, (len(pdb_ids) + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(bitmap, (contact_rows, structure // 8),
+                     (128 >> (structure % 8)).astype(np.uint8))
+    order = np.lexsort((contact_rows, structure))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(
+        structure, minlength=len(pdb_ids)))])
+
+    referenced = ~np.isnan(np.concatenate([ref_A, ref_B]))
+    position_keys, position_rows = _sorted_keys(
+        np.concatenate([pos_A, pos_B]), np.concatenate([rows, rows]))
+    reference_keys, reference_rows = _sorted_keys(
+        np.concatenate([ref_A, ref_B])[referenced].astype(np.int64),
+        np.concatenate([rows, rows])[referenced])
+    conservation_keys, conservation_rows = _sorted_keys(
+        consensus_nw.conservation.values.astype(np.float64), rows)
+    return {'version': np.array(INDEX_VERSION),
+            'alignment_pos_A': pos_A.astype(np.int32),
+            'alignment_pos_B': pos_B.astype(np.int32),
+            'contact_num': consensus_nw.contact_num.values.astype(np.int32),
+            'conservation': consensus_nw.conservation.values.astype(
+                np.float64),
+            'ref_pdb_A': ref_A, 'ref_pdb_B': ref_B,
+            'pair_keys': pair_keys, 'pair_rows': pair_rows,
+            'position_keys': position_keys, 'position_rows': position_rows,
+            'reference_keys': reference_keys,
+            'reference_rows': reference_rows,
+            'conservation_keys': conservation_keys,
+            'conservation_rows': conservation_rows,
+            'pdb_ids': np.array(pdb_ids, dtype='U'), 'bitmap': bitmap,
+            'structure_offsets': offsets.astype(np.int64),
+            'structure_rows': contact_rows[order].astype(np.int64),
+            'structure_pdb_A': mapped.pdb_A.values.astype(np.int32)[order],
+            'structure_pdb_B': mapped.pdb_B.values.astype(np.int32)[order]}
+
+
+def save_index(arrays, path):
+    '''writes the index (see build_index) to a directory (replaced if it
+    exists)'''
+    tmp = '%s.%s.tmp' % (path.rstrip('/'), os.getpid())
+    os.makedirs(tmp)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(tmp, '%s.npy' % name), arrays[name])
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp, path)
+
+
+class ContactIndex(object):
+    '''Queries of a consensus network (see docstring); all queries return
+    the matching consensus contacts as dataframe (columns as the consensus
+    network, in its order)'''
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def __len__(self):
+        '''number of consensus contacts'''
+        return len(self.arrays['contact_num'])
+
+    @property
+    def pdb_ids(self):
+        return [str(pdb_id) for pdb_id in self.arrays['pdb_ids']]
+
+    def _rows(self, name, low, high=None):
+        '''rows with keys from low to high (default: low) in the key array
+        <name>_keys'''
+        keys = self.arrays['%s_keys' % name]
+        start = np.searchsorted(keys, low, 'left')
+        end = np.searchsorted(keys, low if high is None else high, 'right')
+        return np.unique(self.arrays['%s_rows' % name][start:end])
+
+    def _pair_rows(self, i, j):
+        '''consensus contacts of the alignment positions i and j (both
+        orders)'''
+        positions = self.arrays['position_keys']
+        size = int(positions[-1]) + 1 if len(positions) else 0  # as the keys
+        if not (0 <= i < size and 0 <= j < size):
+            return np.zeros(0, dtype=np.int64)
+        keys = self.arrays['pair_keys']
+        rows = []
+        for key in set([i * size + j, j * size + i]):
+            found = np.searchsorted(keys, key)
+            if found < len(keys) and keys[found] == key:
+                rows.append(self.arrays['pair_rows'][found])
+        return np.array(sorted(rows), dtype=np.int64)
+
+    def table(self, rows):
+        '''IN: consensus contacts (indices)
+        OUT: dataframe of these contacts'''
+        rows = np.asarray(rows, dtype=np.int64)
+        table = pd.DataFrame(
+            dict([(column, np.asarray(self.arrays[column][rows])) for column
+                  in consensus.CONSENSUS_COLUMNS]),
+            columns=consensus.CONSENSUS_COLUMNS)
+        for column in ['ref_pdb_A', 'ref_pdb_B']:
+            table[column] = table[column].astype('Int32')
+        return table
+
+    def pair(self, i, j):
+        '''contact of the alignment positions i and j'''
+        return self.table(self._pair_rows(i, j))
+
+    def position(self, position):
+        '''all contacts of an alignment position'''
+        return self.table(self._rows('position', position))
+
+    def reference_residue(self, ref_pdb):
+        '''all contacts of a residue (PDB-number) of the reference
+        structure'''
+        return self.table(self._rows('reference', ref_pdb))
+
+    def conserved(self, min_conservation, max_conservation=np.inf):
+        '''all contacts with a conservation in this range'''
+        return self.table(self._rows('conservation', min_conservation,
+                                     max_conservation))
+
+    def structures(self, i, j):
+        '''OUT: PDB-IDs of the structures with a contact of the alignment
+        positions i and j'''
+        n_structures = len(self.arrays['pdb_ids'])
+        has_contact = np.zeros(n_structures, dtype=bool)
+        for row in self._pair_rows(i, j):
+            has_contact |= np.unpackbits(
+                self.arrays['bitmap'][row])[:n_structures].astype(bool)
+        return [str(pdb_id) for pdb_id in
+                np.asarray(self.arrays['pdb_ids'])[has_contact]]
+
+    def structure(self, pdb_id):
+        '''all contacts of a structure, with the PDB-numbers of its residues
+        (columns pdb_A and pdb_B)'''
+        pdb_ids = self.arrays['pdb_ids']
+        i = np.searchsorted(pdb_ids, pdb_id)
+        if i == len(pdb_ids) or pdb_ids[i] != pdb_id:
+            raise KeyError('%s is not in the index' % pdb_id)
+        contacts = slice(self.arrays['structure_offsets'][i],
+                         self.arrays['structure_offsets'][i + 1])
+        table = self.table(self.arrays['structure_rows'][contacts])
+        for column in ['pdb_A', 'pdb_B']:
+            table[column] = np.asarray(
+                self.arrays['structure_%s' % column][contacts])
+        return table
+
+
+def load_index(path):
+    '''IN: directory of an index (see save_index)
+    OUT: ContactIndex (arrays memory-mapped)'''
+    arrays = dict([(name, np.load(os.path.join(path, '%s.npy' % name),
+                                  mmap_mode='r'))
+                   for name in INDEX_ARRAYS])
+    if int(arrays['version']) != INDEX_VERSION:
+        raise ValueError('%s: contact index of an other version (%s, '
+                         'expected: %s)' % (path, int(arrays['version']),
+                                            INDEX_VERSION))
+    return ContactIndex(arrays)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest='command')
+    build_parser = subparsers.add_parser('build', help='Create the index')
+    build_parser.add_argument('consensus_network', help='Consensus network '
+                              '(csv- or feather-file written by '
+                              'calculate_consensus_network.py)')
+    build_parser.add_argument('mapped_networks', help='Mapped networks '
+                              '(csv- or feather-file written by '
+                              'calculate_consensus_network.py)')
+    build_parser.add_argument('index', help='Directory of the index '
+                              '(replaced if it exists)')
+    build_parser.add_argument('--cutoff', type=float, default=None,
+                              help='Distance cutoff of the consensus network '
+                              '(only if several cutoffs were used). '
+                              'Default: all contacts')
+    query_parser = subparsers.add_parser('query', help='Query the index')
+    query_parser.add_argument('index', help='Directory of the index')
+    query = query_parser.add_mutually_exclusive_group(required=True)
+    query.add_argument('--pair', nargs=2, type=int, metavar=('I', 'J'),
+                       help='Contact of two alignment positions')
+    query.add_argument('--position', type=int, help='All contacts of an '
+                       'alignment position')
+    query.add_argument('--reference-residue', type=int, help='All contacts '
+                       'of a residue (PDB-number) of the reference structure')
+    query.add_argument('--min-conservation', type=float, help='All contacts '
+                       'with at least this conservation')
+    query.add_argument('--structure', help='All contacts of a structure '
+                       '(PDB-ID), with its PDB-residue numbers')
+    query.add_argument('--structures-with', nargs=2, type=int,
+                       metavar=('I', 'J'), help='PDB-IDs of the structures '
+                       'with a contact of two alignment positions')
+    query_parser.add_argument('--output', default=None, help='Write the '
+                              'contacts to this file (csv or feather) '
+                              'instead of printing them')
+    try:
+        args = parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+    return args
+
+
+def run_query(index, args):
+    '''OUT: result of the query given by the arguments'''
+    if args.pair is not None:
+        return index.pair(*args.pair)
+    if args.position is not None:
+        return index.position(args.position)
+    if args.reference_residue is not None:
+        return index.reference_residue(args.reference_residue)
+    if args.min_conservation is not None:
+        return index.conserved(args.min_conservation)
+    if args.structures_with is not None:
+        return index.structures(*args.structures_with)
+    return index.structure(args.structure)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.command == 'build':
+        mapped_nw = network_io.read_table(args.mapped_networks)
+        if args.cutoff is not None and 'min_dist' not in mapped_nw.columns:
+            sys.exit('Distance cutoff given, but the mapped networks have no '
+                     'column "min_dist".')
+        try:
+            # (conservation as in the file, not rounded to 32 bit)
+            arrays = build_index(network_io.read_table(
+                args.consensus_network, exact=True), mapped_nw, args.cutoff)
+        except ValueError as error:
+            sys.exit(str(error))
+        save_index(arrays, args.index)
+        print('Index of %s consensus contacts (%s structures) written to %s'
+              % (len(arrays['contact_num']), len(arrays['pdb_ids']),
+                 args.index))
+        return
+
+    try:
+        result = run_query(load_index(args.index), args)
+    except KeyError as error:
+        sys.exit(error.args[0])
+    if isinstance(result, list):  # PDB-IDs
+        if args.output:
+            with open(args.output, 'w') as outfile:
+                outfile.write(''.join(['%s\n' % pdb_id for pdb_id in result]))
+        else:
+            print('\n'.join(result))
+    elif args.output:
+        network_io.write_table(result, args.output, **consensus.CSV_OPTIONS)
+    else:
+        result.to_csv(sys.stdout, index=False, **consensus.CSV_OPTIONS)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Conversion of the tables written by the analysis (raw networks, mapping,
+mapped networks, consensus network) between the file formats csv and feather.
+Typically used to export a binary feather-file to a csv-file, e.g.:
+python export_table.py results/consensus_network.feather consensus_network.csv
+
+The file formats are recognised by the file extensions. See 'network_io.py'
+for more information. csv-files are written as the tables of the analysis
+(missing values as 'NA', see 'consensus.py').
+------------------------------------------------------------------------------
+'''
+
+import argparse
+import sys
+import consensus
+import network_io
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('infile', help='Table to convert (.csv or .feather)')
+    parser.add_argument('outfile', help='Output file (.csv or .feather)')
+    parser.add_argument('--columns', nargs='+', default=None, help='Export '
+                        'only these columns (default: all columns)')
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    table = network_io.read_table(args.infile, args.columns)
+    network_io.write_table(table, args.outfile, **consensus.CSV_OPTIONS)
+    print('%s rows written to %s' % (len(table), args.outfile))
+
+
+if __name__ == '__main__':
+    main()
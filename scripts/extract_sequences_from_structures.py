@@ -22,6 +22,23 @@ calculation and puts them in the newly created directory 'processed_pdb_files'.
 Provide the path to this directory as first argument.
 2) Name of the output file (optional).
 
+OUTPUT:
+fasta-file with one sequence per PDB-file (in order of the filenames).
+With the option '--residues FILE', additionally a table of all residues of
+every structure (csv- or feather-file, see 'network_io.py'): filename,
+residue number (starting at 1), PDB-residue number, amino acid. It can be
+passed to 'map_networks.py' (option '--residues') which then takes the
+residues from the table instead of reading the structures again.
+
+SPEED:
+The files are read in parallel (option '--jobs'). By default, the sequence is
+that of Bio.PDB.PPBuilder (all standard amino acids bound to a neighbouring
+amino acid, see structure_io.py). With the option '--fast', only the atom
+records are scanned and every standard amino acid is translated with a lookup
+table (three letter code -> one letter code), without checking the peptide
+bonds: the sequences only differ for residues without a peptide bond to any
+neighbour (e.g. a single residue between two chain breaks).
+
 NOTE:
 There are two ways of creating a reference alignment.
 1) Use structure alignment (e.g. with MUSTANG). Obviously, the exact same
@@ -36,39 +53,100 @@ extracted sequences can be aligned to create the reference alignment.
 import os
 import sys
 import argparse
-from Bio import PDB
+import numpy as np
+import pandas as pd
+import metrics
+import network_io
+import structure_io
+import workers
+
 
+args = None  # arguments (used by the worker processes)
+RESIDUE_COLUMNS = ['filename', 'resnum', 'pdb', 'aa']
 
-parser = argparse.ArgumentParser()
-parser.add_argument('processed_pdb_dir', help='Directory with PDB-structures. '
-                    'Only structure with exactly one chain will be accepted. '
-                    'It is recommended to run the script "process_pdb.py" and '
-                    'use the output ("processed_pdb_files") as input here.')
-parser.add_argument('outfile_name', nargs='?',type=str,
-                    const='PDB_sequences.fa', default='PDB_sequences.fa',
-                    help='Name of the output file (optional)')
-try:
-    args = parser.parse_args()
-except:
-    parser.print_help()
-    sys.exit(1)
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('processed_pdb_dir', help='Directory with '
+                        'PDB-structures. Only structure with exactly one '
+                        'chain will be accepted. It is recommended to run the '
+                        'script "process_pdb.py" and use the output '
+                        '("processed_pdb_files") as input here.')
+    parser.add_argument('outfile_name', nargs='?',type=str,
+                        const='PDB_sequences.fa', default='PDB_sequences.fa',
+                        help='Name of the output file (optional)')
+    parser.add_argument('--fast', action='store_true', help='Translate all '
+                        'standard residues of the atom records without '
+                        'checking the peptide bonds (see docstring)')
+    parser.add_argument('--residues', default=None, help='Also write the '
+                        'residues of every structure to this file (.csv or '
+                        '.feather, see docstring)')
+    structure_io.add_parser_arguments(parser)
+    workers.add_jobs_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
 
 
 def write_pdb_seq_to_file(pdb_file):
     '''IN: (path to) PDB-file with only one chain
-    OUT: sequence of PDB-file (from actual structure, not header)'''
-    struct = PDB.PDBParser().get_structure('current', pdb_file)
-    assert len(list(struct.get_chains())) == 1, \
+    OUT: sequence of PDB-file (from actual structure, not header),
+    PDB-residue numbers and residue names of all residues
+    Note: executed in the worker processes'''
+    if args.fast:
+        chains, res_number, res_name = structure_io.scan_residues(pdb_file)
+        n_chains = len(set(chains))
+        sequence = ''.join([structure_io.THREE_TO_ONE.get(name.upper(), '')
+                            for name in res_name])
+    else:
+        structure = structure_io.load_structure(
+            pdb_file, args.parser, name='current').select_model(0)
+        n_chains = len(structure.chains())
+        res_number, res_name = structure.res_number, structure.res_name
+        # all peptides (as Bio.PDB.PPBuilder)
+        sequence = structure.sequence()
+    assert n_chains == 1, \
         'WARINING: There are more than one chains in structure %s. \
-        \n It will be excluded from analysis.' % struct.get_id()
-    seq = ''
-    for pp in PDB.PPBuilder().build_peptides(struct):
-        seq += pp.get_sequence()
-    return seq
-
-
-with open(args.outfile_name, 'w') as outfile:
-    for filename in os.listdir(args.processed_pdb_dir):
-        sequence = write_pdb_seq_to_file(os.path.join(args.processed_pdb_dir,
-                                                      filename))
-        outfile.write('>%s\n%s\n' % (filename, sequence))
+        \n It will be excluded from analysis.' % pdb_file
+    metrics.record(residues=len(res_number))
+    return sequence, res_number, res_name
+
+
+def residue_table(filename, res_number, res_name):
+    '''OUT: residues of a structure (dataframe, see docstring)'''
+    return pd.DataFrame({'filename': filename,
+                         'resnum': np.arange(1, len(res_number) + 1),
+                         'pdb': res_number, 'aa': res_name},
+                        columns=RESIDUE_COLUMNS)
+
+
+def main(argv=None):
+    global args
+    args = parse_arguments(argv)
+    run = metrics.StageMetrics.from_args('extract_sequences', args)
+    filenames = sorted(os.listdir(args.processed_pdb_dir))  # fixed order
+    paths = [os.path.join(args.processed_pdb_dir, filename)
+             for filename in filenames]
+    residues = []
+    with open(args.outfile_name, 'w') as outfile:
+        for filename, (sequence, res_number, res_name) in zip(
+                filenames, run.map(write_pdb_seq_to_file, paths, args.jobs,
+                                   args.chunksize)):
+            outfile.write('>%s\n%s\n' % (filename, sequence))
+            if args.residues:
+                residues.append(residue_table(filename, res_number,
+                                              res_name))
+    if args.residues:
+        with run.section('write_residues'):
+            table = pd.concat(residues, ignore_index=True) if residues \
+                else pd.DataFrame(columns=RESIDUE_COLUMNS)
+            network_io.write_table(network_io.set_column_types(table),
+                                   args.residues)
+    run.close()
+
+
+if __name__ == '__main__':
+    main()
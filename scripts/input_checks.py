@@ -0,0 +1,79 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Results of the checks of the PDB-files by 'check_data.py', stored so that
+unchanged files are not checked again. Used by 'check_data.py' and
+'process_pdb.py' (which skips files known to be invalid without reading
+them).
+
+LOG FILE ('results/checked_pdb_files.tsv', tab-separated, one line per file):
+path, size, modification time, check ('scan' or 'full'), problem (empty if
+the file is valid)
+An entry is only used while the size and the modification time of the file
+are unchanged. The result of a full check is also used for a scan, but not
+vice versa.
+------------------------------------------------------------------------------
+'''
+
+import os
+
+CHECK_LOG = 'results/checked_pdb_files.tsv'
+CHECKS = ['scan', 'full']  # in order of thoroughness
+
+
+def file_signature(path):
+    '''size and modification time of a file (as in the log)'''
+    stat = os.stat(path)
+    return str(stat.st_size), repr(stat.st_mtime)
+
+
+def read_check_log(path=CHECK_LOG):
+    '''OUT: dictionary: path of the PDB-file -> (size, modification time,
+    check, problem)'''
+    entries = {}
+    if os.path.exists(path):
+        with open(path) as infile:
+            for line in infile:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 5:  # (the last line may be incomplete)
+                    entries[fields[0]] = tuple(fields[1:])
+    return entries
+
+
+def write_check_log(entries, path=CHECK_LOG):
+    '''IN: dictionary (see read_check_log), path of the log'''
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path + '.tmp', 'w') as outfile:
+        for pdb_path in sorted(entries):
+            outfile.write('\t'.join((pdb_path,) + entries[pdb_path]) + '\n')
+    os.rename(path + '.tmp', path)
+
+
+def known_result(entries, pdb_path, check='scan'):
+    '''IN: log entries, path of the PDB-file, check which would be done
+    OUT: logged problem of the file ('' if valid), None if the file has to be
+    checked (again)'''
+    entry = entries.get(pdb_path)
+    if entry is None or CHECKS.index(entry[2]) < CHECKS.index(check):
+        return None
+    try:
+        if file_signature(pdb_path) != entry[:2]:
+            return None
+    except OSError:
+        return None
+    return entry[3]
+
+
+def known_problems(directory, path=CHECK_LOG):
+    '''IN: directory of the PDB-files, path of the log
+    OUT: dictionary: filename -> problem of all unchanged files which are
+    known to be invalid'''
+    entries = read_check_log(path)
+    problems = {}
+    for filename in os.listdir(directory):
+        problem = known_result(entries, os.path.join(directory, filename))
+        if problem:
+            problems[filename] = problem
+    return problems
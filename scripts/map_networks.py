@@ -14,7 +14,7 @@ csv-file: PDB-ID, residue number (always starting at 1), PDB-residue number
 number of the reference structure
 Example:
 pdb_id,resnum,pdb,alignment_pos,aa,ref_pdb
-1gwn,2.0,23.0,16.0,LYS,19.0
+1gwn,2,23,16,LYS,19
 The second residue in 1gwn.pdb (a lysine) has the number 23 in the PDB-file.
 In the reference alignment, this residue is at position 16.
 The equivalent residue in the reference structure (in this case 1g16) has
@@ -32,88 +32,158 @@ needed, any random structure from the dataset can be defined as reference-
 structure and the column 'ref_pdb' in the results can simply be ignored.
 
 NOTE2:
-The data-type of the residue numbers in the output csv-file are provided as
-floats rather than integers as one would intuitively expect. This is due to
-the fact, that there is no 'NA' for integers in pandas. As 'NA'-values may
-(if there is no structurally equivalent residue in the reference structure),
-residue numbers cannot be converted to integers.
+Residue numbers are integers with missing values ('NA', pandas type 'Int32'),
+written as empty fields in the csv-file. A missing value in 'ref_pdb' means
+that there is no structurally equivalent residue in the reference structure.
+A missing value in 'alignment_pos' means that the structure has more residues
+than its sequence in the reference alignment.
+
+NOTE3:
+The mapping itself is done by 'mapping.py' (also used by the in-process
+interface 'contact_calculator.py'). The reference alignment is read only
+once. For each structure, the alignment
+positions of its residues are taken from the non-gap columns of its aligned
+sequence, and all structures are combined into one table at the end.
+With the option '--residues', the residues of the structures are taken from
+the residue table written by 'extract_sequences_from_structures.py
+--residues' (from the same processed PDB-files) instead of reading the
+structures; structures which are not in the table are read as usual (they
+are listed at the end and counted as 'structures_read' in the metrics, so a
+run with a complete residue table reads no PDB-file).
 ------------------------------------------------------------------------------
 '''
 
 import argparse
 import sys
 import os
-import pandas as pd
-from Bio import SeqIO
-from Bio import PDB
-
-parser = argparse.ArgumentParser()
-parser.add_argument('processed_pdb_dir', help='Directory with processed '
-                    'PDB-structures for calculation of residue contact '
-                    'network')
-parser.add_argument('reference_alignment', help='Alignment of the sequences '
-                    'of the structures for which residue contact networks '
-                    'were created. See the documentation for information '
-                    'about the requirements of such an alignment')
-parser.add_argument('reference_structure', help='For all residues, the '
-                    'equivalent residues (PDB-numbering) in the reference '
-                    'structure will be provided. Just provide the PDB-ID of '
-                    'your favourite structure of the dataset.')
-try:
-    args = parser.parse_args()
-except:
-    parser.print_help()
-    sys.exit(1)
-
-
-def map_to_alignment(alignment, sequence_id):
-    '''IN: multiple sequence alingment (fasta), identifier of one sequence
-    OUT: referenc list: residue number as index, alignment position as value'''
-    id2seq = SeqIO.to_dict(SeqIO.parse(alignment, 'fasta'))
-    alignment_positions = list(id2seq[sequence_id])
-    ref_list = []
-    for i in range(len(alignment_positions)):
-        if alignment_positions[i] != '-':
-            ref_list.append(i + 1)
-    return(ref_list)
-
-
-def map_to_reference_structure(mapping_df, reference_struct):
-    '''IN: pandas dataframe of all structures mapped to alingment position,
-           reference structure (included in the dataframe)
-    OUT: same dataframe with added columns: reference structure position'''
-    ref_df = mapping_df[mapping_df.pdb_id == reference_struct][['pdb',
-        'alignment_pos']]
-    ref_df.columns = ['ref_pdb', 'alignment_pos']
-    mapping_df = pd.merge(mapping_df, ref_df, on='alignment_pos', how='left')
-    mapping_df = mapping_df.sort_index(by=['pdb_id', 'resnum'])
-    mapping_df = mapping_df.reset_index(drop=True)
-    return mapping_df
-
-id2seq = SeqIO.to_dict(SeqIO.parse(args.reference_alignment, 'fasta'))
-mapping = pd.DataFrame(columns = ['pdb_id', 'resnum', 'pdb', 'alignment_pos',
-                                  'aa'])
-for filename in os.listdir(args.processed_pdb_dir):
+import numpy as np
+import mapping
+import metrics
+import network_io
+import structure_io
+import workers
+
+# arguments, alignment and residue table (used by the worker processes)
+args = None
+id2seq = {}
+residues = {}  # filename -> PDB-residue numbers, residue names
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('processed_pdb_dir', help='Directory with processed '
+                        'PDB-structures for calculation of residue contact '
+                        'network')
+    parser.add_argument('reference_alignment', help='Alignment of the '
+                        'sequences of the structures for which residue '
+                        'contact networks were created. See the '
+                        'documentation for information about the '
+                        'requirements of such an alignment')
+    parser.add_argument('reference_structure', help='For all residues, the '
+                        'equivalent residues (PDB-numbering) in the '
+                        'reference structure will be provided. Just provide '
+                        'the PDB-ID of your favourite structure of the '
+                        'dataset.')
+    parser.add_argument('--format', choices=['csv', 'feather'],
+                        default='csv', help='File format of the output '
+                        '"results/mapping": csv or feather (binary, requires '
+                        'pyarrow). Default: csv')
+    parser.add_argument('--residues', default=None, help='Residue table of '
+                        'the structures written by '
+                        '"extract_sequences_from_structures.py --residues" '
+                        '(see docstring)')
+    structure_io.add_parser_arguments(parser)
+    workers.add_jobs_arguments(parser)
+    workers.add_keep_going_argument(parser)
+    metrics.add_metrics_arguments(parser)
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+
+
+def map_file(filename):
+    '''IN: pdb-filename (in the input directory)
+    OUT: PDB-ID, arrays of PDB-residue numbers, amino acids and alignment
+    positions (see mapping.residue_positions), or None if the structure is
+    not in the alignment; True if the PDB-file was read (structure not in
+    the residue table)
+    Note: executed in the worker processes'''
     pdbID = filename.split('.')[0]
-    if filename not in id2seq.keys():
-        print('%s: ignored - not in reference alignment' % pdbID)
-        continue
-    parser = PDB.PDBParser()
-    struct = parser.get_structure(pdbID, os.path.join(args.processed_pdb_dir,
-                                                      filename))
-    res_list = list(struct.get_residues())
-    alignment_ref_list = map_to_alignment(args.reference_alignment, filename)
-    for i in range(0, len(res_list)):
-        mapping = mapping.append({'pdb_id': pdbID,
-                                  'resnum': (i + 1),
-                                  'pdb': res_list[i].id[1],
-                                  'alignment_pos': alignment_ref_list[i],
-                                  'aa': res_list[i].resname},
-                                  ignore_index=True)
-    print('%s: mapped' % pdbID)
-
-mapping = map_to_reference_structure(mapping, args.reference_structure)
-
-# WRITE MAPPING FILE
-mapping.to_csv('results/mapping.csv', index=False)
+    if filename not in id2seq:
+        return pdbID, None, False
+    if filename in residues:
+        res_number, res_name = residues[filename]
+        metrics.record(residues=len(res_number))
+        return pdbID, mapping.table_positions(res_number, res_name,
+                                              id2seq[filename]), False
+    structure = structure_io.load_structure(
+        os.path.join(args.processed_pdb_dir, filename), args.parser)
+    metrics.record(atoms=len(structure), residues=structure.n_residues,
+                   structures_read=1)
+    return pdbID, mapping.residue_positions(structure, id2seq[filename]), \
+        True
+
+
+def read_residues(path):
+    '''IN: path of a residue table (see
+    extract_sequences_from_structures.py)
+    OUT: dictionary: filename -> arrays of PDB-residue numbers and residue
+    names (in order of the residues)'''
+    table = network_io.read_table(path)
+    table = table.sort_values(by=['filename', 'resnum'], kind='mergesort')
+    filenames = table.filename.astype(str).values
+    pdb = table.pdb.values.astype(int)
+    aa = table.aa.astype(str).values
+    bounds = np.concatenate([[0], np.nonzero(filenames[1:] !=
+                                             filenames[:-1])[0] + 1,
+                             [len(filenames)]]) if len(filenames) else [0]
+    return dict([(filenames[start], (pdb[start:end], aa[start:end]))
+                 for start, end in zip(bounds[:-1], bounds[1:])])
+
+
+def main(argv=None):
+    global args, id2seq, residues
+    args = parse_arguments(argv)
+    run = metrics.StageMetrics.from_args('map_networks', args)
+    with run.section('read_alignment'):
+        id2seq = mapping.read_alignment(args.reference_alignment)
+    if args.residues:
+        with run.section('read_residues'):
+            residues = read_residues(args.residues)
+    mapped = []  # PDB-ID and residue positions of every mapped structure
+    read = []  # structures read from the PDB-files
+    filenames = sorted(os.listdir(args.processed_pdb_dir))  # fixed order
+    for result in run.map(workers.guard(map_file, args.keep_going),
+                          filenames, args.jobs, args.chunksize):
+        if workers.failed(result, 'map_networks'):
+            continue
+        pdbID, positions, structure_read = result
+        if structure_read:
+            read.append(pdbID)
+        if positions is None:
+            print('%s: ignored - not in reference alignment' % pdbID)
+            continue
+        if np.isnan(positions[2]).any():
+            print('%s: warning - more residues than in the reference '
+                  'alignment' % pdbID)
+        mapped.append((pdbID, positions))
+        print('%s: mapped' % pdbID)
+    if args.residues and read:
+        print('Note: %s structures are not in the residue table and were '
+              'read from the PDB-files: %s' % (len(read), ' '.join(read)))
+
+    with run.section('reference_structure'):
+        table = mapping.mapping_table(mapped, args.reference_structure)
+
+    # WRITE MAPPING FILE
+    with run.section('write'):
+        network_io.write_table(table, network_io.table_path(
+            'results', 'mapping', args.format))
+    run.add(residues_mapped=len(table))
+    run.close()
+
 
+if __name__ == '__main__':
+    main()
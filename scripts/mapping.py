@@ -0,0 +1,99 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Mapping of the residues of the structures to the positions of the reference
+alignment and to the equivalent residues of the reference structure. Used by
+'map_networks.py' (see there for the output) and 'contact_calculator.py'.
+
+The alignment positions of the residues of a structure are the non-gap
+columns of its aligned sequence (residue i: i-th non-gap column). The
+equivalent residue in the reference structure of every residue is the
+residue of the reference structure at the same alignment position.
+------------------------------------------------------------------------------
+'''
+
+import numpy as np
+import pandas as pd
+import network_io
+
+COLUMNS = ['pdb_id', 'resnum', 'pdb', 'alignment_pos', 'aa']
+
+
+def read_alignment(path):
+    '''IN: path of the reference alignment (fasta-file)
+    OUT: dictionary: sequence name (e.g. '1g16.pdb') -> aligned sequence'''
+    from Bio import SeqIO
+    return dict([(record.id, str(record.seq)) for record in
+                 SeqIO.parse(path, 'fasta')])
+
+
+def map_to_alignment(aligned_sequence):
+    '''IN: aligned sequence (string, gaps: '-')
+    OUT: array: residue number - 1 as index, alignment position as value'''
+    sequence = np.array(list(aligned_sequence))
+    return np.nonzero(sequence != '-')[0] + 1
+
+
+def residue_positions(structure, aligned_sequence):
+    '''IN: structure (see structure_io.py), its aligned sequence
+    OUT: arrays of PDB-residue numbers, amino acids and alignment positions
+    (NaN if the residue is not in the aligned sequence); residues of the first
+    model only (as the contacts, see calculate_networks.py)'''
+    structure = structure.select_model(0)
+    return table_positions(structure.res_number, structure.res_name,
+                           aligned_sequence)
+
+
+def table_positions(res_number, res_name, aligned_sequence):
+    '''IN: PDB-residue numbers and residue names of all residues of a
+    structure (e.g. from the residue table of
+    'extract_sequences_from_structures.py'), its aligned sequence
+    OUT: see residue_positions'''
+    positions = map_to_alignment(aligned_sequence)
+    alignment_pos = np.empty(len(res_number))
+    alignment_pos[:] = np.nan
+    n = min(len(positions), len(res_number))
+    alignment_pos[:n] = positions[:n]
+    return (np.asarray(res_number).astype(int),
+            np.asarray(res_name).astype(str), alignment_pos)
+
+
+def map_to_reference_structure(mapping_df, reference_struct):
+    '''IN: pandas dataframe of all structures mapped to alingment position,
+           reference structure (included in the dataframe)
+    OUT: same dataframe with added columns: reference structure position'''
+    ref_df = mapping_df[mapping_df.pdb_id == reference_struct]
+    ref_df = ref_df[ref_df.alignment_pos.notnull()]
+    # alignment position -> PDB-number in the reference structure
+    lookup = np.empty(int(mapping_df.alignment_pos.max()) + 1
+                      if mapping_df.alignment_pos.notnull().any() else 1)
+    lookup[:] = np.nan
+    lookup[ref_df.alignment_pos.values.astype(int)] = ref_df.pdb.values
+    positions = mapping_df.alignment_pos.values
+    mapped = ~np.isnan(positions)
+    ref_pdb = np.empty(len(mapping_df))
+    ref_pdb[:] = np.nan
+    ref_pdb[mapped] = lookup[positions[mapped].astype(int)]
+    mapping_df['ref_pdb'] = ref_pdb
+    mapping_df = mapping_df.sort_values(by=['pdb_id', 'resnum'],
+                                        kind='mergesort')
+    mapping_df = mapping_df.reset_index(drop=True)
+    return mapping_df
+
+
+def mapping_table(residues, reference_struct):
+    '''IN: list of (PDB-ID, residue arrays, see residue_positions), PDB-ID of
+    the reference structure
+    OUT: mapping (dataframe with compact column types, see network_io.py)'''
+    parts = dict([(column, []) for column in COLUMNS])
+    for pdb_id, (pdb, aa, alignment_pos) in residues:
+        parts['pdb_id'].append(np.repeat(pdb_id, len(pdb)).astype(object))
+        parts['resnum'].append(np.arange(1, len(pdb) + 1))
+        parts['pdb'].append(pdb)
+        parts['alignment_pos'].append(alignment_pos)
+        parts['aa'].append(aa.astype(object))
+    mapping = pd.DataFrame(dict([(column, np.concatenate(parts[column]) if
+                                  parts[column] else [])
+                                 for column in COLUMNS]), columns=COLUMNS)
+    mapping = map_to_reference_structure(mapping, reference_struct)
+    return network_io.set_column_types(mapping)
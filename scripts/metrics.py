@@ -0,0 +1,230 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Instrumentation of the scripts of the analysis: wall time, CPU time and peak
+memory of every stage and of every structure, together with counts reported
+by the code itself (atoms, residues, candidate and accepted residue pairs,
+cache hits, ...). Used by all scripts which process the PDB-files one by one
+and by the consensus scripts.
+
+OUTPUT:
+With the option '--metrics FILE', one json-object per line is appended to the
+file (all stages of a run can write to the same file):
+{"type": "structure", "stage": ..., "item": <filename>, "wall_s": ...,
+ "cpu_s": ..., "peak_rss_mb": ..., <counts reported by record()>}
+{"type": "section", "stage": ..., "section": <name>, "wall_s": ...,
+ "cpu_s": ...}
+{"type": "stage", "stage": ..., "items": ..., "wall_s": ..., "cpu_s": ...,
+ "peak_rss_mb": ..., "pid": ..., "start": <date>, <totals>}
+CPU time and peak memory of a stage include its worker processes. The peak
+memory of a structure is that of the process which calculated it.
+With the option '--profile N', the cProfile statistics of the N slowest
+structures are written to the directory '--profile-dir' (one file per
+structure, '<stage>.<item>.prof', readable with pstats), with or without
+'--metrics'.
+
+NOTE:
+Counts are reported with record(...) from anywhere in the code which runs
+for a structure (also in the worker processes). Outside of a measured call,
+record does nothing, so the instrumented functions can also be used without
+metrics.
+------------------------------------------------------------------------------
+'''
+
+import cProfile
+import datetime
+import heapq
+import json
+import marshal
+import os
+import resource
+import time
+import workers
+
+DEFAULT_PROFILE_DIR = 'results/profiles'
+
+_current = None  # counts of the structure being measured (see record)
+
+
+def add_metrics_arguments(parser):
+    '''adds the options --metrics, --profile and --profile-dir to an argparse
+    parser'''
+    parser.add_argument('--metrics', default=None, help='Append wall time, '
+                        'CPU time, peak memory and counts of this stage and '
+                        'of every structure to this file (json-lines). '
+                        'Default: no metrics')
+    parser.add_argument('--profile', type=int, default=0, help='Write the '
+                        'cProfile statistics of this many of the slowest '
+                        'structures to --profile-dir. Default: 0')
+    parser.add_argument('--profile-dir', default=DEFAULT_PROFILE_DIR,
+                        help='Directory of the cProfile statistics. Default: '
+                        '%s' % DEFAULT_PROFILE_DIR)
+
+
+def record(**counts):
+    '''adds counts (numbers) to the metrics of the structure being measured;
+    counts reported several times are summed up'''
+    if _current is None:
+        return
+    for name, value in counts.items():
+        _current[name] = _current.get(name, 0) + value
+
+
+def cpu_seconds(children=False):
+    '''user and system time of this process (and of its finished child
+    processes)'''
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    seconds = usage.ru_utime + usage.ru_stime
+    if children:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        seconds += usage.ru_utime + usage.ru_stime
+    return seconds
+
+
+def peak_rss_mb(children=False):
+    '''peak memory (resident set size) of this process (or the largest of
+    this process and its finished child processes) in megabytes'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        peak = max(peak, resource.getrusage(
+            resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 1024.0  # Linux: kilobytes
+
+
+class Measured(object):
+    '''func(item) with its metrics: calling it returns the result, the
+    metrics (dictionary) and the cProfile statistics (None if not profiled)
+    Note: can be sent to the worker processes (if func can)'''
+
+    def __init__(self, func, profile=False):
+        self.func = func
+        self.profile = profile
+
+    def __call__(self, item):
+        global _current
+        _current = {}
+        profiler = cProfile.Profile() if self.profile else None
+        start, start_cpu = time.time(), cpu_seconds()
+        try:
+            if profiler is None:
+                result = self.func(item)
+            else:
+                result = profiler.runcall(self.func, item)
+            counts = _current
+        finally:
+            _current = None
+        metrics = {'wall_s': round(time.time() - start, 6),
+                   'cpu_s': round(cpu_seconds() - start_cpu, 6),
+                   'peak_rss_mb': round(peak_rss_mb(), 1)}
+        metrics.update(counts)
+        stats = None
+        if profiler is not None:
+            profiler.create_stats()
+            stats = profiler.stats
+        return result, metrics, stats
+
+
+class StageMetrics(object):
+    '''metrics of one stage (script run), see docstring; without a metrics
+    file and profiles, only the structures are processed (nothing is
+    measured)'''
+
+    def __init__(self, stage, path=None, profile=0,
+                 profile_dir=DEFAULT_PROFILE_DIR):
+        self.stage = stage
+        self.path = path
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.items = 0
+        self.totals = {}
+        self._slowest = []  # heap of (seconds, item, statistics)
+        self._start = time.time()
+        self._start_cpu = cpu_seconds(children=True)
+        self._date = datetime.datetime.now().isoformat()
+
+    @classmethod
+    def from_args(cls, stage, args):
+        '''IN: name of the stage, arguments (see add_metrics_arguments)'''
+        return cls(stage, args.metrics, args.profile, args.profile_dir)
+
+    def _write(self, kind, fields):
+        line = {'type': kind, 'stage': self.stage}
+        line.update(fields)
+        with open(self.path, 'a') as outfile:
+            outfile.write(json.dumps(line, sort_keys=True) + '\n')
+
+    def map(self, func, items, jobs=1, chunksize=None):
+        '''IN: function, items (e.g. filenames), number of worker processes,
+        number of items per task (see workers.parallel_map)
+        OUT: iterator over the results of func(item) in the order of the
+        items; the metrics of every item are written to the metrics file'''
+        if self.path is None and not self.profile:
+            for result in workers.parallel_map(func, items, jobs, chunksize):
+                yield result
+            return
+        items = list(items)
+        measured = Measured(func, self.profile > 0)
+        for item, (result, metrics, stats) in zip(items, workers.parallel_map(
+                measured, items, jobs, chunksize)):
+            self.items += 1
+            for name, value in metrics.items():
+                if name not in ('wall_s', 'cpu_s', 'peak_rss_mb'):
+                    self.totals[name] = self.totals.get(name, 0) + value
+            metrics['item'] = str(item)
+            if self.path is not None:
+                self._write('structure', metrics)
+            if stats is not None:
+                entry = (metrics['wall_s'], str(item), stats)
+                if len(self._slowest) < self.profile:
+                    heapq.heappush(self._slowest, entry)
+                elif entry[0] > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+            yield result
+
+    def section(self, name):
+        '''context manager: wall and CPU time of a part of the stage (e.g.
+        reading the input) as 'section' record'''
+        return _Section(self, name)
+
+    def add(self, **totals):
+        '''adds numbers to the stage record (e.g. cache hits)'''
+        for name, value in totals.items():
+            self.totals[name] = self.totals.get(name, 0) + value
+
+    def close(self):
+        '''writes the stage record (with a metrics file) and the profiles of
+        the slowest structures'''
+        if self.path is not None:
+            fields = {'items': self.items,
+                      'wall_s': round(time.time() - self._start, 6),
+                      'cpu_s': round(cpu_seconds(children=True) -
+                                     self._start_cpu, 6),
+                      'peak_rss_mb': round(peak_rss_mb(children=True), 1),
+                      'pid': os.getpid(), 'start': self._date}
+            fields.update(self.totals)
+            self._write('stage', fields)
+        if self._slowest and not os.path.exists(self.profile_dir):
+            os.makedirs(self.profile_dir)
+        for seconds, item, stats in self._slowest:
+            path = os.path.join(self.profile_dir, '%s.%s.prof'
+                                % (self.stage, os.path.basename(item)))
+            with open(path, 'wb') as outfile:
+                marshal.dump(stats, outfile)  # as cProfile.dump_stats
+
+
+class _Section(object):
+
+    def __init__(self, stage_metrics, name):
+        self.stage_metrics = stage_metrics
+        self.name = name
+
+    def __enter__(self):
+        self._start, self._start_cpu = time.time(), cpu_seconds()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.stage_metrics.path is not None:
+            self.stage_metrics._write('section', {
+                'section': self.name,
+                'wall_s': round(time.time() - self._start, 6),
+                'cpu_s': round(cpu_seconds() - self._start_cpu, 6)})
@@ -0,0 +1,199 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Reading and writing of the tables passed between the steps of the analysis
+(raw networks, mapping, mapped networks and consensus network).
+
+FILE FORMATS (chosen by the file extension):
+'.csv'     - text, readable by any software
+'.feather' - binary, columnar (Arrow IPC file, requires the module pyarrow).
+             Much faster to read and write than csv-files and stored with
+             compact column types: PDB-IDs and amino acids as categories,
+             residue numbers and alignment positions as (nullable) 32 bit
+             integers, conservation and atomic distances as 32 bit float.
+             The files are written uncompressed and can be memory-mapped:
+             reading only some of the columns does not read the whole
+             file.
+Feather files can be exported to csv-files (and vice versa) with the script
+'export_table.py'.
+
+STREAMING OUTPUT:
+The contacts of each structure are appended to the output file as soon as
+they are calculated (instead of collecting all networks in memory). Thus, the
+memory requirement does not depend on the number of structures. The output is
+sorted if the structures are written in order of their PDB-IDs and the
+contacts of each structure are sorted (as returned by 'contact_engine.py').
+
+NOTE:
+The csv-output is flushed after every structure. If the calculation is
+interrupted (e.g. the process is killed), the file contains all networks
+written so far and can be read as usual. A feather-file is only readable
+after it has been closed.
+------------------------------------------------------------------------------
+'''
+
+import os
+import numpy as np
+import pandas as pd
+
+FORMATS = {'.csv': 'csv', '.feather': 'feather'}
+NETWORK_COLUMNS = ['pdb_id', 'res_A', 'res_B']
+
+# compact column types of all tables ('Int32': integer with missing values)
+COLUMN_TYPES = {'pdb_id': 'category', 'filename': 'category',
+                'res_A': 'int32', 'res_B': 'int32',
+                'resnum': 'Int32', 'pdb': 'Int32', 'alignment_pos': 'Int32',
+                'aa': 'category', 'ref_pdb': 'Int32',
+                'pdb_A': 'Int32', 'alignment_pos_A': 'Int32',
+                'aa_A': 'category', 'ref_pdb_A': 'Int32',
+                'pdb_B': 'Int32', 'alignment_pos_B': 'Int32',
+                'aa_B': 'category', 'ref_pdb_B': 'Int32',
+                'seq_prox': 'int32', 'contact_num': 'int32',
+                'conservation': 'float32', 'min_dist': 'float32',
+                'cutoff': 'float32', 'frames': 'int32',
+                'occupancy': 'float32'}
+
+
+def table_format(path):
+    '''IN: path of a table-file
+    OUT: file format (according to the file extension)'''
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError('Unknown file format "%s" (supported: %s)'
+                         % (extension, ', '.join(sorted(FORMATS))))
+    return FORMATS[extension]
+
+
+def table_path(directory, name, fmt):
+    '''e.g. table_path('results', 'raw_networks', 'feather')'''
+    return os.path.join(directory, '%s.%s' % (name, fmt))
+
+
+def set_column_types(df, exact=False):
+    '''IN: dataframe (any of the tables), True if floating point columns are
+    kept as they are (not converted to 32 bit)
+    OUT: same dataframe with compact column types (see COLUMN_TYPES)'''
+    for column in df.columns:
+        if exact and COLUMN_TYPES.get(column) == 'float32':
+            continue
+        if column in COLUMN_TYPES:
+            df[column] = df[column].astype(COLUMN_TYPES[column])
+    return df
+
+
+def _arrow_column(series):
+    '''pandas series -> pyarrow array of the type given in COLUMN_TYPES'''
+    import pyarrow as pa
+    column_type = COLUMN_TYPES.get(series.name)
+    if column_type == 'category':
+        return pa.array(pd.Categorical(series.astype(str)))
+    if column_type is None:
+        return pa.array(series.values)
+    mask = series.isnull().values
+    if column_type == 'float32':
+        return pa.array(series.fillna(0).values.astype('f4'), mask=mask,
+                        type=pa.float32())
+    return pa.array(series.fillna(0).values.astype('i4'), mask=mask,
+                    type=pa.int32())
+
+
+def read_table(path, columns=None, exact=False):
+    '''IN: path of a table-file, columns to read (optional, default: all),
+    True if floating point values are read in the precision of the file
+    (csv-files: 64 bit, e.g. the conservation of a consensus network)
+    OUT: dataframe with compact column types'''
+    if table_format(path) == 'feather':
+        from pyarrow import feather
+        df = feather.read_table(path, columns=columns,
+                                memory_map=True).to_pandas()
+    else:
+        df = pd.read_csv(path, usecols=columns)
+    return set_column_types(df, exact)
+
+
+def write_table(df, path, **csv_options):
+    '''writes a dataframe to a table-file (format according to extension);
+    csv_options: passed on to DataFrame.to_csv (e.g. na_rep)'''
+    if table_format(path) == 'feather':
+        import pyarrow as pa
+        from pyarrow import feather
+        table = pa.Table.from_arrays([_arrow_column(df[column]) for column
+                                      in df.columns], names=list(df.columns))
+        feather.write_feather(table, path, compression='uncompressed')
+    else:
+        df.to_csv(path, index=False, **csv_options)
+
+
+class NetworkWriter(object):
+    '''Streaming writer for residue contact networks (one contact per line:
+    PDB-ID, residue A, residue B and optionally the minimal atomic distance
+    and further values of the contacts, e.g. their occupancy in the models of
+    a trajectory); csv- or feather-file'''
+
+    def __init__(self, path, min_dist=False, values=()):
+        '''IN: path, True if the minimal distances are written, names of
+        further columns (32 bit integers or floats, see COLUMN_TYPES)'''
+        self.path = path
+        self.format = table_format(path)
+        self.columns = NETWORK_COLUMNS + (['min_dist'] if min_dist else []) \
+            + list(values)
+        self.n_networks = 0
+        self.n_contacts = 0
+        if self.format == 'feather':
+            import pyarrow as pa
+            # one record batch per structure; the PDB-IDs are stored as
+            # strings, read_table turns them into categories
+            self.schema = pa.schema(
+                [('pdb_id', pa.string())] +
+                [(column, pa.int32() if COLUMN_TYPES[column] == 'int32'
+                  else pa.float32()) for column in self.columns[1:]])
+            self.writer = pa.ipc.new_file(path, self.schema)
+        else:
+            # 9 significant digits: exactly the single precision values
+            self.line = '%s,' + ','.join(
+                ['%d' if COLUMN_TYPES[column] == 'int32' else '%.9g'
+                 for column in self.columns[1:]]) + '\n'
+            self.outfile = open(path, 'w')
+            self._write(','.join(self.columns) + '\n')
+
+    def _write(self, text):
+        '''writes a block of lines at once and flushes it'''
+        self.outfile.write(text)
+        self.outfile.flush()
+
+    def write(self, pdb_id, res_a, res_b, min_dist=None, **values):
+        '''IN: PDB-ID, residue numbers A and B of all contacts of a structure
+        (starting at 1), minimal atomic distances (only used if the writer
+        was created with min_dist=True), further values of the writer (e.g.
+        occupancy=...)'''
+        arrays = [res_a, res_b]
+        if 'min_dist' in self.columns:
+            arrays.append(min_dist)
+        arrays += [values[column] for column in
+                   self.columns[len(arrays) + 1:]]
+        arrays = [np.asarray(array, dtype='i4' if COLUMN_TYPES[column] ==
+                             'int32' else 'f4')
+                  for column, array in zip(self.columns[1:], arrays)]
+        if self.format == 'feather':
+            import pyarrow as pa
+            columns = [pa.array([pdb_id] * len(res_a), type=pa.string())] + \
+                [pa.array(array) for array in arrays]
+            self.writer.write_batch(pa.RecordBatch.from_arrays(
+                columns, names=self.columns))
+        else:
+            self._write(''.join([self.line % ((pdb_id,) + row) for row in
+                                 zip(*[list(array) for array in arrays])]))
+        self.n_networks += 1
+        self.n_contacts += len(res_a)
+
+    def close(self):
+        if self.format == 'feather':
+            self.writer.close()
+        else:
+            self.outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
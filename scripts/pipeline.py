@@ -0,0 +1,348 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Driver of the complete analysis (used by 'runall.sh'): runs the scripts of
+all stages one after the other (check_data, process_pdb, calculate_networks,
+map_networks, consensus, export, report) and can be interrupted and restarted
+at any time. The python scripts are run in this process (their function
+main), so the interpreter is started and numpy, pandas and Bio are imported
+only once per analysis; only the commands of the report (R, pandoc) are run
+as separate processes.
+
+USAGE:
+python scripts/pipeline.py test_data/raw_pdb_files \
+    test_data/ras_reference_alignment.fa test_data/pdb_chain_pfam.csv \
+    PF00071 1g16 --jobs 8
+
+CHECKPOINTS:
+When a stage has finished, a marker is written to 'results/.checkpoints'
+('<stage>.json') with a fingerprint of its inputs: the arguments of the
+stage, the files it reads (size and modification time of every file) and
+the scripts of the software. A stage whose marker matches and whose outputs
+exist is skipped; the marker of a stage is removed before the stage is run.
+Thus, after an interruption (or a change of the input data) the analysis is
+simply continued by running the same command again. Within a stage, finished
+structures are not processed again either: process_pdb keeps the processed
+files of unchanged raw files ('--resume'), calculate_networks takes the
+contacts of unchanged structures from the contact cache.
+
+NOTE1:
+The driver never asks for input. Existing results are reused; with the
+option '--force', all stages are run again (and the processed PDB-files are
+written again).
+NOTE2:
+Structures which cannot be processed do not stop the analysis: they are
+listed in 'results/failed_structures.tsv' (stage, file, error) and left out.
+With the option '--strict', the analysis stops at the first such structure.
+NOTE3:
+As all python stages run in one process, the peak memory of a stage in
+'results/metrics.jsonl' is that of the analysis up to and including the
+stage.
+------------------------------------------------------------------------------
+'''
+
+from __future__ import print_function
+import argparse
+import datetime
+import hashlib
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+import workers
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS = 'results'
+CHECKPOINT_DIR = os.path.join(RESULTS, '.checkpoints')
+PROCESSED_PDB_DIR = os.path.join(RESULTS, 'processed_pdb_files')
+METRICS = os.path.join(RESULTS, 'metrics.jsonl')
+
+# arguments (used by the functions below)
+args = None
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_pdb_dir', help='Directory with PDB-structures '
+                        'for calculation of residue contact networks')
+    parser.add_argument('reference_alignment', help='Alignment of the '
+                        'sequences of the structures (see the documentation)')
+    parser.add_argument('sifts_chain_pfam', help='SIFTS-file '
+                        '"pdb_chain_pfam.csv" for finding chains withing the '
+                        'PDB-structures which contain the Pfam-domain of '
+                        'interest')
+    parser.add_argument('pfam_domain', help='Pfam domain of interest')
+    parser.add_argument('reference_structure', help='PDB-ID of the reference '
+                        'structure (equivalent residues of all structures are '
+                        'given in its numbering)')
+    parser.add_argument('--cutoff', nargs='+', default=['5'], help='Atomic '
+                        'distance cutoff(s) in Angstrom (several: one '
+                        'consensus network per cutoff, the first one is the '
+                        'main result). Default: 5')
+    parser.add_argument('--format', choices=['csv', 'feather'], default='csv',
+                        help='Format of the intermediate results: csv or '
+                        'feather (binary, faster; requires pyarrow). '
+                        'Default: csv')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of worker '
+                        'processes (0: one per CPU). Default: 1')
+    parser.add_argument('--trajectory', action='store_true', help='The '
+                        'structures are NMR ensembles or MD trajectories '
+                        '(PDB-files with several models): keep all models and '
+                        'use the contacts present in at least --min-occupancy '
+                        'of them')
+    parser.add_argument('--min-occupancy', default='0.5', help='Minimal '
+                        'fraction of the models with a contact (with '
+                        '--trajectory). Default: 0.5')
+    parser.add_argument('--force', action='store_true', help='Run all stages '
+                        'again, even if their inputs did not change')
+    parser.add_argument('--strict', action='store_true', help='Stop at the '
+                        'first structure which cannot be processed')
+    parser.add_argument('--no-report', action='store_true', help='Do not '
+                        'create the HTML- and PDF-report (requires R and '
+                        'pandoc)')
+    try:
+        args = parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+    if args.trajectory and len(args.cutoff) > 1:
+        parser.error('only one cutoff can be used with --trajectory')
+    return args
+
+
+class Stage(object):
+    '''commands of one stage with the files it reads and writes'''
+
+    def __init__(self, name, commands, inputs, outputs, cwd=None,
+                 force_arguments=()):
+        self.name = name
+        # list of commands (lists of arguments, see script)
+        self.commands = commands
+        self.inputs = inputs  # files and directories
+        self.outputs = outputs
+        self.cwd = cwd
+        # added to the (first) command with --force (not in the fingerprint)
+        self.force_arguments = list(force_arguments)
+
+    def marker(self):
+        return os.path.join(CHECKPOINT_DIR, '%s.json' % self.name)
+
+
+def script(name, *arguments):
+    '''command of a python script of the software (run in this process, see
+    run_script)'''
+    return [name] + list(arguments)
+
+
+def stages():
+    '''OUT: list of all stages of the analysis (in order)'''
+    jobs = ['--jobs', str(args.jobs)]
+    keep_going = [] if args.strict else ['--keep-going']
+    metrics = ['--metrics', METRICS]
+    fmt = ['--format', args.format]
+    models = ['--all-models'] if args.trajectory else []
+    occupancy = ['--trajectory', '--min-occupancy', args.min_occupancy] \
+        if args.trajectory else []
+    raw_networks = os.path.join(RESULTS, 'raw_networks.%s' % args.format)
+    mapping = os.path.join(RESULTS, 'mapping.%s' % args.format)
+    consensus = os.path.join(RESULTS, 'consensus_network.%s' % args.format)
+    result = [
+        Stage('check_data', [script(
+            'check_data.py', args.raw_pdb_dir, args.reference_alignment,
+            args.sifts_chain_pfam, *(jobs + keep_going + metrics))],
+            [args.raw_pdb_dir, args.reference_alignment,
+             args.sifts_chain_pfam], []),
+        Stage('process_pdb', [script(
+            'process_pdb.py', args.raw_pdb_dir, args.pfam_domain,
+            args.sifts_chain_pfam, PROCESSED_PDB_DIR, '--resume',
+            *(models + jobs + keep_going + metrics))],
+            [args.raw_pdb_dir, args.sifts_chain_pfam],
+            [PROCESSED_PDB_DIR,
+             os.path.join(RESULTS, 'selected_chains_info.csv')],
+            force_arguments=['--overwrite']),
+        Stage('calculate_networks', [script(
+            'calculate_networks.py', PROCESSED_PDB_DIR,
+            *(args.cutoff + occupancy + jobs + fmt + keep_going + metrics))],
+            [PROCESSED_PDB_DIR], [raw_networks]),
+        Stage('map_networks', [script(
+            'map_networks.py', PROCESSED_PDB_DIR, args.reference_alignment,
+            args.reference_structure, *(jobs + fmt + keep_going + metrics))],
+            [PROCESSED_PDB_DIR, args.reference_alignment], [mapping])]
+    cutoffs = ['--cutoffs'] + args.cutoff if len(args.cutoff) > 1 else []
+    result.append(Stage('consensus', [script(
+        'calculate_consensus_network.py', raw_networks, mapping,
+        args.reference_alignment, *(fmt + cutoffs + metrics))],
+        [raw_networks, mapping, args.reference_alignment],
+        [consensus, os.path.join(RESULTS, 'mapped_networks.%s'
+                                 % args.format)]))
+    if args.format != 'csv':
+        result.append(Stage('export', [script(
+            'export_table.py', consensus,
+            os.path.join(RESULTS, 'consensus_network.csv'))],
+            [consensus], [os.path.join(RESULTS, 'consensus_network.csv')]))
+    if not args.no_report:
+        result.append(Stage('report', [
+            ['Rscript', '-e', "library(knitr); knit('%s')"
+             % os.path.join(SCRIPT_DIR, 'analysis.Rmd')],
+            ['Rscript', '-e', "library(markdown); markdownToHTML("
+             "'analysis.md', 'analysis.html', options=c('use_xhml'))"],
+            ['pandoc', '-s', 'analysis.html', '-o', 'analysis.pdf']],
+            [os.path.join(RESULTS, 'consensus_network.csv'),
+             os.path.join(RESULTS, 'mapped_networks.%s' % args.format)],
+            [os.path.join(RESULTS, 'analysis.html'),
+             os.path.join(RESULTS, 'analysis.pdf')], cwd=RESULTS))
+    return result
+
+
+def script_signatures():
+    '''OUT: list of (path, size, modification time) of the scripts of the
+    software (without compiled files)'''
+    return [signature for filename in sorted(os.listdir(SCRIPT_DIR))
+            if filename.endswith(('.py', '.R', '.Rmd'))
+            for signature in file_signatures(os.path.join(SCRIPT_DIR,
+                                                          filename))]
+
+
+def file_signatures(path):
+    '''OUT: list of (path, size, modification time) of a file or of all files
+    in a directory (recursively)'''
+    if not os.path.exists(path):  # e.g. output of a failed earlier stage
+        return [(path, None, None)]
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        return [(path, stat.st_size, repr(stat.st_mtime))]
+    signatures = []
+    for directory, subdirectories, filenames in os.walk(path):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            signatures += file_signatures(os.path.join(directory, filename))
+    return signatures
+
+
+def fingerprint(stage):
+    '''OUT: hash of the commands, the input files and the scripts of a
+    stage'''
+    content = {'commands': stage.commands, 'inputs': [],
+               'scripts': script_signatures()}
+    for path in stage.inputs:
+        content['inputs'] += file_signatures(path)
+    text = json.dumps(content, sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def is_done(stage, stage_fingerprint):
+    '''OUT: True if the stage finished with the same fingerprint and all its
+    outputs exist'''
+    if not os.path.exists(stage.marker()):
+        return False
+    try:
+        with open(stage.marker()) as infile:
+            marker = json.load(infile)
+    except ValueError:  # incomplete marker
+        return False
+    return marker.get('fingerprint') == stage_fingerprint and \
+        all(os.path.exists(path) for path in stage.outputs)
+
+
+def clear_failures(stage):
+    '''removes the failed structures of earlier runs of the stage from the
+    log'''
+    if not os.path.exists(workers.FAILED_LOG):
+        return
+    with open(workers.FAILED_LOG) as infile:
+        lines = [line for line in infile
+                 if not line.startswith(stage.name + '\t')]
+    with open(workers.FAILED_LOG, 'w') as outfile:
+        outfile.writelines(lines)
+
+
+def run_script(command):
+    '''IN: command of a python script (see script)
+    OUT: exit status; the function main of the script is called in this
+    process (with the arguments of the command)'''
+    module = importlib.import_module(os.path.splitext(command[0])[0])
+    try:
+        module.main(command[1:])
+    except SystemExit as error:  # sys.exit of the script
+        if error.code is None or isinstance(error.code, int):
+            return error.code or 0
+        print(error.code, file=sys.stderr)
+        return 1
+    except Exception:  # the traceback as if the script was run separately
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+    return 0
+
+
+def run_stage(stage, stage_fingerprint):
+    '''runs the commands of a stage and writes its marker
+    OUT: True if successful'''
+    if os.path.exists(stage.marker()):
+        os.remove(stage.marker())
+    clear_failures(stage)
+    start = time.time()
+    for i, command in enumerate(stage.commands):
+        if args.force and i == 0:
+            command = command + stage.force_arguments
+        if command[0].endswith('.py'):
+            status = run_script(command)
+        else:
+            try:
+                status = subprocess.call(command, cwd=stage.cwd)
+            except OSError as error:  # e.g. Rscript not installed
+                print('%s: %s' % (command[0], error))
+                status = -1
+        if status != 0:
+            return False
+    with open(stage.marker() + '.tmp', 'w') as outfile:
+        json.dump({'fingerprint': stage_fingerprint,
+                   'finished': datetime.datetime.now().isoformat(),
+                   'seconds': round(time.time() - start, 1)}, outfile)
+    os.rename(stage.marker() + '.tmp', stage.marker())
+    return True
+
+
+def main(argv=None):
+    global args
+    args = parse_arguments(argv)
+    print('INPUT DATA:')
+    print('PDB-files in directory %s' % args.raw_pdb_dir)
+    print('reference alignment: %s' % args.reference_alignment)
+    print('reference structure: %s' % args.reference_structure)
+    print('Pfam domain of interest: %s' % args.pfam_domain)
+    print('File for identification of PDB-chains with Pfam domain of '
+          'interest: %s' % args.sifts_chain_pfam)
+    print('Worker processes: %s' % args.jobs)
+
+    if not os.path.exists(CHECKPOINT_DIR):
+        os.makedirs(CHECKPOINT_DIR)
+    for stage in stages():
+        stage_fingerprint = fingerprint(stage)
+        if not args.force and is_done(stage, stage_fingerprint):
+            print('\n%s: up to date (skipped)' % stage.name)
+            continue
+        print('\n%s:' % stage.name)
+        sys.stdout.flush()
+        if not run_stage(stage, stage_fingerprint):
+            print('\nStage %s failed. After the issue is fixed, run the same '
+                  'command again: finished stages and structures are not '
+                  'calculated again.' % stage.name)
+            sys.exit(1)
+        print('%s: finished' % stage.name)
+
+    if os.path.exists(workers.FAILED_LOG) and \
+            os.path.getsize(workers.FAILED_LOG) > 0:
+        with open(workers.FAILED_LOG) as infile:
+            n_failed = len(infile.readlines())
+        print('\n%s structures could not be processed and were left out '
+              '(see %s).' % (n_failed, workers.FAILED_LOG))
+    print('\nAnalysis finished. Results in the directory "%s".' % RESULTS)
+
+
+if __name__ == '__main__':
+    main()
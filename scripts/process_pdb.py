@@ -16,6 +16,27 @@ If the Pfam-domain is present on multiple chains, the first chain
 2) Removal of all lines which do not start with 'ATOM', 'TER' or 'END'. This
 includes heteroatoms (HETATM) or anisotropic temperature factors (ANISOU)
 3) Removal of hydrogen atoms (if present)
+The structure is read once with structure_io.py (the parser of all scripts,
+option '--parser') and the chain is selected from it (only the first model
+is used); the processed file is written in the format of Bio.PDB (atoms are
+numbered consecutively as in the complete chain). Alternative locations of
+an atom are written by occupancy (highest first; ties by altloc label, then
+file order, see structure_io.pdb_records).
+With the option '--all-models', all models of the chain are kept (each
+between MODEL and ENDMDL records), e.g. for NMR ensembles and molecular
+dynamics trajectories (see 'calculate_networks.py --trajectory').
+
+RESUMING:
+Every processed file is listed in '<output directory>.done' (with the
+selected chain and the size and modification time of the raw file) as soon
+as it is written. With the option '--resume', files listed there are not
+processed again unless the raw file or the selected chain changed, and
+processed files without a (selected) raw file are removed. Thus, an
+interrupted run can simply be continued. Without '--resume' or '--overwrite',
+the script asks before deleting the content of a non-empty output directory
+(and exits if it is not run interactively).
+Files which 'check_data.py' found to be invalid (and which did not change
+since, see 'input_checks.py') are reported as failed without reading them.
 
 NOTE:
 The fully automated large scale analysis of protein structures requires
@@ -23,114 +44,244 @@ standardized input data. For instance, most structures in the PDB do not
 include hydrogen atoms (as they were solved with x-ray crystallography). For
 this reason, hydrogen atoms are removed if present to allow comparison with
 other structures.
+Raw files can be PDB- or mmCIF-files (ending with '.cif' or '.mmcif',
+optionally gzip-compressed, see 'structure_io.py'); the processed files are
+always PDB-files named '<PDB-ID>.pdb'.
 ------------------------------------------------------------------------------
 '''
 
+from __future__ import print_function
 import argparse
 import sys
 import os
 import pandas as pd
-from Bio import PDB
-
-parser = argparse.ArgumentParser()
-parser.add_argument('raw_pdb_dir', help='Directory with raw (unprocessed) '
-                    'PDB-structures')
-parser.add_argument('pfam_domain', help='Pfam domain of interest. Important '
-                    'for the program to know which chains to analyse in '
-                    'case of complex structures.')
-parser.add_argument('sifts_chain_pfam', help='SIFTS-file "pdb_chain_pfam.csv" '
-                    'for finding chains withing the PDB-structures which '
-                    'contain the Pfam-domain of interest')
-parser.add_argument('processed_pdb_dir', help='Name of the output directory '
-                    '(containing the processed PDB-files).')
+import input_checks
+import metrics
+import sifts_index
+import structure_io
+import workers
+
 try:
-    args = parser.parse_args()
-except:
-    parser.print_help()
-    sys.exit(1)
-chain_pfam = pd.read_csv(args.sifts_chain_pfam, comment='#')
-
-
-# CHECK IF OUPUT DIRECTORY EXISTS
-if not os.path.exists(args.processed_pdb_dir):
-    os.makedirs(args.processed_pdb_dir)
-elif len(os.listdir(args.processed_pdb_dir)) > 0:
-    print 'Directory %s is not empty.' % args.processed_pdb_dir
-    user_input =  raw_input('Do you want to delete its content?\n(y for yes) ')
-    if user_input == 'y':
-        os.system('rm -f %s/*' % args.processed_pdb_dir)
-    else:
-        print('Please make sure the directory is empty or provide a different '
-            'name for the output directory. Then restart script.')
+    input = raw_input  # python 2: input() would evaluate the answer
+except NameError:
+    pass
+
+# arguments, SIFTS-index, log entries of earlier runs and invalid files (see
+# check_data.py) (used by the worker processes)
+args = None
+sifts = None
+done = {}
+invalid = {}
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('raw_pdb_dir', help='Directory with raw (unprocessed) '
+                        'PDB-structures')
+    parser.add_argument('pfam_domain', help='Pfam domain of interest. '
+                        'Important for the program to know which chains to '
+                        'analyse in case of complex structures.')
+    parser.add_argument('sifts_chain_pfam', help='SIFTS-file '
+                        '"pdb_chain_pfam.csv" for finding chains withing the '
+                        'PDB-structures which contain the Pfam-domain of '
+                        'interest')
+    parser.add_argument('processed_pdb_dir', help='Name of the output '
+                        'directory (containing the processed PDB-files).')
+    parser.add_argument('--resume', action='store_true', help='Keep '
+                        'processed files of unchanged raw files (see '
+                        'docstring)')
+    parser.add_argument('--overwrite', action='store_true', help='Delete the '
+                        'content of a non-empty output directory without '
+                        'asking')
+    parser.add_argument('--all-models', action='store_true', help='Keep all '
+                        'models of the chain (NMR ensembles, MD '
+                        'trajectories) instead of only the first one')
+    structure_io.add_parser_arguments(parser)
+    workers.add_jobs_arguments(parser)
+    workers.add_keep_going_argument(parser)
+    metrics.add_metrics_arguments(parser)
+    try:
+        return parser.parse_args(argv)
+    except:
+        parser.print_help()
         sys.exit(1)
 
 
+def clear_output(processed_pdb_dir, done_log):
+    '''deletes the processed files and their log'''
+    for filename in os.listdir(processed_pdb_dir):
+        os.remove(os.path.join(processed_pdb_dir, filename))
+    if os.path.exists(done_log):
+        os.remove(done_log)
+
+
+def read_done_log(done_log):
+    '''OUT: dictionary: processed filename -> (chain, size and modification
+    time of the raw file) as written to the log'''
+    entries = {}
+    if os.path.exists(done_log):
+        with open(done_log) as infile:
+            for line in infile:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 4:  # (the last line may be incomplete)
+                    entries[fields[0]] = tuple(fields[1:])
+    return entries
+
+
+def prepare_output(processed_pdb_dir, done_log):
+    '''creates the output directory or empties it (see docstring)'''
+    if not os.path.exists(processed_pdb_dir):
+        os.makedirs(processed_pdb_dir)
+    elif args.overwrite:
+        clear_output(processed_pdb_dir, done_log)
+    elif len(os.listdir(processed_pdb_dir)) > 0 and not args.resume:
+        print('Directory %s is not empty.' % processed_pdb_dir)
+        if not sys.stdin.isatty():  # never wait for an answer in batch runs
+            print('Use the option --resume or --overwrite.')
+            sys.exit(1)
+        user_input =  input('Do you want to delete its content?\n(y for '
+                            'yes) ')
+        if user_input == 'y':
+            clear_output(processed_pdb_dir, done_log)
+        else:
+            print('Please make sure the directory is empty or provide a '
+                'different name for the output directory. Then restart '
+                'script.')
+            sys.exit(1)
+
+
 def select_chain(filename, domain_of_int):
     '''selects only one chain per structure; chain has to have domain of
     interest (and this domain only'''
     pdb_id = filename.split('.')[0]
-    sub = chain_pfam[(chain_pfam.PDB == pdb_id) &
-                    (chain_pfam.PFAM_ID == domain_of_int)]
-    chains_of_interest = list(sub.CHAIN)
-#    print '\n%s' % pdb_id
-#    print 'all chains:%s' % list(chain_pfam[(chain_pfam.PDB == pdb_id)].CHAIN)
-#    print 'chains of interest: %s' % chains_of_interest
+    chains_of_interest = sifts.chains(pdb_id, domain_of_int)
     if len(chains_of_interest) >= 1:
         return chains_of_interest[0]   # return first chain with Pfam-domain
 # If no chain is selected, the PDB-ID is probably not in the SIFTS-file.
 
-def extract_chain(in_dir, filename, chain_of_int, out_dir):
-    '''saves chain of interest as separate structure'''
-    pdb_id = filename.split('.')[0]
-    struct = PDB.PDBParser().get_structure(pdb_id, os.path.join(in_dir,
-        filename))
-    io = PDB.PDBIO()
-    io.set_structure(struct[0][chain_of_int])
-    io.save(os.path.join(out_dir, filename))
-
-
-def clean(directory, filename):
-    '''greps only ATOM, TER or END-lines from pdb, overwrites original file'''
-    if not os.path.exists(os.path.join(directory, filename)):
-        print 'file %s not found. Script continues.'
-        return
-    os.system('mv %s tmp.pdb' % os.path.join(directory, filename))
-    os.system('egrep "^ATOM|^TER|^END" tmp.pdb > %s' % os.path.join(directory,
-                                                                    filename))
-    os.system('rm tmp.pdb')
-
-
-def remove_hydrogens(directory, filename):
-    '''Removes all hydrogen atoms from a PDB-file, overwrites original file
-    Note: requires "cleaned" input PDB-file (as it ignores HETATM)'''
-    if not os.path.exists(os.path.join(directory, filename)):
-        print 'file %s not found. Script continues.'
-        return
-    os.system('mv %s tmp.pdb' % os.path.join(directory, filename))
-    os.system('cat tmp.pdb | sed "s/[ \t]*$//" | grep -v "^ATOM.*H$" > %s' \
-                % os.path.join(directory, filename))
-    os.system('rm tmp.pdb')
-
-
-selected_chains = pd.DataFrame(columns = ['pdb_id', 'chain'])  # just for info
-print('\nPDB-ID\tchain selected for analysis')
-for pdb_file in os.listdir(args.raw_pdb_dir):
+def extract_chain(in_path, chain_of_int, out_path, all_models=False,
+                  parser='native'):
+    '''writes the chain of interest (only ATOM-records, without hydrogen
+    atoms, as selected by structure_io.Structure.select_chain) as separate
+    structure in the format of Bio.PDB. The atoms are numbered as in the
+    complete chain (with heteroatoms and hydrogen atoms). With all_models:
+    all models, each between MODEL and ENDMDL records'''
+    structure = structure_io.load_structure(in_path, parser)
+    n_models = structure.res_model.max() + 1 if structure.n_residues else 0
+    chains = [structure.select_chain(chain_of_int, model, all_atoms=True)
+              for model in range(n_models if all_models else
+                                 min(n_models, 1))]
+    chains = [chain for chain in chains if len(chain)]
+    if not chains:
+        raise ValueError('Chain %s not found in %s' % (chain_of_int, in_path))
+    metrics.record(residues=chains[0].n_residues, models=len(chains))
+    written = 0
+    # written under a temporary name first: an interrupted run never leaves
+    # an incomplete file under the final name
+    with open(out_path + '.tmp', 'w') as outfile:
+        for model, chain in enumerate(chains):
+            if all_models:
+                outfile.write('MODEL     %4i\n' % (model + 1))
+            records, standard = structure_io.pdb_records(chain)
+            for record, keep in zip(records, standard):
+                if keep:  # no heteroatoms and hydrogen atoms
+                    outfile.write(record + '\n')
+                    written += 1
+            outfile.write('TER\n')
+            if all_models:
+                outfile.write('ENDMDL\n')
+        outfile.write('END\n')
+    os.rename(out_path + '.tmp', out_path)
+    metrics.record(atoms=written)
+
+
+def raw_signature(in_path):
+    '''size and modification time of a raw file (as in the log)'''
+    stat = os.stat(in_path)
+    return str(stat.st_size), repr(stat.st_mtime)
+
+
+def processed_name(pdb_file):
+    '''filename of the processed file of a raw file (always a PDB-file, e.g.
+    '1g16.pdb' of '1g16.cif.gz')'''
+    return '%s.pdb' % pdb_file.split('.')[0]
+
+
+def process_file(pdb_file):
+    '''IN: raw pdb-filename
+    OUT: pdb-filename, selected chain (None if no chain with the Pfam-domain
+    of interest), log entry of a newly written file (None if the file was
+    not written, see docstring)
+    Writes the processed PDB-file. Note: executed in the worker processes'''
     chain = select_chain(pdb_file, args.pfam_domain)
-    print "%s\t%s" % (pdb_file, chain)
-    if chain != None:  # if chain with Pfam-domain of interest found
-        selected_chains = selected_chains.append(
-            {'pdb_id': pdb_file.split('.')[0],
-            'chain': chain},
-            ignore_index = True)
-        extract_chain(args.raw_pdb_dir, pdb_file, chain,
-                      args.processed_pdb_dir)
-        clean(args.processed_pdb_dir, pdb_file)
-        remove_hydrogens(args.processed_pdb_dir, pdb_file)
-
-selected_chains.to_csv('results/selected_chains_info.csv', index=False)
-
-print('\nOut of %s raw PDB-files, for %s PDB-files, a chain with the Pfam'
-'domain of interst could be extracted and written to a new file in the'
-'directory %s' % (len(os.listdir(args.raw_pdb_dir)), len(selected_chains),
-                 args.processed_pdb_dir))
-   
+    if chain == None:  # no chain with Pfam-domain of interest found
+        return pdb_file, chain, None
+    if pdb_file in invalid:  # found by check_data.py, not read again
+        raise ValueError('%s: %s' % (pdb_file, invalid[pdb_file]))
+    in_path = os.path.join(args.raw_pdb_dir, pdb_file)
+    out_path = os.path.join(args.processed_pdb_dir, processed_name(pdb_file))
+    # (files with all models are listed as e.g. 'A/all-models')
+    entry = (str(chain) + ('/all-models' if args.all_models else ''),) + \
+        raw_signature(in_path)
+    if done.get(pdb_file) == entry and os.path.exists(out_path):
+        return pdb_file, chain, None  # processed in an earlier run
+    extract_chain(in_path, chain, out_path, args.all_models, args.parser)
+    return pdb_file, chain, entry
+
+
+def main(argv=None):
+    global args, sifts, done, invalid
+    args = parse_arguments(argv)
+    run = metrics.StageMetrics.from_args('process_pdb', args)
+    with run.section('load_sifts'):
+        sifts = sifts_index.load_index(args.sifts_chain_pfam)
+    done_log = args.processed_pdb_dir.rstrip('/') + '.done'
+    prepare_output(args.processed_pdb_dir, done_log)
+    done = read_done_log(done_log) if args.resume else {}
+    invalid = input_checks.known_problems(args.raw_pdb_dir)
+
+    # just for info
+    selected_chains = pd.DataFrame(columns = ['pdb_id', 'chain'])
+    print('\nPDB-ID\tchain selected for analysis')
+    pdb_files = sorted(os.listdir(args.raw_pdb_dir))  # fixed order
+    processed = set()
+    with open(done_log, 'a' if args.resume else 'w') as log:
+        for result in run.map(workers.guard(process_file, args.keep_going),
+                              pdb_files, args.jobs, args.chunksize):
+            if workers.failed(result, 'process_pdb'):
+                continue
+            pdb_file, chain, entry = result
+            print("%s\t%s" % (pdb_file, chain))
+            if chain != None:
+                processed.add(pdb_file)
+                selected_chains = selected_chains.append(
+                    {'pdb_id': pdb_file.split('.')[0],
+                    'chain': chain},
+                    ignore_index = True)
+            if entry is not None:
+                log.write('\t'.join((pdb_file,) + entry) + '\n')
+                log.flush()
+                done[pdb_file] = entry
+
+    # files of earlier runs which are no longer processed (and temporary
+    # files)
+    processed_files = set([processed_name(pdb_file) for pdb_file in processed])
+    for filename in os.listdir(args.processed_pdb_dir):
+        if filename not in processed_files:
+            os.remove(os.path.join(args.processed_pdb_dir, filename))
+    with open(done_log, 'w') as log:
+        for pdb_file in sorted(processed & set(done)):
+            log.write('\t'.join((pdb_file,) + done[pdb_file]) + '\n')
+
+    selected_chains.to_csv('results/selected_chains_info.csv', index=False)
+
+    print('\nOut of %s raw PDB-files, for %s PDB-files, a chain with the '
+          'Pfam domain of interst could be extracted and written to a new '
+          'file in the directory %s' % (len(pdb_files), len(selected_chains),
+                                        args.processed_pdb_dir))
+    run.add(selected_chains=len(selected_chains))
+    run.close()
+
+
+if __name__ == '__main__':
+    main()
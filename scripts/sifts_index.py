@@ -0,0 +1,124 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Lookup of the chains of a PDB-structure which contain a given Pfam-domain in
+the SIFTS-file 'pdb_chain_pfam.csv'. Used by 'check_data.py' and
+'process_pdb.py'.
+
+The SIFTS-file has hundreds of thousands of lines. It is read only once and
+turned into an index: Pfam-ID -> PDB-ID -> chains (in the order of the
+SIFTS-file). The index is stored as binary file next to the SIFTS-file
+('pdb_chain_pfam.csv.index.pkl'). As long as the SIFTS-file is not modified,
+the index is loaded from this file instead of reading the SIFTS-file again.
+In the stored index, the entries of each Pfam-domain are packed into a single
+string (fast to load); they are only unpacked for the Pfam-domains which are
+looked up.
+
+NOTE:
+The stored index is not used if the modification time or the size of the
+SIFTS-file have changed. If the index cannot be written (e.g. no write
+permission in the directory of the SIFTS-file), it is simply built again at
+the next run.
+------------------------------------------------------------------------------
+'''
+
+import os
+try:
+    import cPickle as pickle
+except ImportError:  # python 3
+    import pickle
+import pandas as pd
+
+INDEX_SUFFIX = '.index.pkl'
+INDEX_VERSION = 1  # increase if the structure of the index changes
+PICKLE_PROTOCOL = 2  # readable with python 2 and 3
+
+
+def _pack(entries):
+    '''dictionary PDB-ID -> list of chains  =>  one string (one line per
+    PDB-ID: PDB-ID, tab, comma-separated chains)'''
+    return '\n'.join(['%s\t%s' % (pdb_id, ','.join(chains)) for pdb_id, chains
+                      in sorted(entries.items())])
+
+
+def _unpack(packed):
+    '''inverse of _pack'''
+    entries = {}
+    for line in packed.split('\n'):
+        pdb_id, chains = line.split('\t')
+        entries[pdb_id] = chains.split(',')
+    return entries
+
+
+class SiftsIndex(object):
+    '''Chains of PDB-structures with a certain Pfam-domain'''
+
+    def __init__(self, packed):
+        self.packed = packed  # Pfam-ID -> packed entries (see _pack)
+        self.entries = {}  # Pfam-ID -> PDB-ID -> list of chains (unpacked)
+
+    def __len__(self):
+        '''number of Pfam-domains'''
+        return len(self.packed)
+
+    def _entries(self, pfam_id):
+        if pfam_id not in self.entries:
+            self.entries[pfam_id] = _unpack(self.packed[pfam_id]) if \
+                pfam_id in self.packed else {}
+        return self.entries[pfam_id]
+
+    def chains(self, pdb_id, pfam_id):
+        '''IN: PDB-ID, Pfam-ID
+        OUT: chains of the structure which contain the Pfam-domain (in the
+        order of the SIFTS-file, empty if there are none)'''
+        return self._entries(pfam_id).get(pdb_id, [])
+
+    def pdb_ids(self, pfam_id):
+        '''IN: Pfam-ID
+        OUT: PDB-IDs of all structures with the Pfam-domain (sorted)'''
+        return sorted(self._entries(pfam_id))
+
+
+def read_sifts_file(path):
+    '''IN: path of the SIFTS-file
+    OUT: index (dictionary: Pfam-ID -> packed entries, see _pack)'''
+    # all columns as text: e.g. chain IDs such as '1' or 'NA'
+    chain_pfam = pd.read_csv(path, comment='#', dtype=str,
+                             keep_default_na=False,
+                             usecols=['PDB', 'CHAIN', 'PFAM_ID'])
+    index = {}
+    for pdb_id, chain, pfam_id in zip(chain_pfam.PDB, chain_pfam.CHAIN,
+                                      chain_pfam.PFAM_ID):
+        index.setdefault(pfam_id, {}).setdefault(pdb_id, []).append(chain)
+    return dict([(pfam_id, _pack(entries)) for pfam_id, entries in
+                 index.items()])
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return INDEX_VERSION, stat.st_mtime, stat.st_size
+
+
+def load_index(path):
+    '''IN: path of the SIFTS-file
+    OUT: SiftsIndex (loaded from the stored index if it is up to date,
+    otherwise built from the SIFTS-file and stored)'''
+    index_path = path + INDEX_SUFFIX
+    stamp = _file_stamp(path)
+    try:
+        with open(index_path, 'rb') as infile:
+            stored_stamp, index = pickle.load(infile)
+        if tuple(stored_stamp) == stamp:
+            return SiftsIndex(index)
+    except Exception:  # missing, outdated or unreadable index
+        pass
+    index = read_sifts_file(path)
+    tmp = '%s.%s.tmp' % (index_path, os.getpid())
+    try:
+        with open(tmp, 'wb') as outfile:
+            pickle.dump((stamp, index), outfile, PICKLE_PROTOCOL)
+        os.rename(tmp, index_path)
+    except (IOError, OSError):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return SiftsIndex(index)
@@ -0,0 +1,799 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Fast reading of protein structures (PDB- and mmCIF-files) into numpy arrays.
+Used by all scripts which read structures.
+
+The atom records are read straight into arrays (coordinates, atom name,
+element, residue number, insertion code, residue name, chain, ...) instead of
+building a Bio.PDB object for every atom and residue. The result is the same
+as with Bio.PDB:
+- Residues are numbered (starting at 0) in the order in which Bio.PDB
+  iterates over them: models, chains in order of appearance, residues in order
+  of appearance within their chain.
+- Of several alternative locations of an atom, the one with the highest
+  occupancy is used (the first one, if several have the same occupancy). The
+  other locations are kept separately (see Structure).
+Files ending with '.cif' or '.mmcif' are read as mmCIF-files, all other files
+as PDB-files; both can be gzip-compressed ('.gz').
+
+NOTE:
+Bio.PDB is still available as a fallback (option '--parser biopython' of the
+scripts, see add_parser_arguments), e.g. for files which are not formatted
+according to the standard.
+------------------------------------------------------------------------------
+'''
+
+import gzip
+import os
+import re
+import numpy as np
+
+PARSERS = ['native', 'biopython']
+MMCIF_EXTENSIONS = ['.cif', '.mmcif']
+STRUCTURE_EXTENSIONS = ['.pdb'] + MMCIF_EXTENSIONS
+ATOM_RECORDS = (b'ATOM  ', b'HETATM')
+PDB_LINE_LENGTH = 80
+PEPTIDE_BOND = 1.8  # maximal C-N distance of a peptide bond (as Bio.PDB)
+
+# standard amino acids (as Bio.PDB.Polypeptide)
+THREE_TO_ONE = {'ALA': 'A', 'CYS': 'C', 'ASP': 'D', 'GLU': 'E', 'PHE': 'F',
+                'GLY': 'G', 'HIS': 'H', 'ILE': 'I', 'LYS': 'K', 'LEU': 'L',
+                'MET': 'M', 'ASN': 'N', 'PRO': 'P', 'GLN': 'Q', 'ARG': 'R',
+                'SER': 'S', 'THR': 'T', 'VAL': 'V', 'TRP': 'W', 'TYR': 'Y'}
+
+# chemical elements (as known to Bio.PDB)
+ELEMENTS = ['AC', 'AG', 'AL', 'AM', 'AR', 'AS', 'AT', 'AU', 'B', 'BA', 'BE',
+            'BH', 'BI', 'BK', 'BR', 'C', 'CA', 'CD', 'CE', 'CF', 'CL', 'CM',
+            'CO', 'CR', 'CS', 'CU', 'DB', 'DY', 'ER', 'ES', 'EU', 'F', 'FE',
+            'FM', 'FR', 'GA', 'GD', 'GE', 'H', 'HE', 'HF', 'HG', 'HO', 'HS',
+            'I', 'IN', 'IR', 'K', 'KR', 'LA', 'LI', 'LR', 'LU', 'MD', 'MG',
+            'MN', 'MO', 'MT', 'N', 'NA', 'NB', 'ND', 'NE', 'NI', 'NO', 'NP',
+            'O', 'OS', 'P', 'PA', 'PB', 'PD', 'PM', 'PO', 'PR', 'PT', 'PU',
+            'RA', 'RB', 'RE', 'RF', 'RH', 'RN', 'RU', 'S', 'SB', 'SC', 'SE',
+            'SG', 'SI', 'SM', 'SN', 'SR', 'TA', 'TB', 'TC', 'TE', 'TH', 'TI',
+            'TL', 'TM', 'U', 'V', 'W', 'XE', 'Y', 'YB', 'ZN', 'ZR']
+
+# mmCIF: quoted values (a quote only ends a value if followed by whitespace)
+CIF_TOKEN = re.compile(r"'(?:[^']|'(?=\S))*'(?=\s|$)|"
+                       r'"(?:[^"]|"(?=\S))*"(?=\s|$)|\S+')
+CIF_MISSING = ('.', '?')
+
+
+def add_parser_arguments(parser):
+    '''adds the option --parser to an argparse parser'''
+    parser.add_argument('--parser', choices=PARSERS, default='native',
+                        help='Reading of the structure files: native (fast, '
+                        'numpy) or biopython (Bio.PDB, slow). Both give the '
+                        'same result. Default: native')
+
+
+class Structure(object):
+    '''Atoms (numpy arrays, one element per atom) and residues (numpy arrays,
+    one element per residue) of a structure
+
+    atoms:    coords (float32, one row per atom), atom_name, element, altloc,
+              occupancy, bfactor, res_index (index of the residue of the
+              atom), atom_row (native parser: index of the atom record of the
+              atom among all atom records read; used to read further models
+              of a trajectory, see trajectory.py)
+    residues: res_model (index of the model), res_chain, res_hetero (hetero
+              flag as in Bio.PDB: ' ', 'W' or 'H_<residue name>'), res_number,
+              res_icode, res_name
+    alternative locations of atoms (not used for the structure): alt_coords,
+    alt_name, alt_altloc, alt_occupancy, alt_bfactor, alt_element,
+    alt_res_index, alt_row (as atom_row)'''
+
+    def __init__(self, name, atoms, residues, alternates):
+        self.name = name
+        for fields in (atoms, residues, alternates):
+            for field in fields:
+                setattr(self, field, fields[field])
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def n_residues(self):
+        return len(self.res_number)
+
+    def chains(self, model=None):
+        '''IN: model index (optional, default: all models)
+        OUT: chain IDs in order (as Bio.PDB get_chains)'''
+        chains = []
+        for res_model, chain in zip(self.res_model, self.res_chain):
+            if (model is None or res_model == model) and \
+                    (res_model, chain) not in chains:
+                chains.append((res_model, chain))
+        return [chain for res_model, chain in chains]
+
+    def residues(self):
+        '''OUT: list of residues (residue number, residue name)'''
+        return list(zip([int(number) for number in self.res_number],
+                        [str(name) for name in self.res_name]))
+
+    def atom_index(self, atom_name):
+        '''IN: atom name (e.g. 'CA')
+        OUT: index of this atom in every residue (-1 if not present)'''
+        index = np.empty(self.n_residues, dtype=int)
+        index[:] = -1
+        atoms = np.nonzero(self.atom_name == atom_name)[0]
+        index[self.res_index[atoms]] = atoms
+        return index
+
+    def ca_coords(self):
+        '''OUT: CA-coordinates of every residue (NaN if no CA-atom)'''
+        ca = self.atom_index('CA')
+        ca_coords = np.empty((self.n_residues, 3), dtype='f4')
+        ca_coords[:] = np.nan
+        ca_coords[ca >= 0] = self.coords[ca[ca >= 0]]
+        return ca_coords
+
+    def select_chain(self, chain, model=0, all_atoms=False):
+        '''IN: chain ID, model index, True: all residues and atoms of the
+        chain (default: see OUT)
+        OUT: new Structure with the atoms of the chain as written by
+        'process_pdb.py': only standard residues (ATOM-records) and no
+        hydrogen atoms'''
+        return self.select_chains([chain], model, all_atoms)
+
+    def select_chains(self, chains, model=0, all_atoms=False):
+        '''IN: chain IDs, model index, True: all residues and atoms
+        OUT: new Structure with the atoms of these chains (see select_chain;
+        the residues of every chain are the same as with select_chain)'''
+        keep_residue = (self.res_model == model) & \
+            np.isin(self.res_chain, list(chains))
+        if all_atoms:
+            return self._subset(keep_residue[self.res_index])
+        keep_residue &= self.res_hetero == ' '
+        return self._subset(keep_residue[self.res_index] &
+                            (self.element != 'H'))
+
+    def select_model(self, model=0):
+        '''IN: model index
+        OUT: Structure with the residues of this model only (the structure
+        itself if it has only one model)'''
+        keep_residue = self.res_model == model
+        if keep_residue.all():
+            return self
+        return self._subset(keep_residue[self.res_index])
+
+    def _subset(self, keep_atom):
+        '''IN: boolean array: atoms to keep
+        OUT: new Structure with these atoms (and their alternative
+        locations); residues without atoms are removed'''
+        keep_residue = np.zeros(self.n_residues, dtype=bool)
+        keep_residue[self.res_index[keep_atom]] = True
+        new_index = np.cumsum(keep_residue) - 1
+        atoms = dict([(field, getattr(self, field)[keep_atom]) for field in
+                      ['coords', 'atom_name', 'element', 'altloc',
+                       'occupancy', 'bfactor', 'atom_row']])
+        atoms['res_index'] = new_index[self.res_index[keep_atom]]
+        residues = dict([(field, getattr(self, field)[keep_residue]) for
+                         field in ['res_model', 'res_chain', 'res_hetero',
+                                   'res_number', 'res_icode', 'res_name']])
+        # alternative locations of the atoms which are kept
+        names, codes = np.unique(np.concatenate(
+            [self.atom_name, self.alt_name]), return_inverse=True)
+        codes = codes.ravel()
+        kept = self.res_index[keep_atom].astype(np.int64) * len(names) + \
+            codes[:len(self)][keep_atom]
+        keep_alt = np.isin(self.alt_res_index.astype(np.int64) * len(names) +
+                           codes[len(self):], kept)
+        alternates = dict([(field, getattr(self, field)[keep_alt]) for field
+                           in ['alt_coords', 'alt_name', 'alt_altloc',
+                               'alt_occupancy', 'alt_bfactor', 'alt_element',
+                               'alt_row']])
+        alternates['alt_res_index'] = new_index[self.alt_res_index[keep_alt]]
+        return Structure(self.name, atoms, residues, alternates)
+
+    def _locations(self, atom_name):
+        '''IN: atom name
+        OUT: residue index, altloc and coordinates of all locations of the
+        atom (including alternative locations)'''
+        atoms = self.atom_name == atom_name
+        alternates = self.alt_name == atom_name
+        return (np.concatenate([self.res_index[atoms],
+                                self.alt_res_index[alternates]]),
+                np.concatenate([self.altloc[atoms],
+                                self.alt_altloc[alternates]]),
+                np.concatenate([self.coords[atoms],
+                                self.alt_coords[alternates]]))
+
+    def sequence(self):
+        '''OUT: amino acid sequence (one letter code) of the first model, as
+        given by Bio.PDB.PPBuilder: all standard amino acids which are bound
+        to a neighbouring standard amino acid (peptide bond)'''
+        first_model = np.nonzero(self.res_model == 0)[0]
+        accept = np.array([name.upper() in THREE_TO_ONE for name in
+                           self.res_name[first_model]], dtype=bool)
+        # peptide bonds between neighbouring residues of the same chain
+        # (any alternative locations with matching or blank altloc)
+        prev_res, c_altloc, c_coords = self._locations('C')
+        next_res, n_altloc, n_coords = self._locations('N')
+        # all pairs of C-locations of a residue and N-locations of the next
+        n_order = np.argsort(next_res, kind='mergesort')
+        first = np.searchsorted(next_res[n_order], prev_res + 1, side='left')
+        counts = np.searchsorted(next_res[n_order], prev_res + 1,
+                                 side='right') - first
+        c = np.repeat(np.arange(len(prev_res)), counts)
+        n = n_order[np.repeat(first, counts) + np.arange(counts.sum()) -
+                    np.repeat(np.cumsum(counts) - counts, counts)]
+        diff = n_coords[n] - c_coords[c]
+        bond = (np.sqrt((diff * diff).sum(axis=1)) < PEPTIDE_BOND) & \
+            ((n_altloc[n] == c_altloc[c]) | (n_altloc[n] == ' ') |
+             (c_altloc[c] == ' '))
+        bonded = np.zeros(self.n_residues, dtype=bool)
+        bonded[prev_res[c[bond]]] = True  # bond to the next residue
+        bonded = bonded[first_model]
+        bonded[:-1] &= self.res_chain[first_model][:-1] == \
+            self.res_chain[first_model][1:]
+        bonded[:-1] &= accept[:-1] & accept[1:]
+        bonded[-1:] = False
+        in_peptide = bonded.copy()
+        in_peptide[1:] |= bonded[:-1]
+        return ''.join([THREE_TO_ONE[name.upper()] for name in
+                        self.res_name[first_model][in_peptide]])
+
+
+def _text(values):
+    '''bytes-array -> array of (native) strings'''
+    if str is bytes:  # python 2
+        return values
+    return values.astype('U')
+
+
+def _first_appearance(keys):
+    '''IN: array of keys
+    OUT: group of every key (groups numbered in order of first appearance),
+    index of the first key of every group'''
+    unique, first, inverse = np.unique(keys, return_index=True,
+                                       return_inverse=True)
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty(len(order), dtype=int)
+    rank[order] = np.arange(len(order))
+    return rank[inverse.ravel()], first[order]
+
+
+def _group(*columns):
+    '''IN: arrays (one element per atom)
+    OUT: integer code of every combination of values (same values - same
+    code)'''
+    code = np.zeros(len(columns[0]), dtype=np.int64)
+    for column in columns:
+        values = np.unique(column, return_inverse=True)[1].ravel()
+        code = code * (values.max() + 1 if len(values) else 1) + values
+        code = np.unique(code, return_inverse=True)[1].ravel()
+    return code
+
+
+def atom_element(element, name, fullname):
+    '''IN: element column (upper case), atom name, atom name with spaces
+    (columns 13-16 of the PDB-file)
+    OUT: element; guessed from the atom name if the element column is empty
+    or invalid (as Bio.PDB, e.g. ' CA ' -> C, 'CA  ' -> CA, 'HE21' -> H,
+    '1HB ' -> H), '' if unknown'''
+    if element in ELEMENTS:
+        return element
+    if fullname[:1].isalpha() and not fullname[2:].isdigit():
+        element = name.strip()
+    elif name[:1].isdigit():
+        element = name[1:2]
+    else:
+        element = name[:1]
+    element = element.upper()
+    if element in ELEMENTS:
+        return element
+    return ''
+
+
+def _assign_elements(element, names, fullnames):
+    '''atom_element for arrays (only calculated for invalid elements)'''
+    invalid = ~np.isin(element, ELEMENTS)
+    if invalid.any():
+        element = element.astype(object)
+        element[invalid] = [atom_element('', name, fullname) for name, fullname
+                            in zip(names[invalid], fullnames[invalid])]
+        element = element.astype(str)
+    return element
+
+
+def build_structure(name, columns):
+    '''IN: name of the structure, dictionary of atom columns (numpy arrays):
+    record, atom_name, altloc, res_name, chain, res_number, icode, coords,
+    occupancy, bfactor, element, model (all atom records of the file, in
+    order)
+    OUT: Structure (residues and alternative locations resolved as by
+    Bio.PDB)'''
+    n_atoms = len(columns['coords'])
+    res_name = columns['res_name']
+    is_water = (res_name == 'HOH') | (res_name == 'WAT')
+    hetero = np.where(columns['record'] == 'HETATM', np.where(is_water, 1, 2),
+                      0)  # ' ', 'W' or 'H_<residue name>'
+
+    # residues: in order of the chains (first appearance) and of the
+    # residues within their chain (first appearance)
+    chain_rank, _ = _first_appearance(_group(columns['model'],
+                                             columns['chain']))
+    residue, res_first = _first_appearance(_group(
+        chain_rank, hetero, np.where(hetero == 2, res_name, ''),
+        columns['res_number'], columns['icode']))
+    res_order = np.lexsort((res_first, chain_rank[res_first]))
+    res_position = np.empty(len(res_order), dtype=int)
+    res_position[res_order] = np.arange(len(res_order))
+    res_index = res_position[residue]
+    res_first = res_first[res_order]
+
+    # atoms: one location per atom name and residue; the first location or
+    # an alternative location (altloc) with higher occupancy
+    atom, atom_first = _first_appearance(_group(res_index,
+                                                columns['atom_name']))
+    candidate = np.zeros(n_atoms, dtype=bool)
+    candidate[atom_first] = True
+    candidate |= columns['altloc'] != ' '
+    occupancy = np.where(np.isnan(columns['occupancy']), -np.inf,
+                         columns['occupancy'])
+    candidates = np.nonzero(candidate)[0]
+    order = candidates[np.lexsort((candidates, -occupancy[candidates],
+                                   atom[candidates]))]
+    selected = order[np.concatenate([[True], atom[order][1:] !=
+                                     atom[order][:-1]])] if len(order) else \
+        order
+    # in order of the residues and of the first location of every atom
+    selected = selected[np.lexsort((atom_first[atom[selected]],
+                                    res_index[selected]))]
+    alternates = np.setdiff1d(candidates, selected)
+
+    atoms = {'coords': columns['coords'][selected],
+             'atom_name': columns['atom_name'][selected],
+             'element': columns['element'][selected],
+             'altloc': columns['altloc'][selected],
+             'occupancy': columns['occupancy'][selected],
+             'bfactor': columns['bfactor'][selected],
+             'res_index': res_index[selected],
+             'atom_row': selected}
+    residues = {'res_model': columns['model'][res_first],
+                'res_chain': columns['chain'][res_first],
+                'res_hetero': np.array([[' ', 'W', 'H_' + residue_name][flag]
+                                        for flag, residue_name in
+                                        zip(hetero[res_first],
+                                            res_name[res_first])], dtype=str),
+                'res_number': columns['res_number'][res_first],
+                'res_icode': columns['icode'][res_first],
+                'res_name': columns['res_name'][res_first]}
+    alternates = {'alt_coords': columns['coords'][alternates],
+                  'alt_name': columns['atom_name'][alternates],
+                  'alt_altloc': columns['altloc'][alternates],
+                  'alt_occupancy': columns['occupancy'][alternates],
+                  'alt_bfactor': columns['bfactor'][alternates],
+                  'alt_element': columns['element'][alternates],
+                  'alt_res_index': res_index[alternates],
+                  'alt_row': alternates}
+    return Structure(name, atoms, residues, alternates)
+
+
+def open_file(path):
+    '''file object of a (gzip-compressed) file'''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _pdb_field(chars, start, end):
+    '''IN: atom records (array of characters, one row per line), first and
+    last column of a field (as python slice)
+    OUT: field of every line (bytes)'''
+    return np.ascontiguousarray(chars[:, start:end]).view(
+        'S%s' % (end - start)).ravel()
+
+
+def atom_chars(atom_lines):
+    '''IN: atom records (bytes)
+    OUT: array of characters (one row per line, see _pdb_field)'''
+    chars = np.frombuffer(np.array(atom_lines, dtype='S%s' % PDB_LINE_LENGTH
+                                   ).tobytes(), dtype='u1')
+    return chars.reshape(len(atom_lines), PDB_LINE_LENGTH)
+
+
+def pdb_coords(chars, path=''):
+    '''IN: atom records (see atom_chars), path of the file (for errors)
+    OUT: coordinates (float32, one row per atom record)'''
+    try:
+        return np.column_stack([_pdb_field(chars, start, start + 8).astype(
+            'f8') for start in (30, 38, 46)]).astype('f4').reshape(-1, 3)
+    except ValueError:
+        raise ValueError('Invalid atom record in PDB-file %s' % path)
+
+
+def scan_pdb(path):
+    '''IN: path of a PDB-file
+    OUT: number of atom records and chain IDs (in order of appearance); a
+    fast check of a file without building the structure (ValueError if an
+    atom record has invalid coordinates or residue numbers)'''
+    with open_file(path) as infile:
+        atom_lines = [line.rstrip(b'\r\n') for line in infile
+                      if line[:6] in ATOM_RECORDS]
+    if not atom_lines:
+        return 0, []
+    chars = atom_chars(atom_lines)
+    pdb_coords(chars, path)
+    try:
+        _pdb_field(chars, 22, 26).astype(int)
+    except ValueError:
+        raise ValueError('Invalid atom record in PDB-file %s' % path)
+    chains = _blank(_text(_pdb_field(chars, 21, 22)))
+    unique, first = np.unique(chains, return_index=True)
+    return len(atom_lines), list(unique[np.argsort(first)])
+
+
+def scan_residues(path):
+    '''IN: path of a PDB-file
+    OUT: chain IDs, residue numbers and residue names of the standard
+    residues (ATOM-records) of the first model, in the order of the
+    residues of the Structure (fast: without building the structure)'''
+    atom_lines = []
+    model_open, models = False, 0
+    with open_file(path) as infile:
+        for line in infile:
+            record = line[:6]
+            if record == b'MODEL ' or (record in ATOM_RECORDS and
+                                       not model_open):
+                model_open, models = True, models + 1
+                if models > 1:  # only the first model is used
+                    break
+            elif record == b'ENDMDL':
+                model_open = False
+            if record == b'ATOM  ':
+                atom_lines.append(line.rstrip(b'\r\n'))
+    if not atom_lines:
+        return (np.zeros(0, dtype=str), np.zeros(0, dtype=int),
+                np.zeros(0, dtype=str))
+    chars = atom_chars(atom_lines)
+    chain = _blank(_text(_pdb_field(chars, 21, 22)))
+    try:
+        res_number = _pdb_field(chars, 22, 26).astype(int)
+    except ValueError:
+        raise ValueError('Invalid atom record in PDB-file %s' % path)
+    # residues as in build_structure: in order of the chains, then of the
+    # residues within their chain (first appearance)
+    chain_rank, _ = _first_appearance(chain)
+    _, first = _first_appearance(_group(chain_rank, res_number,
+                                        _pdb_field(chars, 26, 27)))
+    first = first[np.lexsort((first, chain_rank[first]))]
+    return (chain[first], res_number[first],
+            _text(_pdb_field(chars, 17, 20))[first])
+
+
+def read_pdb(path):
+    '''IN: path of a PDB-file
+    OUT: atom columns (see build_structure)'''
+    with open_file(path) as infile:
+        lines = infile.read().splitlines()
+    if any([line[:6] in (b'MODEL ', b'ENDMDL') for line in lines]):
+        # models: a MODEL record opens a new model, as does an atom record
+        # after ENDMDL (as Bio.PDB)
+        atom_lines, models = [], []
+        model, model_open = -1, False
+        for line in lines:
+            if line[:6] in ATOM_RECORDS:
+                if not model_open:
+                    model, model_open = model + 1, True
+                atom_lines.append(line)
+                models.append(model)
+            elif line[:6] == b'MODEL ':
+                model, model_open = model + 1, True
+            elif line[:6] == b'ENDMDL':
+                model_open = False
+        models = np.array(models, dtype=int)
+    else:
+        atom_lines = [line for line in lines if line[:6] in ATOM_RECORDS]
+        models = np.zeros(len(atom_lines), dtype=int)
+    return pdb_columns(atom_lines, models, path)
+
+
+def pdb_columns(atom_lines, models, path=''):
+    '''IN: atom records (bytes), model index of every record, path of the
+    file (for errors)
+    OUT: atom columns (see build_structure)'''
+    chars = atom_chars(atom_lines)
+    fullname = _text(_pdb_field(chars, 12, 16))
+    atom_name = np.char.strip(fullname)
+    inner_space = np.char.find(atom_name, ' ') >= 0  # e.g. ' N B'
+    atom_name = np.where(inner_space, fullname, atom_name)
+    element = _assign_elements(_text(np.char.upper(np.char.strip(
+        _pdb_field(chars, 76, 78)))), atom_name, fullname)
+    occupancy = np.char.strip(_pdb_field(chars, 54, 60))
+    occupancy = np.where(occupancy == b'', b'nan', occupancy).astype('f8')
+    coords = pdb_coords(chars, path)
+    try:
+        res_number = _pdb_field(chars, 22, 26).astype(int)
+        bfactor = np.char.strip(_pdb_field(chars, 60, 66))
+        bfactor = np.where(bfactor == b'', b'0', bfactor).astype('f8')
+    except ValueError:
+        raise ValueError('Invalid atom record in PDB-file %s' % path)
+    return {'record': _text(_pdb_field(chars, 0, 6)),
+            'atom_name': atom_name,
+            'altloc': _blank(_text(_pdb_field(chars, 16, 17))),
+            'res_name': _text(_pdb_field(chars, 17, 20)),
+            'chain': _blank(_text(_pdb_field(chars, 21, 22))),
+            'res_number': res_number,
+            'icode': _blank(_text(_pdb_field(chars, 26, 27))),
+            'coords': coords,
+            'occupancy': occupancy,
+            'bfactor': bfactor,
+            'element': element,
+            'model': models}
+
+
+def _blank(values):
+    '''single characters: empty (end of a short line) -> blank'''
+    return np.where(values == '', ' ', values)
+
+
+def _cif_tokens(lines):
+    '''IN: lines of the data of an mmCIF loop
+    OUT: list of values (quotes removed)'''
+    tokens = []
+    text = None  # multi-line text field (between lines starting with ';')
+    for line in lines:
+        if text is not None:
+            if line.startswith(';'):
+                tokens.append('\n'.join(text))
+                text = None
+                tokens.extend(_cif_line_tokens(line[1:]))
+            else:
+                text.append(line)
+        elif line.startswith(';'):
+            text = [line[1:]]
+        else:
+            tokens.extend(_cif_line_tokens(line))
+    return tokens
+
+
+def _cif_line_tokens(line):
+    if "'" not in line and '"' not in line:
+        return line.split()
+    return [token[1:-1] if token[:1] in ('"', "'") and len(token) > 1 and
+            token[-1:] == token[:1] else token
+            for token in CIF_TOKEN.findall(line)]
+
+
+def read_mmcif(path):
+    '''IN: path of an mmCIF-file
+    OUT: atom columns (see build_structure)'''
+    with open_file(path) as infile:
+        text = infile.read()
+    if not isinstance(text, str):  # python 3
+        text = text.decode('ascii', 'replace')
+    lines = text.splitlines()
+    keys, data = [], []
+    i = 0
+    while i < len(lines):  # find the loop of the atom records
+        if lines[i].strip() == 'loop_' and i + 1 < len(lines) and \
+                lines[i + 1].startswith('_atom_site.'):
+            i += 1
+            while i < len(lines) and lines[i].startswith('_atom_site.'):
+                keys.append(lines[i].split()[0][len('_atom_site.'):])
+                i += 1
+            while i < len(lines) and not (lines[i].startswith('_') or
+                                          lines[i].startswith('loop_') or
+                                          lines[i].startswith('#') or
+                                          lines[i].startswith('data_')):
+                data.append(lines[i])
+                i += 1
+            break
+        i += 1
+    tokens = _cif_tokens(data)
+    if not keys or len(tokens) % len(keys) != 0:
+        raise ValueError('No valid atom records in mmCIF-file %s' % path)
+    table = np.array(tokens, dtype=str).reshape(-1, len(keys))
+
+    def column(*names, **kwargs):
+        '''first of the given columns present; default for missing values'''
+        for name in names:
+            if name in keys:
+                values = table[:, keys.index(name)]
+                if 'default' in kwargs:
+                    missing = np.isin(values, CIF_MISSING)
+                    values = np.where(missing, kwargs['default'], values)
+                return values
+        return np.array([kwargs.get('default', '')] * len(table))
+
+    atom_name = column('label_atom_id', 'auth_atom_id')
+    element = _assign_elements(np.char.upper(column('type_symbol',
+                                                    default='')),
+                               atom_name, atom_name)
+    model, _ = _first_appearance(column('pdbx_PDB_model_num', default='1'))
+    try:
+        coords = np.column_stack([column(axis).astype('f8') for axis in
+                                  ('Cartn_x', 'Cartn_y', 'Cartn_z')])
+        res_number = column('auth_seq_id', 'label_seq_id').astype(int)
+        occupancy = column('occupancy', default='nan').astype('f8')
+        bfactor = column('B_iso_or_equiv', default='0').astype('f8')
+    except ValueError:
+        raise ValueError('Invalid atom record in mmCIF-file %s' % path)
+    return {'record': np.char.ljust(column('group_PDB', default='ATOM'), 6),
+            'atom_name': atom_name,
+            'altloc': column('label_alt_id', default=' '),
+            'res_name': column('label_comp_id', 'auth_comp_id'),
+            'chain': column('auth_asym_id', 'label_asym_id'),
+            'res_number': res_number,
+            'icode': column('pdbx_PDB_ins_code', default=' '),
+            'coords': coords.astype('f4').reshape(-1, 3),
+            'occupancy': occupancy,
+            'bfactor': bfactor,
+            'element': element,
+            'model': model}
+
+
+def from_biopython(struct):
+    '''IN: structure (Bio.PDB object)
+    OUT: Structure'''
+    model_index = dict([(model.get_id(), i) for i, model in
+                        enumerate(struct.get_list())])
+    atoms = dict([(field, []) for field in ['coords', 'atom_name', 'element',
+                                            'altloc', 'occupancy', 'bfactor',
+                                            'res_index', 'atom_row']])
+    alternates = dict([(field, []) for field in ['alt_coords', 'alt_name',
+                                                 'alt_altloc',
+                                                 'alt_occupancy',
+                                                 'alt_bfactor', 'alt_element',
+                                                 'alt_res_index', 'alt_row']])
+    row = 0  # locations numbered in order of the iteration
+    residues = dict([(field, []) for field in ['res_model', 'res_chain',
+                                               'res_hetero', 'res_number',
+                                               'res_icode', 'res_name']])
+    for i, res in enumerate(struct.get_residues()):
+        chain = res.get_parent()
+        residues['res_model'].append(model_index[chain.get_parent().get_id()])
+        residues['res_chain'].append(chain.get_id())
+        residues['res_hetero'].append(res.id[0])
+        residues['res_number'].append(res.id[1])
+        residues['res_icode'].append(res.id[2])
+        residues['res_name'].append(res.resname)
+        for atom in res:
+            occupancy = atom.get_occupancy()
+            atoms['coords'].append(atom.get_coord())
+            atoms['atom_name'].append(atom.get_name())
+            atoms['element'].append(atom.element)
+            atoms['altloc'].append(atom.get_altloc())
+            atoms['occupancy'].append(np.nan if occupancy is None else
+                                      occupancy)
+            atoms['bfactor'].append(atom.get_bfactor())
+            atoms['res_index'].append(i)
+            atoms['atom_row'].append(row)
+            row += 1
+            if atom.is_disordered():
+                for location in atom.disordered_get_list():
+                    if location is atom.selected_child:
+                        continue
+                    occupancy = location.get_occupancy()
+                    alternates['alt_coords'].append(location.get_coord())
+                    alternates['alt_name'].append(location.get_name())
+                    alternates['alt_altloc'].append(location.get_altloc())
+                    alternates['alt_occupancy'].append(
+                        np.nan if occupancy is None else occupancy)
+                    alternates['alt_bfactor'].append(location.get_bfactor())
+                    alternates['alt_element'].append(location.element)
+                    alternates['alt_res_index'].append(i)
+                    alternates['alt_row'].append(row)
+                    row += 1
+    for fields in (atoms, residues, alternates):
+        for field in fields:
+            if field.endswith('coords'):
+                fields[field] = np.array(fields[field], dtype='f4').reshape(
+                    -1, 3)
+            elif field.endswith('index') or field.endswith('row') or \
+                    field in ('res_model', 'res_number'):
+                fields[field] = np.array(fields[field], dtype=int)
+            elif field.endswith('occupancy') or field.endswith('bfactor'):
+                fields[field] = np.array(fields[field], dtype='f8')
+            else:
+                fields[field] = np.array(fields[field], dtype=str)
+    return Structure(struct.get_id(), atoms, residues, alternates)
+
+
+def pdb_atom_name(name, element):
+    '''atom name in the columns 13-16 of an atom record (as Bio.PDB.PDBIO,
+    e.g. 'CA' of a carbon atom -> ' CA ', of a calcium atom -> 'CA  ')'''
+    if len(name) < 4 and name[:1].isalpha() and len(element) < 2:
+        name = ' ' + name
+    return name
+
+
+def pdb_records(structure):
+    '''IN: Structure (e.g. a chain of one model, see select_chain)
+    OUT: atom records of all locations of all atoms (without line ends, in
+    the format of Bio.PDB.PDBIO: residues in order, all locations of an atom
+    after each other, atoms numbered from 1). The locations of an atom are
+    ordered by occupancy (highest first); ties are broken by the altloc
+    (blank, then A, B, ...) and then by the order in the file;
+    boolean array: True for the records of standard residues (ATOM-records)
+    without hydrogen atoms'''
+    if max([len(chain) for chain in set(structure.res_chain)] or [1]) > 1:
+        raise ValueError('%s: chain IDs of more than one character cannot be '
+                         'written to a PDB-file' % structure.name)
+    n = len(structure)
+    names, codes = np.unique(np.concatenate([structure.atom_name,
+                                             structure.alt_name]),
+                             return_inverse=True)
+    codes = codes.ravel()
+    keys = structure.res_index.astype(np.int64) * len(names) + codes[:n]
+    order = np.argsort(keys, kind='mergesort')
+    alt_keys = structure.alt_res_index.astype(np.int64) * len(names) + \
+        codes[n:]
+    alt_atom = order[np.searchsorted(keys[order], alt_keys)]
+    altloc = np.concatenate([structure.altloc, structure.alt_altloc])
+    occupancy = np.concatenate([structure.occupancy,
+                                structure.alt_occupancy])
+    locations = np.lexsort((
+        np.concatenate([structure.atom_row, structure.alt_row]),
+        [ord(code) for code in altloc],
+        -np.nan_to_num(occupancy),  # (no occupancy: as 0)
+        np.concatenate([np.arange(n), alt_atom])))
+    res_index = np.concatenate([structure.res_index,
+                                structure.alt_res_index])[locations]
+    coords = np.concatenate([structure.coords, structure.alt_coords])
+    fields = zip(res_index,
+                 np.concatenate([structure.atom_name,
+                                 structure.alt_name])[locations],
+                 altloc[locations], coords[locations].astype('f8'),
+                 occupancy[locations],
+                 np.concatenate([structure.bfactor,
+                                 structure.alt_bfactor])[locations],
+                 np.concatenate([structure.element,
+                                 structure.alt_element])[locations])
+    records = []
+    for number, (res, name, alt, (x, y, z), occupancy, bfactor,
+                 element) in enumerate(fields):
+        records.append((
+            '%s%5i %-4s%c%3s %c%4i%c   %8.3f%8.3f%8.3f%s%6.2f      %4s%2s'
+            % ('ATOM  ' if structure.res_hetero[res] == ' ' else 'HETATM',
+               number + 1, pdb_atom_name(name, element), alt,
+               structure.res_name[res], structure.res_chain[res],
+               structure.res_number[res], structure.res_icode[res], x, y, z,
+               ' ' * 6 if np.isnan(occupancy) else '%6.2f' % occupancy,
+               bfactor, '', element.rjust(2))).rstrip())
+    standard = (structure.res_hetero[res_index] == ' ') & \
+        (np.concatenate([structure.element,
+                         structure.alt_element])[locations] != 'H')
+    return records, standard
+
+
+def _extension(path):
+    '''extension of a (gzip-compressed) file (e.g. .cif of 1g16.cif.gz)'''
+    if path.endswith('.gz'):
+        path = path[:-len('.gz')]
+    return os.path.splitext(path)[1].lower()
+
+
+def is_mmcif(path):
+    '''True for files ending with .cif or .mmcif (optionally .gz)'''
+    return _extension(path) in MMCIF_EXTENSIONS
+
+
+def is_structure_file(path):
+    '''True for PDB- and mmCIF-files (ending with .pdb, .cif or .mmcif,
+    optionally .gz)'''
+    return _extension(path) in STRUCTURE_EXTENSIONS
+
+
+def load_structure(path, parser='native', name=None):
+    '''IN: path of a PDB- or mmCIF-file, parser ('native' or 'biopython'),
+    name of the structure (optional, default: filename)
+    OUT: Structure'''
+    if name is None:
+        name = os.path.basename(path)
+    if parser == 'biopython':
+        from Bio import PDB
+        if is_mmcif(path):
+            bio_parser = PDB.MMCIFParser()
+        else:
+            bio_parser = PDB.PDBParser()
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rt') as infile:
+                return from_biopython(bio_parser.get_structure(name, infile))
+        return from_biopython(bio_parser.get_structure(name, path))
+    if is_mmcif(path):
+        return build_structure(name, read_mmcif(path))
+    return build_structure(name, read_pdb(path))
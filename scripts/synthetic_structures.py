@@ -0,0 +1,155 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Generation of synthetic datasets for benchmarks (see 'benchmark.py'): PDB-
+files of single-chain structures with a given number of residues, together
+with the SIFTS-file and the reference alignment needed to run the analysis.
+
+The structures are not real proteins, but have a protein-like number of atoms
+per residue and atom density: the C-alpha atoms follow a random walk (3.8
+Angstrom steps) within a sphere of the volume of a protein of that size
+(about 135 cubic Angstrom per residue), and the other atoms of each residue
+are placed around its C-alpha atom. The walk avoids other C-alpha atoms
+closer than 4.5 Angstrom. Thus, the number of contacts per residue is similar
+to real structures (at 5 Angstrom, about 5 contacts per residue, as in the
+test data).
+
+OUTPUT (in the given directory):
+raw_pdb_files/  PDB-files (chain A, PDB-IDs 's000', 's001', ...)
+pdb_chain_pfam.csv  SIFTS-file: chain A of every structure contains the
+                    Pfam-domain PFAM_ID
+alignment.fa    reference alignment (all sequences without gaps)
+
+NOTE:
+The datasets are reproducible: the same arguments (including the seed) give
+the same files.
+------------------------------------------------------------------------------
+'''
+
+import os
+import numpy as np
+
+PFAM_ID = 'PF00000'
+CA_STEP = 3.8  # distance of consecutive C-alpha atoms (Angstrom)
+VOLUME_PER_RESIDUE = 135.0  # cubic Angstrom
+MIN_CA_DISTANCE = 4.5  # of residues which are not neighbours in sequence
+MAX_TRIES = 50  # random directions tried for each step of the C-alpha walk
+BACKBONE = ['N', 'C', 'O']
+SIDE_CHAIN_STEP = 0.6  # distance of consecutive side chain atoms (Angstrom)
+# heavy atoms of some amino acids (enough for a realistic mix of sizes)
+RESIDUE_ATOMS = {
+    'GLY': ['N', 'CA', 'C', 'O'],
+    'ALA': ['N', 'CA', 'C', 'O', 'CB'],
+    'SER': ['N', 'CA', 'C', 'O', 'CB', 'OG'],
+    'VAL': ['N', 'CA', 'C', 'O', 'CB', 'CG1', 'CG2'],
+    'ASP': ['N', 'CA', 'C', 'O', 'CB', 'CG', 'OD1', 'OD2'],
+    'LEU': ['N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2'],
+    'LYS': ['N', 'CA', 'C', 'O', 'CB', 'CG', 'CD', 'CE', 'NZ'],
+    'PHE': ['N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'CE1', 'CE2',
+            'CZ']}
+RESIDUE_NAMES = sorted(RESIDUE_ATOMS)
+ONE_LETTER = {'GLY': 'G', 'ALA': 'A', 'SER': 'S', 'VAL': 'V', 'ASP': 'D',
+              'LEU': 'L', 'LYS': 'K', 'PHE': 'F'}
+ID_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def pdb_id(index):
+    '''IN: number of the structure (0 to 46655)
+    OUT: PDB-ID of the synthetic structure (e.g. 's00a')'''
+    digits = ''
+    for i in range(3):
+        index, digit = divmod(index, len(ID_DIGITS))
+        digits = ID_DIGITS[digit] + digits
+    return 's' + digits
+
+
+def _unit_vectors(n, random_state):
+    vectors = random_state.normal(size=(n, 3))
+    return vectors / np.linalg.norm(vectors, axis=1)[:, np.newaxis]
+
+
+def ca_coordinates(n_residues, random_state):
+    '''IN: number of residues, numpy RandomState
+    OUT: coordinates of the C-alpha atoms (n_residues x 3)'''
+    radius = (3 * VOLUME_PER_RESIDUE * n_residues / (4 * np.pi)) ** (1 / 3.)
+    coords = np.zeros((n_residues, 3))
+    for i in range(1, n_residues):
+        distance = np.linalg.norm(coords[i - 1])
+        best, best_distance = None, -1
+        for step in _unit_vectors(MAX_TRIES, random_state):
+            if distance > radius:  # turn back towards the centre
+                step = step - 2 * coords[i - 1] / distance
+                step /= np.linalg.norm(step)
+            position = coords[i - 1] + CA_STEP * step
+            # distance to the C-alpha atoms of non-neighbouring residues
+            closest = np.sqrt(((coords[:max(i - 2, 0)] - position) ** 2).sum(
+                axis=1)).min() if i > 2 else np.inf
+            if closest > best_distance:
+                best, best_distance = position, closest
+            if closest >= MIN_CA_DISTANCE:
+                break
+        coords[i] = best
+    return coords
+
+
+def structure(n_residues, random_state):
+    '''IN: number of residues, numpy RandomState
+    OUT: list of residue names, list of atom names per residue, list of atom
+    coordinates per residue'''
+    names = [RESIDUE_NAMES[i] for i in
+             random_state.randint(len(RESIDUE_NAMES), size=n_residues)]
+    atoms = [RESIDUE_ATOMS[name] for name in names]
+    coords = []
+    for ca, residue_atoms in zip(ca_coordinates(n_residues, random_state),
+                                 atoms):
+        # side chain: away from the C-alpha atom in a random direction,
+        # backbone atoms: around the C-alpha atom on the other side
+        direction = _unit_vectors(1, random_state)[0]
+        offsets = np.zeros((len(residue_atoms), 3))
+        backbone = _unit_vectors(3, random_state) * 1.3 - 0.5 * direction
+        for j, atom_name in enumerate(residue_atoms):
+            if atom_name in BACKBONE:
+                offsets[j] = backbone[BACKBONE.index(atom_name)]
+            elif atom_name != 'CA':
+                offsets[j] = direction * (1.5 + SIDE_CHAIN_STEP * (j - 4))
+        coords.append(ca + offsets)
+    return names, atoms, coords
+
+
+def write_pdb(path, names, atoms, coords):
+    '''writes a structure (see structure) as PDB-file (chain A)'''
+    atom_number = 0
+    with open(path, 'w') as outfile:
+        for res_number, (name, residue_atoms, residue_coords) in enumerate(
+                zip(names, atoms, coords)):
+            for atom_name, (x, y, z) in zip(residue_atoms, residue_coords):
+                atom_number += 1
+                outfile.write('ATOM  %5i  %-3s %3s A%4i    %8.3f%8.3f%8.3f'
+                              '  1.00 20.00           %s\n'
+                              % (atom_number, atom_name, name, res_number + 1,
+                                 x, y, z, atom_name[0]))
+        outfile.write('TER\nEND\n')
+
+
+def write_dataset(directory, n_structures, n_residues, seed=0):
+    '''writes a synthetic dataset (see docstring) to the directory
+    IN: directory, number of structures, residues per structure, seed
+    OUT: list of PDB-IDs'''
+    random_state = np.random.RandomState(seed)
+    pdb_dir = os.path.join(directory, 'raw_pdb_files')
+    if not os.path.exists(pdb_dir):
+        os.makedirs(pdb_dir)
+    pdb_ids = [pdb_id(i) for i in range(n_structures)]
+    with open(os.path.join(directory, 'alignment.fa'), 'w') as alignment:
+        for structure_id in pdb_ids:
+            names, atoms, coords = structure(n_residues, random_state)
+            write_pdb(os.path.join(pdb_dir, structure_id + '.pdb'), names,
+                      atoms, coords)
+            alignment.write('>%s.pdb\n%s\n' % (structure_id, ''.join(
+                [ONE_LETTER[name] for name in names])))
+    with open(os.path.join(directory, 'pdb_chain_pfam.csv'), 'w') as sifts:
+        sifts.write('# synthetic dataset\nPDB,CHAIN,SP_PRIMARY,PFAM_ID,'
+                    'COVERAGE\n')
+        for structure_id in pdb_ids:
+            sifts.write('%s,A,P00000,%s,1.0\n' % (structure_id, PFAM_ID))
+    return pdb_ids
@@ -0,0 +1,203 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Residue contacts of ensembles of models: NMR ensembles and molecular dynamics
+trajectories saved as PDB-files with several models (MODEL/ENDMDL records).
+Used by 'calculate_networks.py' (option '--trajectory') and
+'contact_calculator.py'.
+
+The file is read one model (frame) at a time, so the memory requirement does
+not depend on the number of frames:
+- The topology (atoms and residues, see structure_io.Structure) is built once
+  from the first model. Every further model must contain the same atom
+  records in the same order; only its coordinates are read.
+- Atom pairs are found with a neighbour list (Verlet list): the pairs within
+  cutoff + skin are searched once (with a backend of 'contact_engine.py') and
+  reused for the following frames as long as no atom moved more than half the
+  skin. For these frames, only the distances of the listed pairs are
+  calculated. Thus, slowly changing frames (e.g. consecutive MD snapshots)
+  need only few neighbour searches; the result is the same as with a search
+  in every frame.
+- The contacts of every frame (as defined in 'contact_engine.py') are counted
+  per residue pair (see ContactOccupancy).
+
+OUTPUT (see trajectory_contacts):
+For every residue pair in contact in at least one frame: the number of frames
+with the contact and the minimal atomic distance over all frames. The
+occupancy of a contact is the fraction of frames with the contact.
+
+NOTE:
+Only PDB-files are read as trajectories (optionally gzip-compressed).
+------------------------------------------------------------------------------
+'''
+
+import os
+import numpy as np
+import contact_engine
+import metrics
+import structure_io
+
+DEFAULT_SKIN = 1.0  # Angstrom
+BATCH_FRAMES = 100  # contacts of this many frames are merged at once
+
+
+def read_models(path):
+    '''IN: path of a PDB-file
+    OUT: generator: atom records (bytes) of every model (a MODEL record or
+    an atom record after ENDMDL opens a new model, as in structure_io.py)'''
+    model, model_open = [], False
+    with structure_io.open_file(path) as infile:
+        for line in infile:
+            record = line[:6]
+            if record in structure_io.ATOM_RECORDS:
+                if not model_open and model:
+                    yield model
+                    model = []
+                model_open = True
+                model.append(line.rstrip(b'\r\n'))
+            elif record == b'MODEL ':
+                if model:
+                    yield model
+                    model = []
+                model_open = True
+            elif record == b'ENDMDL':
+                model_open = False
+    if model:
+        yield model
+
+
+def frames(path, name=None):
+    '''IN: path of a PDB-file with one or several models, name of the
+    structure (optional, default: filename)
+    OUT: generator: topology (Structure of the first model, the same object
+    for all frames) and coordinates of its atoms in every model'''
+    if structure_io.is_mmcif(path):
+        raise ValueError('%s: trajectories can only be read from PDB-files'
+                         % path)
+    topology = None
+    for n, atom_lines in enumerate(read_models(path)):
+        if topology is None:
+            columns = structure_io.pdb_columns(
+                atom_lines, np.zeros(len(atom_lines), dtype=int), path)
+            topology = structure_io.build_structure(
+                name or os.path.basename(path), columns)
+            rows = topology.atom_row
+            n_records = len(atom_lines)
+            # atom name, altloc, residue name, chain, residue number, icode
+            labels = structure_io.atom_chars(atom_lines)[rows, 12:27]
+            yield topology, topology.coords
+            continue
+        chars = structure_io.atom_chars(atom_lines) \
+            if len(atom_lines) == n_records else None
+        if chars is None or (chars[rows, 12:27] != labels).any():
+            raise ValueError('%s: model %s does not have the same atoms as '
+                             'the first model' % (path, n + 1))
+        yield topology, structure_io.pdb_coords(chars[rows], path)
+
+
+class NeighbourList(object):
+    '''Atom pairs within the cutoff for a sequence of frames of the same atoms
+    (Verlet list, see docstring)'''
+
+    def __init__(self, cutoff, skin=DEFAULT_SKIN, backend='grid'):
+        self.cutoff = cutoff
+        self.skin = skin
+        self.backend = backend
+        self.reference = None  # coordinates of the last neighbour search
+        self.i, self.j = None, None  # pairs within cutoff + skin
+        self.searches = 0
+
+    def _outdated(self, coords):
+        if self.reference is None or len(coords) != len(self.reference):
+            return True
+        if not len(coords):
+            return False
+        diff = coords - self.reference
+        return 2 * np.sqrt((diff * diff).sum(axis=1)).max() >= self.skin
+
+    def pairs(self, coords):
+        '''IN: atom coordinates of a frame
+        OUT: indices of all atom pairs (i < j) within the cutoff and
+        distances (as the backends of contact_engine.py)'''
+        if self._outdated(coords):
+            self.i, self.j, _ = contact_engine.BACKENDS[self.backend](
+                coords, self.cutoff + self.skin)
+            self.reference = coords.copy()
+            self.searches += 1
+        dist = contact_engine.pair_distances(coords, self.i, self.j)
+        keep = contact_engine.within_cutoff(dist, self.cutoff)
+        return self.i[keep], self.j[keep], dist[keep]
+
+
+class ContactOccupancy(object):
+    '''Number of frames in which every residue pair is in contact and its
+    minimal atomic distance over all frames. The contacts of the frames are
+    merged in batches: the memory requirement depends on the number of
+    distinct contacts, not on the number of frames.'''
+
+    def __init__(self, n_residues, batch=BATCH_FRAMES):
+        self.n_residues = n_residues
+        self.batch = batch
+        self.n_frames = 0
+        self.keys = np.zeros(0, dtype=np.int64)  # res_A * n_residues + res_B
+        self.frames = np.zeros(0, dtype=np.int32)
+        self.min_dist = np.zeros(0, dtype='f4')
+        self.pending = []  # contacts of frames which are not merged yet
+
+    def add(self, res_a, res_b, min_dist):
+        '''adds the contacts of a frame (see contact_engine.residue_pairs)'''
+        self.pending.append((res_a.astype(np.int64) * self.n_residues + res_b,
+                             min_dist))
+        self.n_frames += 1
+        if len(self.pending) >= self.batch:
+            self._merge()
+
+    def _merge(self):
+        if not self.pending:
+            return
+        frame_keys, frame_dist = zip(*self.pending)
+        keys = np.concatenate((self.keys,) + frame_keys)
+        counts = np.concatenate([self.frames] + [
+            np.ones(len(contacts), dtype=np.int32) for contacts in frame_keys])
+        dist = np.concatenate((self.min_dist,) + frame_dist)
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        inverse = inverse.ravel()
+        self.frames = np.bincount(inverse, weights=counts,
+                                  minlength=len(self.keys)).astype(np.int32)
+        self.min_dist = np.empty(len(self.keys), dtype='f4')
+        self.min_dist[:] = np.inf
+        np.minimum.at(self.min_dist, inverse, dist)
+        self.pending = []
+
+    def contacts(self):
+        '''OUT: residue indices A and B (starting at 0, sorted), number of
+        frames with the contact, minimal atomic distance'''
+        self._merge()
+        return (self.keys // self.n_residues, self.keys % self.n_residues,
+                self.frames, self.min_dist)
+
+
+def trajectory_contacts(path, cutoff, backend='grid', skin=DEFAULT_SKIN):
+    '''IN: path of a PDB-file with one or several models, distance cutoff,
+    neighbour search backend, skin of the neighbour list
+    OUT: residue indices A and B of all contacts in any frame (see
+    ContactOccupancy.contacts), number of frames with each contact, minimal
+    atomic distance of each contact, number of frames'''
+    neighbours = NeighbourList(cutoff, skin, backend)
+    occupancy = None
+    for topology, coords in frames(path):
+        if occupancy is None:
+            occupancy = ContactOccupancy(topology.n_residues)
+            ca = topology.atom_index('CA')
+            ca_coords = np.empty((topology.n_residues, 3), dtype='f4')
+            ca_coords[:] = np.nan
+        ca_coords[ca >= 0] = coords[ca[ca >= 0]]
+        i, j, dist = neighbours.pairs(coords)
+        occupancy.add(*contact_engine.residue_pairs(
+            i, j, dist, topology.res_index, ca_coords))
+    if occupancy is None:
+        raise ValueError('No atom records in %s' % path)
+    metrics.record(atoms=len(topology), residues=topology.n_residues,
+                   frames=occupancy.n_frames,
+                   neighbour_searches=neighbours.searches)
+    return occupancy.contacts() + (occupancy.n_frames,)
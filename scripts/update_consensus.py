@@ -0,0 +1,134 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Update of a consensus residue contact network when structures are added to or
+removed from the dataset, without calculating the whole consensus network
+again. The consensus state (contacts of every structure and contact counts,
+see 'consensus.py') is written by 'calculate_consensus_network.py' with the
+option '--state' or created by the first 'add'.
+
+USAGE:
+add: adds the structures of raw networks and mapping (e.g. calculated only
+for the new structures with 'calculate_networks.py' and 'map_networks.py').
+Structures already in the state are replaced.
+python update_consensus.py add state.npz results/raw_networks.csv \
+    results/mapping.csv
+remove: removes structures (PDB-IDs) from the state
+python update_consensus.py remove state.npz 1g16 2bme
+write: writes the consensus network(s) of the state to the directory
+'results' (as 'calculate_consensus_network.py')
+python update_consensus.py write state.npz
+
+OUTPUT:
+add and remove update the state file; write writes 'consensus_network' (and
+'consensus_network_<cutoff>' if the state has several cutoffs).
+
+NOTE:
+An update neither reads nor maps the networks of the other structures, but
+it is not independent of the size of the dataset: the whole state file is
+read and written, and the count matrices are updated as a whole (time
+proportional to the number of counted pairs of alignment positions, see
+'consensus.py'). 'conservation' is always relative to the number of
+structures in the state.
+------------------------------------------------------------------------------
+'''
+
+import argparse
+import os
+import sys
+import consensus
+import metrics
+import network_io
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--metrics', default=None, help='Append wall time, '
+                        'CPU time and peak memory of the update to this file '
+                        '(json-lines, see metrics.py). Default: no metrics')
+    subparsers = parser.add_subparsers(dest='command')
+    add_parser = subparsers.add_parser('add', help='Add (or replace) '
+                                       'structures')
+    add_parser.add_argument('state', help='Consensus state file (npz, created '
+                            'if it does not exist)')
+    add_parser.add_argument('raw_networks', help='Residue contact networks '
+                            '(csv- or feather-file written by '
+                            'calculate_networks.py)')
+    add_parser.add_argument('mapping', help='Mapping of residues to alignment '
+                            'positions (csv- or feather-file written by '
+                            'map_networks.py)')
+    add_parser.add_argument('--pdb-ids', nargs='+', default=None,
+                            help='Add only these structures. Default: all '
+                            'structures of the networks')
+    add_parser.add_argument('--cutoffs', nargs='+', type=float, default=None,
+                            help='Distance cutoffs of a new state (see '
+                            'calculate_consensus_network.py). Default: all '
+                            'contacts')
+    remove_parser = subparsers.add_parser('remove', help='Remove structures')
+    remove_parser.add_argument('state', help='Consensus state file (npz)')
+    remove_parser.add_argument('pdb_ids', nargs='+', help='PDB-IDs of the '
+                               'structures to remove')
+    write_parser = subparsers.add_parser('write', help='Write the consensus '
+                                         'network(s)')
+    write_parser.add_argument('state', help='Consensus state file (npz)')
+    write_parser.add_argument('--format', choices=['csv', 'feather'],
+                              default='csv', help='File format of the '
+                              'output files in the directory "results": csv '
+                              'or feather (binary, requires pyarrow). '
+                              'Default: csv')
+    try:
+        args = parser.parse_args(argv)
+    except:
+        parser.print_help()
+        sys.exit(1)
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    run = metrics.StageMetrics('update_consensus_%s' % args.command,
+                               args.metrics)
+
+    if args.command == 'add':
+        if os.path.exists(args.state):
+            state = consensus.load_state(args.state)
+        else:
+            state = consensus.ConsensusState(args.cutoffs)
+        nw = network_io.read_table(args.raw_networks)
+        mapping = network_io.read_table(args.mapping)
+        if args.pdb_ids is not None:
+            nw = nw[nw.pdb_id.astype(str).isin(args.pdb_ids)]
+        nw = consensus.map_networks(nw, mapping)
+        try:
+            added = state.add_networks(nw)
+        except ValueError as error:
+            sys.exit(str(error))
+        state.set_reference(consensus.reference_positions(mapping))
+        state.save(args.state)
+        print('%s structures added: %s' % (len(added), ' '.join(added)))
+
+    elif args.command == 'remove':
+        state = consensus.load_state(args.state)
+        for pdb_id in args.pdb_ids:
+            if not state.remove(pdb_id):
+                print('%s: ignored - not in the consensus state' % pdb_id)
+        state.save(args.state)
+
+    else:
+        state = consensus.load_state(args.state)
+        consensus.write_consensus(state.consensus(),
+                                  consensus.consensus_names(state.cutoffs),
+                                  'results', args.format)
+        print('Consensus network of %s structures written.'
+              % state.n_structures)
+
+    print('Consensus state: %s structures' % len(state))
+    run.add(structures=len(state))
+    run.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+'''
+------------------------------------------------------------------------------
+PURPOSE:
+Parallel execution of per-structure work in a pool of worker processes. Used
+by all scripts which process the PDB-files one by one.
+
+The structures are independent of each other. They are sent to the worker
+processes in chunks (to keep the overhead per task low for large numbers of
+small files) and the results are returned in the order of the input, no
+matter how many worker processes are used. The chunks are submitted with
+multiprocessing.Pool.apply_async (not Pool.imap, which submits all chunks at
+once): at most CHUNKS_AHEAD chunks per worker are pending at any time, and
+the next chunk is submitted when the results of the oldest one have been
+consumed. Worker functions should return
+compact results (numbers, strings, numpy arrays) rather than Bio.PDB objects,
+as all results are sent back to the main process.
+
+With the option '--keep-going' (see guard), a structure which raises an
+error is reported (and written to FAILED_LOG) instead of stopping the script,
+so that one bad file does not abort a long run.
+
+NOTE:
+Worker functions have to be defined at the top level of a module (or script)
+so that they can be sent to the worker processes.
+------------------------------------------------------------------------------
+'''
+
+import collections
+import math
+import multiprocessing
+import os
+
+CHUNKS_PER_WORKER = 4  # default: each worker gets about 4 chunks of items
+CHUNKS_AHEAD = 2  # chunks per worker sent ahead of the consumed results
+WAIT_TIMEOUT = 1e9  # seconds
+FAILED_LOG = 'results/failed_structures.tsv'  # stage, item, error
+
+
+def add_jobs_arguments(parser):
+    '''adds the options --jobs and --chunksize to an argparse parser'''
+    parser.add_argument('--jobs', type=int, default=1, help='Number of '
+                        'worker processes (0: one per CPU). Default: 1')
+    parser.add_argument('--chunksize', type=int, default=None, help='Number '
+                        'of structures sent to a worker process at once. '
+                        'By default, it is chosen according to the number '
+                        'of structures and worker processes.')
+
+
+def add_keep_going_argument(parser):
+    '''adds the option --keep-going to an argparse parser'''
+    parser.add_argument('--keep-going', action='store_true', help='Skip '
+                        'structures which cannot be processed (they are '
+                        'listed in %s) instead of stopping. Default: stop at '
+                        'the first error' % FAILED_LOG)
+
+
+def n_workers(jobs):
+    '''number of worker processes (jobs < 1: one per CPU)'''
+    if jobs < 1:
+        return multiprocessing.cpu_count()
+    return jobs
+
+
+def default_chunksize(n_items, jobs):
+    '''chunk size giving each worker process a few chunks of items'''
+    return max(1, int(math.ceil(n_items / float(jobs * CHUNKS_PER_WORKER))))
+
+
+def _run_chunk(func, chunk):
+    '''executed in the worker processes: func applied to a chunk of items'''
+    return [func(item) for item in chunk]
+
+
+def parallel_map(func, items, jobs=1, chunksize=None):
+    '''IN: function, items (e.g. filenames), number of worker processes,
+    number of items per task (optional)
+    OUT: iterator over the results of func(item) in the order of the items'''
+    items = list(items)
+    jobs = min(n_workers(jobs), len(items))
+    if jobs <= 1:  # no need for worker processes
+        for item in items:
+            yield func(item)
+        return
+    if chunksize is None:
+        chunksize = default_chunksize(len(items), jobs)
+    chunks = [items[i:i + chunksize] for i in range(0, len(items), chunksize)]
+    pool = multiprocessing.Pool(jobs)
+    # Only a few chunks are sent to the workers ahead of the results
+    # consumed: finished results do not pile up in memory, and if the
+    # iteration stops early, only these chunks have to be waited for.
+    pending = collections.deque()
+    next_chunk = 0
+    try:
+        while pending or next_chunk < len(chunks):
+            while next_chunk < len(chunks) and \
+                    len(pending) < jobs * CHUNKS_AHEAD:
+                pending.append(pool.apply_async(_run_chunk,
+                                                (func, chunks[next_chunk])))
+                next_chunk += 1
+            # (with a timeout, waiting can be interrupted with Ctrl-C)
+            for result in pending.popleft().get(WAIT_TIMEOUT):
+                yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
+class Failure(object):
+    '''result of a guarded function which raised an error (see guard)'''
+
+    def __init__(self, item, message):
+        self.item = item
+        self.message = message
+
+
+class _Guarded(object):
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, item):
+        try:
+            return self.func(item)
+        except Exception as error:
+            return Failure(item, '%s: %s' % (error.__class__.__name__, error))
+
+
+def guard(func, keep_going=True):
+    '''IN: function, True if errors should not stop the script
+    OUT: function returning a Failure instead of raising an error (func
+    itself if keep_going is False)'''
+    return _Guarded(func) if keep_going else func
+
+
+def failed(result, stage, log_path=FAILED_LOG):
+    '''IN: result of a guarded function, name of the stage, log file
+    OUT: True if the result is a Failure (printed and written to the log)'''
+    if not isinstance(result, Failure):
+        return False
+    print('%s: skipped - %s' % (result.item, result.message))
+    directory = os.path.dirname(log_path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(log_path, 'a') as log:
+        log.write('%s\t%s\t%s\n' % (stage, result.item,
+                                     ' '.join(result.message.split())))
+    return True